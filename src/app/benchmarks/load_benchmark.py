@@ -0,0 +1,83 @@
+"""Compares the load times of a model without snapshot (cold), from a snapshot which is not in the page cache
+(snapshot) and from a snapshot which was loaded before (warm).
+
+Usage:
+    python -m src.app.benchmarks.load_benchmark --model TinyLlama/TinyLlama-1.1B-Chat-v1.0 --torch-dtype torch.bfloat16
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import torch
+
+from src.app.wrapper.llm_model import STATUS_READY, LLMModel
+
+
+def evict_from_page_cache(directory:str):
+    """Advises the kernel to drop the cached pages of the files, so the next load has to read them from disk."""
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for root, _, files in os.walk(directory):
+        for name in files:
+            fd = os.open(os.path.join(root, name), os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+    return True
+
+
+def measure_load(modeltyp:str, model:str, deployment_config:dict, snapshot_config:dict):
+    """Loads the model once and returns the duration of every loading phase."""
+    llm = LLMModel(modeltyp=modeltyp, model=model, prompting_config={"max_new_tokens": 1, "do_sample": False},
+                   deployment_config=dict(deployment_config), snapshot_config=snapshot_config, uses_chat_template=False)
+    start_time = time.time()
+    llm.download_model()
+    total = time.time() - start_time
+    result = {
+        "status": llm.status,
+        "loaded_from_snapshot": llm.loaded_from_snapshot,
+        "total_s": round(total, 3),
+        "phases_s": {phase: round(duration, 3) for phase, duration in llm.load_timings.items()},
+    }
+    if llm.status == STATUS_READY:
+        llm.shutdown()
+    return result
+
+
+def run_benchmark(modeltyp:str, model:str, deployment_config:dict, snapshot_directory:str):
+    snapshot_config = {"directory": snapshot_directory}
+    results = {"cold": measure_load(modeltyp, model, deployment_config, {})}
+    # stores the snapshot, its duration is part of the one time cost of the snapshot
+    results["snapshot_creation"] = measure_load(modeltyp, model, deployment_config, snapshot_config)
+    page_cache_evicted = evict_from_page_cache(snapshot_directory)
+    results["snapshot"] = measure_load(modeltyp, model, deployment_config, snapshot_config)
+    results["snapshot"]["page_cache_evicted"] = page_cache_evicted
+    results["warm"] = measure_load(modeltyp, model, deployment_config, snapshot_config)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", required=True, help="hugging face model or local path")
+    parser.add_argument("--modeltyp", default="text-generation")
+    parser.add_argument("--torch-dtype", default=None, help="e.g. torch.bfloat16")
+    parser.add_argument("--snapshot-dir", default=None, help="directory of the snapshot store, defaults to a temporary directory")
+    args = parser.parse_args()
+
+    deployment_config = {}
+    if args.torch_dtype:
+        deployment_config["torch_dtype"] = getattr(torch, args.torch_dtype.replace("torch.", ""))
+
+    if args.snapshot_dir:
+        results = run_benchmark(args.modeltyp, args.model, deployment_config, args.snapshot_dir)
+    else:
+        with tempfile.TemporaryDirectory() as snapshot_directory:
+            results = run_benchmark(args.modeltyp, args.model, deployment_config, snapshot_directory)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Measures the time the log calls of one prompt add to the request path and the bytes they write, with the
+previous setup (synchronous file handler at DEBUG, full question and answer at INFO, powerstat output printed)
+and with the queue based json logging of src.app.logs.logging_setup.
+
+Usage:
+    python -m src.app.benchmarks.logging_benchmark --requests 20000
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+from src.app.logs.logging_setup import configure_logging, shutdown_logging
+
+QUESTION = "Explain in one sentence what a CPU does. " * 4
+ANSWER = "A CPU executes the instructions of programs by fetching, decoding and running them one after another. " * 4
+# size of the summary powerstat prints for a short measurement
+POWERSTAT_OUTPUT = "  Time    User  Nice   Sys  Idle    IO  Run Ctxt/s  IRQ/s  Watts\n" + "12:00:00   3.1   0.0   0.9  96.0   0.0    1   1200    800   4.20\n" * 20
+
+
+def synchronous_request(logger, stdout):
+    """the log calls of one prompt before: every call writes to the file, the sci measurement prints"""
+    logger.info("Manager: request process_prompt")
+    logger.info("Wrapper: task is being executed...")
+    logger.info(f"Scheduler: processing batch of {1} prompts")
+    print("Messung mit powerstat gestartet...", file=stdout)
+    print("Messung beenden...", file=stdout)
+    print(POWERSTAT_OUTPUT, file=stdout)
+    print(4.2, file=stdout)
+    print("Messung beendet.", file=stdout)
+    logger.info(f"Scheduler: batch of {1} prompts took {120.0:.0f} ms, {40.0:.2f} tokens/s")
+    logger.info(f"Answer: {ANSWER} - Question: {QUESTION}")
+
+
+def queued_request(logger, stdout):
+    """the log calls of one prompt now: debug records are lazy, payload records are sampled"""
+    logger.debug("Manager: request process_prompt")
+    logger.debug("Wrapper: task is being executed...")
+    logger.debug("Scheduler: processing batch of %d prompts", 1)
+    logger.debug("SCI: Messung mit powerstat gestartet")
+    logger.debug("SCI: Messung beenden")
+    logger.info("SCI: powerstat Ausgabe", extra={"payload": True, "powerstat_output": POWERSTAT_OUTPUT})
+    logger.debug("SCI: %s Watt", 4.2)
+    logger.debug("SCI: Messung beendet, SCI-Score %s", 0.001)
+    logger.debug("Scheduler: batch of %d prompts took %.0f ms, %.2f tokens/s", 1, 120.0, 40.0)
+    logger.info("Wrapper: answered question", extra={"payload": True, "question": QUESTION, "answer": ANSWER})
+
+
+def measure(name:str, directory:str, requests:int, setup, request, teardown):
+    log_file = os.path.join(directory, f"{name}.log")
+    stdout_file = os.path.join(directory, f"{name}.out")
+    with open(stdout_file, "w") as stdout:
+        handler = setup(log_file)
+        logger = logging.getLogger("benchmark")
+        durations_us = []
+        start_time = time.perf_counter()
+        for _ in range(requests):
+            request_start = time.perf_counter()
+            request(logger, stdout)
+            durations_us.append((time.perf_counter() - request_start) * 1e6)
+        hot_path_s = time.perf_counter() - start_time
+        teardown()
+    dropped = getattr(handler, "dropped", 0)
+    written = sum(os.path.getsize(os.path.join(directory, file)) for file in os.listdir(directory) if file.startswith(name))
+    durations_us.sort()
+    return {
+        "mean_us": round(statistics.mean(durations_us), 2),
+        "p50_us": round(durations_us[len(durations_us) // 2], 2),
+        "p99_us": round(durations_us[int(len(durations_us) * 0.99)], 2),
+        "hot_path_s": round(hot_path_s, 3),
+        "bytes_per_request": round(written / requests, 1),
+        "dropped_records": dropped,
+    }
+
+
+def synchronous_setup(log_file:str):
+    shutdown_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.FileHandler(log_file, mode="w")
+    handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(logging.DEBUG)
+    return handler
+
+
+def synchronous_teardown():
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+
+def run_benchmark(requests:int, payload_sample_rate:float):
+    with tempfile.TemporaryDirectory() as directory:
+        results = {
+            "synchronous": measure("synchronous", directory, requests, synchronous_setup, synchronous_request, synchronous_teardown),
+            "queued": measure("queued", directory, requests,
+                              lambda log_file: configure_logging(log_file=log_file, level="INFO", levels={}, payload_sample_rate=payload_sample_rate),
+                              queued_request, shutdown_logging),
+            # every record at DEBUG without sampling: without inference between the prompts the writer falls behind,
+            # the records which do not fit into the queue are dropped instead of blocking the request
+            "queued_debug": measure("queued_debug", directory, requests,
+                                    lambda log_file: configure_logging(log_file=log_file, level="DEBUG", levels={}, payload_sample_rate=1),
+                                    queued_request, shutdown_logging),
+        }
+    results["speedup"] = round(results["synchronous"]["mean_us"] / results["queued"]["mean_us"], 2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--payload-sample-rate", type=float, default=0.01)
+    args = parser.parse_args()
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        results = run_benchmark(args.requests, args.payload_sample_rate)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Compares a model with dynamic int8 quantization against the original model on a fixed prompt set.
+Reports the latency, the memory of the loaded model, the energy per generated token (from the energy sampler of src.app.sci.energy_sampler)
+and how often the quantized model gives the same answer as the original model.
+
+Every variant is loaded in its own process, so the memory of one variant does not distort the other.
+
+Usage:
+    python -m src.app.benchmarks.quantization_benchmark --model TinyLlama/TinyLlama-1.1B-Chat-v1.0 --uses-chat-template
+"""
+import argparse
+import json
+import multiprocessing
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import psutil
+import torch
+
+from src.app.sci.sci_score import end_calc_sci_score, start_calc_sci_score
+from src.app.wrapper.llm_model import (QUANTIZATION_DYNAMIC_INT8,
+                                       STATUS_READY, LLMModel)
+
+PROMPTS = [
+    "What's the capital of Germany?",
+    "Whats 17 + 25?",
+    "Name three primary colors.",
+    "Explain in one sentence what a CPU does.",
+    "Translate 'good morning' to French.",
+    "What is the boiling point of water in degrees Celsius?",
+    "Write a haiku about autumn.",
+    "Which planet is the largest in our solar system?",
+]
+
+
+def measure_variant(modeltyp:str, model:str, deployment_config:dict, uses_chat_template:bool, max_new_tokens:int, prompts:list):
+    """Loads the model with the deployment config, answers the prompts one after another and returns the measurements."""
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    llm = LLMModel(modeltyp=modeltyp, model=model, prompting_config={"max_new_tokens": max_new_tokens, "do_sample": False},
+                   deployment_config=deployment_config, uses_chat_template=uses_chat_template)
+    llm.download_model()
+    if llm.status != STATUS_READY:
+        return {"status": llm.status, "error": llm.last_error}
+    memory_bytes = process.memory_info().rss - rss_before
+
+    energy = {}
+    measurement = start_calc_sci_score()
+
+    latencies_ms = []
+    answers = []
+    start_time = time.time()
+    for prompt in prompts:
+        prompt_start = time.time()
+        answers.append(llm.answer_question(prompt))
+        latencies_ms.append((time.time() - prompt_start) * 1000)
+    duration_ms = (time.time() - start_time) * 1000
+    completion_tokens = sum(answer.completion_tokens for answer in answers)
+
+    try:
+        end_calc_sci_score(measurement, max(completion_tokens, 1), energy_callback=lambda joules: energy.update(joules=joules))
+    except RuntimeError:
+        pass
+    llm.shutdown()
+
+    return {
+        "status": STATUS_READY,
+        "load_s": round(sum(llm.load_timings.values()), 3),
+        "memory_mb": round(memory_bytes / 1e6, 1),
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies_ms), 1),
+            "p50": round(statistics.median(latencies_ms), 1),
+            "max": round(max(latencies_ms), 1),
+        },
+        "completion_tokens": completion_tokens,
+        "tokens_per_second": round(completion_tokens / (duration_ms / 1000), 2) if duration_ms > 0 else None,
+        "energy_j": energy.get("joules"),
+        "energy_per_token_j": energy["joules"] / completion_tokens if "joules" in energy and completion_tokens else None,
+        "answers": [answer.text for answer in answers],
+    }
+
+
+def agreement(reference:list, candidate:list):
+    """Compares the answers of two variants, the prefix agreement is the share of words up to the first difference."""
+    exact = sum(1 for a, b in zip(reference, candidate) if a.strip() == b.strip())
+    prefix_shares = []
+    for a, b in zip(reference, candidate):
+        a_words, b_words = a.split(), b.split()
+        common = 0
+        for a_word, b_word in zip(a_words, b_words):
+            if a_word != b_word:
+                break
+            common += 1
+        prefix_shares.append(common / max(len(a_words), len(b_words), 1))
+    return {
+        "exact_match_rate": exact / len(reference) if reference else None,
+        "prefix_agreement": statistics.mean(prefix_shares) if prefix_shares else None,
+    }
+
+
+def run_benchmark(modeltyp:str, model:str, deployment_config:dict, uses_chat_template:bool, max_new_tokens:int, prompts:list=PROMPTS):
+    variants = {
+        "original": deployment_config,
+        QUANTIZATION_DYNAMIC_INT8: {**deployment_config, "quantization": QUANTIZATION_DYNAMIC_INT8},
+    }
+    results = {}
+    for name, config in variants.items():
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            results[name] = executor.submit(measure_variant, modeltyp, model, config, uses_chat_template, max_new_tokens, prompts).result()
+
+    original, quantized = results["original"], results[QUANTIZATION_DYNAMIC_INT8]
+    if original["status"] == STATUS_READY and quantized["status"] == STATUS_READY:
+        results["comparison"] = {
+            "speedup": round(original["latency_ms"]["mean"] / quantized["latency_ms"]["mean"], 2),
+            "memory_ratio": round(quantized["memory_mb"] / original["memory_mb"], 2) if original["memory_mb"] > 0 else None,
+            "energy_per_token_ratio": quantized["energy_per_token_j"] / original["energy_per_token_j"]
+                if quantized["energy_per_token_j"] and original["energy_per_token_j"] else None,
+            **agreement(original["answers"], quantized["answers"]),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", required=True, help="hugging face model or local path")
+    parser.add_argument("--modeltyp", default="text-generation")
+    parser.add_argument("--torch-dtype", default=None, help="dtype of the original model, e.g. torch.bfloat16")
+    parser.add_argument("--uses-chat-template", action="store_true")
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--prompts", default=None, help="file with one prompt per line, defaults to a fixed prompt set")
+    args = parser.parse_args()
+
+    deployment_config = {}
+    if args.torch_dtype:
+        deployment_config["torch_dtype"] = getattr(torch, args.torch_dtype.replace("torch.", ""))
+    prompts = PROMPTS
+    if args.prompts:
+        with open(args.prompts) as file:
+            prompts = [line.strip() for line in file if line.strip()]
+
+    results = run_benchmark(args.modeltyp, args.model, deployment_config, args.uses_chat_template, args.max_new_tokens, prompts)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
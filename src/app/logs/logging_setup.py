@@ -0,0 +1,200 @@
+"""Logging of the whole application: one root setup which formats records as json lines and writes them
+from a background thread, so a log call in the request path only puts the record into a bounded queue.
+
+Modules log through named loggers (logging.getLogger(__name__)), which allows levels per logger.
+Records with the full question or answer are marked as payload (extra={"payload": True}) and only a sample
+of them is kept.
+
+Configured by environment variables:
+    LOG_FILE: path of the log file, if it is not set the records are written to stderr
+    LOG_LEVEL: level of the root logger, defaults to INFO
+    LOG_LEVELS: levels of single loggers, e.g. "src.app.wrapper=DEBUG,transformers=WARNING"
+    LOG_PAYLOAD_SAMPLE_RATE: share of the payload records which are written, defaults to 0.01
+    LOG_MAX_BYTES: size in bytes after which the log file is rotated, defaults to 10 MB
+    LOG_BACKUP_COUNT: number of rotated files which are kept, defaults to 5
+    LOG_QUEUE_SIZE: number of records which wait for the writer, further records are dropped, defaults to 10000
+"""
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+
+DEFAULT_LEVEL = "INFO"
+DEFAULT_PAYLOAD_SAMPLE_RATE = 0.01
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+DEFAULT_QUEUE_SIZE = 10000
+
+# attributes every LogRecord has, all other attributes were passed with extra and are written as fields
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+_exception_formatter = logging.Formatter()
+_listener = None
+_queue_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one json object per line with the fields passed with extra."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key != "payload":
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class PayloadSampler(logging.Filter):
+    """Keeps only the share sample_rate of the records marked as payload, the other records pass."""
+
+    def __init__(self, sample_rate:float):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        if not getattr(record, "payload", False):
+            return True
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler which drops records instead of blocking the caller when the writer falls behind."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self._dropped = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record):
+        # only the arguments are merged into the message and the traceback is rendered, the json is built by the writer
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+
+    @property
+    def dropped(self):
+        with self._lock:
+            return self._dropped
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    """QueueListener whose stop waits for room in a full queue instead of failing."""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+def parse_levels(levels:str):
+    """Parses "logger=LEVEL,logger=LEVEL" into a dictionary."""
+    result = {}
+    for entry in (levels or "").split(","):
+        if "=" in entry:
+            name, level = entry.split("=", 1)
+            result[name.strip()] = level.strip().upper()
+    return result
+
+
+def configure_logging(log_file:str=None, level:str=None, levels:dict=None, payload_sample_rate:float=None,
+                      max_bytes:int=None, backup_count:int=None, queue_size:int=None):
+    """Replaces the handlers of the root logger with a queue handler whose records are written as json lines
+    by a background thread, to a rotating file if a log file is configured and to stderr otherwise.
+    Arguments which are None are read from the environment.
+    Can be called again to change the configuration, the previous writer is flushed and stopped.
+
+    Returns:
+        DroppingQueueHandler: the handler of the root logger, which counts the dropped records
+    """
+    global _listener, _queue_handler
+    log_file = log_file or os.environ.get("LOG_FILE")
+    level = level or os.environ.get("LOG_LEVEL", DEFAULT_LEVEL)
+    levels = levels if levels is not None else parse_levels(os.environ.get("LOG_LEVELS"))
+    payload_sample_rate = payload_sample_rate if payload_sample_rate is not None else float(os.environ.get("LOG_PAYLOAD_SAMPLE_RATE", DEFAULT_PAYLOAD_SAMPLE_RATE))
+    max_bytes = max_bytes if max_bytes is not None else int(os.environ.get("LOG_MAX_BYTES", DEFAULT_MAX_BYTES))
+    backup_count = backup_count if backup_count is not None else int(os.environ.get("LOG_BACKUP_COUNT", DEFAULT_BACKUP_COUNT))
+    queue_size = queue_size or int(os.environ.get("LOG_QUEUE_SIZE", DEFAULT_QUEUE_SIZE))
+
+    shutdown_logging()
+    if log_file:
+        writer = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+    else:
+        writer = logging.StreamHandler(sys.stderr)
+    writer.setFormatter(JsonFormatter())
+    _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    _queue_handler.log_file = log_file
+    # sampling before the queue, so dropped payload records cost neither the queue nor the writer
+    _queue_handler.addFilter(PayloadSampler(payload_sample_rate))
+    _listener = _QueueListener(_queue_handler.queue, writer, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(_queue_handler)
+    root.setLevel(level.upper())
+    for name, logger_level in levels.items():
+        logging.getLogger(name).setLevel(logger_level.upper())
+    return _queue_handler
+
+
+def shutdown_logging():
+    """Writes the queued records and stops the background writer."""
+    global _listener, _queue_handler
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+
+
+def _restart_writer_in_child():
+    """A forked process (e.g. a replica) inherits the queue but not the writer thread, so it gets its own writer
+    which appends to the same file or stderr. Only the parent rotates the file."""
+    global _listener
+    if _listener is None:
+        return
+    if _queue_handler.log_file:
+        writer = logging.FileHandler(_queue_handler.log_file, encoding="utf-8")
+    else:
+        writer = logging.StreamHandler(sys.stderr)
+    writer.setFormatter(JsonFormatter())
+    _queue_handler.queue = queue.Queue(maxsize=_queue_handler.queue.maxsize)
+    _listener = _QueueListener(_queue_handler.queue, writer, respect_handler_level=True)
+    _listener.start()
+
+
+atexit.register(shutdown_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_writer_in_child)
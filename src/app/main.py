@@ -1,21 +1,37 @@
 import json
 import logging
+import os
+import queue
+import threading
 import time
-from typing import Any, Dict, List, Tuple
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 
-from fastapi import FastAPI
+import psutil
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
 
-from src.app.models.request import ModelConfig, Prompt, PromptResponse
+from src.app.logs.logging_setup import configure_logging
+from src.app.metrics.metrics import (QUEUE_WAIT_SECONDS, REGISTRY,
+                                     REQUEST_SECONDS, observe_energy)
+from src.app.models.request import ModelConfig, Prompt, PromptList, PromptResponse
+from src.app.sci.sci_score import (cancel_calc_sci_score, end_calc_sci_score,
+                                   start_calc_sci_score)
+from src.app.wrapper.admission_control import (SHED_QUEUE_FULL,
+                                               AdmissionController,
+                                               OverloadError)
+from src.app.wrapper.deploy_jobs import DeployJob, DeployJobManager
+from src.app.wrapper.inference_executor import InferenceExecutor, QueueFullError
 from src.app.wrapper.llm_wrapper_manager import WrapperManager
-from src.app.sci.sci_score import start_calc_sci_score, end_calc_sci_score
+from src.app.wrapper.memory_estimator import MemoryEstimator
+from src.app.wrapper.model_registry import ModelRegistry, RegistryError
 
-logging.basicConfig(
-    filename="app.log",
-    filemode="w",
-    level=logging.DEBUG,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-)
+# json lines written by a background thread, configured with the LOG_* environment variables
+log_handler = configure_logging()
+logger = logging.getLogger(__name__)
 
 SUCCESS = "success"
 FAILURE = "failure"
@@ -24,102 +40,577 @@ STATUS_NOT_READY = "not ready"
 STATUS_READY = "ready"
 STATUS_FAILURE = "failure"
 STATUS_IDLE = "idle"
+STATUS_BUSY = "busy"
+
+# maximum number of prompts waiting for the llm, further prompts are rejected as busy
+MAX_QUEUE_SIZE = 8
+# maximum number of prompts handed to the wrapper at once, bounds the size of a micro batch
+MAX_CONCURRENT_PROMPTS = 8
+# number of prompts of a bulk request which are handed to the wrapper and measured together
+BULK_CHUNK_SIZE = 16
+# total memory of all deployed models, least recently used idle models are evicted to stay below it.
+# Configurable with the environment variable MEMORY_BUDGET_MB, defaults to 80% of the system memory
+MEMORY_BUDGET_BYTES = int(float(os.environ.get("MEMORY_BUDGET_MB", 0)) * 1e6) or int(psutil.virtual_memory().total * 0.8)
+# time a deployment whose projected memory exceeds the available memory waits for memory to be freed.
+# Configurable with the environment variable DEPLOY_MEMORY_WAIT_S
+DEPLOY_MEMORY_WAIT_S = float(os.environ.get("DEPLOY_MEMORY_WAIT_S", 300))
+MEMORY_POLL_INTERVAL_S = 1
+PHASE_WAITING_FOR_MEMORY = "waiting for memory"
+# time after which the generation of a prompt without deadline_ms stops and returns the partial answer.
+# Configurable with the environment variable PROMPT_DEADLINE_S, 0 disables the default deadline
+PROMPT_DEADLINE_S = float(os.environ.get("PROMPT_DEADLINE_S", 120))
 
 app = FastAPI(title="LLM Wrapper Command API")
 
-global wrapper
-wrapper = None
+registry = ModelRegistry(memory_budget_bytes=MEMORY_BUDGET_BYTES)
+deploy_jobs = DeployJobManager()
+memory_estimator = MemoryEstimator()
+
+inference_executor = InferenceExecutor(max_queue_size=MAX_QUEUE_SIZE, max_workers=MAX_CONCURRENT_PROMPTS)
+admission = AdmissionController()
+
+
+def _per_model(read):
+    """returns a metrics callback which reads a value of every deployed llm, labeled with the name of the deployment"""
+    def collect():
+        samples = []
+        for name in registry.names():
+            try:
+                samples.append(({"model": name}, read(registry.get(name).wrapper.llm)))
+            except (RegistryError, AttributeError, TypeError):
+                continue  # the deployment was removed while collecting
+        return samples
+    return collect
+
+
+REGISTRY.gauge("greenprompt_requests_in_flight", "Prompts currently processed by the llm.", lambda: inference_executor.in_flight)
+REGISTRY.gauge("greenprompt_requests_queued", "Prompts waiting in the inference queue.", lambda: inference_executor.queue_depth)
+REGISTRY.counter("greenprompt_log_records_dropped_total", "Log records dropped because the log writer fell behind.", lambda: log_handler.dropped)
+REGISTRY.gauge("greenprompt_model_restarts", "Restarts of the llm since it was deployed.", _per_model(lambda llm: llm.restart_count))
+REGISTRY.gauge("greenprompt_model_restart_attempts", "Failed restart attempts of the llm since the last successful load.", _per_model(lambda llm: llm.restart_attempt))
+REGISTRY.gauge("greenprompt_model_rss_bytes", "Resident memory of the process which serves the llm.", _per_model(lambda llm: llm.rss_bytes()))
 
 
 @app.get("/get_status")
-async def get_status() -> Dict[str, str]:
+async def get_status(model: Optional[str] = None) -> Dict[str, Any]:
     """returns the status of the llm model or STATUS_IDLE if no wrapper is deployed.
 
+    Args:
+        model (str, optional): name of the deployment, can be omitted if only one model is deployed
+
     Returns:
-        Dict[str, str]: a dictionary with the response status and message
+        Dict[str, Any]: a dictionary with the response status and message, the load of the inference queue
+            and the state of all deployments if at least one wrapper is deployed
     """
-    logging.info("Manager: request get_status")
-    if wrapper is None:
-        response = STATUS_IDLE
-    else: 
-        response = wrapper.llm.status
-        
-    return {"status": SUCCESS, "message": response}
+    logger.debug("Manager: request get_status")
+    if len(registry) == 0:
+        return {"status": SUCCESS, "message": STATUS_IDLE}
+
+    try:
+        message = registry.get(model).wrapper.llm.status
+    except RegistryError as e:
+        if model is not None:
+            return {"status": FAILURE, "message": str(e)}
+        message = STATUS_READY if any(d["status"] == STATUS_READY for d in registry.describe().values()) else STATUS_NOT_READY
+
+    return {
+        "status": SUCCESS,
+        "message": message,
+        "queue": inference_executor.stats(),
+        "admission": admission.stats(),
+        "models": registry.describe(),
+        "memory_budget_mb": round(registry.memory_budget_bytes / 1e6, 1),
+        "used_memory_mb": round(registry.used_memory_bytes / 1e6, 1),
+    }
+
+def _estimate_memory(config: ModelConfig) -> Optional[Dict[str, Any]]:
+    """estimates the memory of a deployment before its model is loaded.
+
+    Returns:
+        Optional[Dict[str, Any]]: the estimate of the MemoryEstimator or None if the model config can not be resolved
+    """
+    try:
+        return memory_estimator.estimate(config.model_dump(mode='json'))
+    except Exception as e:
+        logger.warning(f"Manager: Unable to estimate the memory of the model {config.model}: {e}")
+        return None
+
+def _wait_for_memory(job: DeployJob, required_bytes: int) -> None:
+    """blocks the deploy job until the available memory of the system fits the projected memory of the deployment,
+    the following deploy jobs are queued behind it.
+
+    Raises:
+        RuntimeError: if the memory is not available within DEPLOY_MEMORY_WAIT_S seconds
+    """
+    if psutil.virtual_memory().available >= required_bytes:
+        return
+    job.enter_phase(PHASE_WAITING_FOR_MEMORY)
+    deadline = time.time() + DEPLOY_MEMORY_WAIT_S
+    while (available := psutil.virtual_memory().available) < required_bytes:
+        if time.time() >= deadline:
+            raise RuntimeError(f"The model {job.model} needs {required_bytes / 1e6:.0f} MB but only {available / 1e6:.0f} MB are available.")
+        time.sleep(MEMORY_POLL_INTERVAL_S)
+
+def _run_deploy_job(job: DeployJob, config: ModelConfig, memory_estimate: Optional[Dict[str, Any]] = None) -> None:
+    """loads the model of a deploy job and registers its wrapper, runs on the thread of the DeployJobManager.
+    If the memory of the deployment was estimated, the model is only loaded once the memory is available.
+
+    Raises:
+        RuntimeError: if the memory is not available, the wrapper could not be created or the model is not ready
+    """
+    try:
+        if memory_estimate is not None:
+            _wait_for_memory(job, memory_estimate["total_bytes"])
+        wrapper = WrapperManager().create_wrapper(json.dumps(config.model_dump(mode='json')), progress_callback=job.enter_phase)
+    except Exception:
+        registry.cancel(job.name)
+        raise
+
+    if wrapper is None or wrapper.llm.status != STATUS_READY:
+        registry.cancel(job.name)
+        reason = wrapper.llm.last_error if wrapper is not None else None
+        if wrapper is not None:
+            wrapper.shutdown_llm()
+        raise RuntimeError(f"The Wrapper was unable to deploy the model {config.model}" + (f": {reason}" if reason else ""))
+
+    registry.complete(job.name, wrapper, model=config.model, memory_estimate=memory_estimate)
+    # health check and deadline watchdog of the deployment, stopped by shutdown_llm
+    wrapper.start_monitoring()
+
 
 @app.post("/deploy")
 async def deploy(config: ModelConfig):
-    """deploys a wrapper and initiales the llm model defined within the config
+    """starts the deployment of a wrapper with the llm model defined within the config in the background.
+    Several models can be deployed under different names, if the memory budget is exceeded
+    the least recently used idle models are shut down.
+    The memory of the deployment is estimated from the model config before loading, deployments which can never fit
+    into the memory are refused and deployments which do not fit into the available memory wait until it is freed.
+    The progress of the deployment can be polled with /deploy/{job_id}.
 
     Args:
         config (ModelConfig): json fullfilling the requirements of ModelConfig
 
     Returns:
+        Dict[str, Any]: a dictionary with the response status, message, the id of the deploy job and the projected memory
+    """
+    logger.info("Manager: request deploy")
+    name = config.name or config.model
+    memory_estimate = await run_in_threadpool(_estimate_memory, config)
+    projected_bytes = memory_estimate["total_bytes"] if memory_estimate is not None else None
+    if projected_bytes is not None and projected_bytes > psutil.virtual_memory().total:
+        return {"status": FAILURE, "message": f"Unable to deploy the model {name}: The model {name} needs {projected_bytes / 1e6:.0f} MB which exceeds the system memory of {psutil.virtual_memory().total / 1e6:.0f} MB."}
+    try:
+        # evicting idle models shuts them down, which must not block the event loop
+        await run_in_threadpool(registry.reserve, name, model=config.model, expected_memory_bytes=projected_bytes)
+    except RegistryError as e:
+        return {"status": FAILURE, "message": f"Unable to deploy the model {name}: {e}"}
+
+    job = deploy_jobs.submit(name, config.model, lambda job: _run_deploy_job(job, config, memory_estimate))
+    return {
+        "status": SUCCESS,
+        "message": f"The deployment of the model {config.model} has been started",
+        "job_id": job.id,
+        "projected_memory_mb": round(projected_bytes / 1e6, 1) if projected_bytes is not None else None,
+    }
+
+
+@app.get("/deploy/{job_id}")
+async def get_deploy_job(job_id: str) -> Dict[str, Any]:
+    """returns the state of a deploy job with the durations of its loading phases.
+
+    Returns:
+        Dict[str, Any]: a dictionary with the response status and the job
+    """
+    job = deploy_jobs.get(job_id)
+    if job is None:
+        return {"status": FAILURE, "message": f"There is no deploy job with the id {job_id}"}
+    return {"status": SUCCESS, "job": job.describe()}
+
+
+def _deadline(prompt: Prompt, received_time: float) -> Optional[float]:
+    """returns the time after which the generation of the prompt stops, from the deadline of the prompt
+    or the default deadline of the server.
+
+    Returns:
+        Optional[float]: the deadline as time.time() or None if the prompt has no deadline
+    """
+    if prompt.deadline_ms is not None:
+        return received_time + prompt.deadline_ms / 1000
+    return received_time + PROMPT_DEADLINE_S if PROMPT_DEADLINE_S > 0 else None
+
+def _busy_response(message: str, retry_after_s: int, **content: Any) -> JSONResponse:
+    """a 503 response whose Retry-After header tells the client or the router in front when to retry."""
+    return JSONResponse(
+        status_code=503,
+        content={"status": STATUS_BUSY, "message": message, "retry_after_s": retry_after_s, **content},
+        headers={"Retry-After": str(retry_after_s)},
+    )
+
+def _answer_with_sci_score(current_wrapper, question: str, deadline: Optional[float] = None) -> Dict[str, Any]:
+    """runs the prompt through the batch scheduler of the wrapper while measuring the energy consumption,
+    blocks until the answer is generated or the deadline passed.
 
+    Args:
+        current_wrapper (LLMWrapper): the wrapper which answers the question
+        question (str): the question for the llm
+        deadline (Optional[float]): the time after which the partial answer is returned
+
+    Returns:
+        Dict[str, Any]: the llm answer, the calculated sci score and the statistics of the batch
+    """
+    return current_wrapper.process_prompt(question, measure_sci=True, deadline=deadline)
+
+
+@app.post("/process_prompt", response_model=PromptResponse, response_model_exclude_none=True)
+async def process_prompt(prompt: Prompt):
+    """forwards the prompt to the inference queue of the llm and calculates the sci score.
+    Prompts which are expected to miss their deadline, estimated from the recent decode rate and the prompts ahead,
+    are rejected right away, so the client can retry on another node.
+
+    Returns:
+        Dict[str, Any]: a dictionary with the llm response, the calculated sci score and the queue wait time
+            or a busy response with status code 503 and a Retry-After header if the inference queue is full
+            or the prompt can not be answered within its deadline
     """
-    logging.info("Manager: request deploy")
-    global wrapper 
-    if wrapper is None:
+    logger.debug("Manager: request process_prompt")
+    deadline = _deadline(prompt, time.time())
+
+    if len(registry) == 0:
+        return {"answer": "The wrapper is not available", "sci_score": 0}
+    try:
+        deployment = registry.acquire(prompt.model)
+    except RegistryError as e:
+        return {"answer": str(e), "sci_score": 0}
+    requests_ahead = inference_executor.queue_depth + inference_executor.in_flight
+    try:
+        expected_s = admission.admit(deadline, requests_ahead)
+    except OverloadError as e:
+        registry.release(deployment)
+        return _busy_response("The llm can not answer the prompt within its deadline, please retry later.", e.retry_after_s,
+                              queue_depth=inference_executor.queue_depth, expected_ms=round(e.expected_s * 1000, 1))
+
+    queue_depth = inference_executor.queue_depth
+    start_time = time.time()
+    try:
+        result, wait_time_ms = await inference_executor.run(_answer_with_sci_score, deployment.wrapper, prompt.question, deadline)
+    except QueueFullError as e:
+        logger.warning(f"Manager: rejected prompt because {e.queue_depth} prompts are already queued")
+        admission.shed(SHED_QUEUE_FULL)
+        return _busy_response("The llm is busy, please retry later.", admission.retry_after_s(expected_s), queue_depth=e.queue_depth)
+    finally:
+        registry.release(deployment)
+    if not result.get("cached"):
+        admission.observe(result.get("completion_tokens"), result.get("tokens_per_second"))
+    QUEUE_WAIT_SECONDS.observe(wait_time_ms / 1000)
+    REQUEST_SECONDS.observe(time.time() - start_time)
+    return {
+        "answer": result["answer"],
+        "sci_score": result["sci_score"],
+        "queue_wait_ms": wait_time_ms,
+        "queue_depth": queue_depth,
+        "batch_size": result["batch_size"],
+        "tokens_per_second": result["tokens_per_second"],
+        "prompt_tokens": result.get("prompt_tokens"),
+        "completion_tokens": result.get("completion_tokens"),
+        "finish_reason": result.get("finish_reason"),
+        "timings_ms": result.get("timings_ms"),
+        "assisted": result.get("assisted"),
+        "cached": result.get("cached"),
+        "energy_source": result.get("energy_source"),
+    }
+
+
+def _generate_stream_with_sci_score(deployment, question: str, deadline: Optional[float], events: queue.Queue,
+                                    stop_event: threading.Event) -> None:
+    """runs on the inference executor: generates the answer with the wrapper while measuring the energy consumption
+    and puts the events into the queue, followed by None. The acquired deployment is released when the generation ends,
+    so a slow client holds neither the model nor an inference slot.
+
+    Args:
+        deployment (Deployment): the acquired deployment whose wrapper answers the question
+        question (str): the question for the llm
+        deadline (Optional[float]): the time after which the stream ends with the partial answer
+        events (queue.Queue): receives the events of the stream
+        stop_event (threading.Event): set when the client disconnected, cancels the generation
+    """
+    measurement = None
+    stream = None
+    try:
+        if stop_event.is_set():
+            return
+        measurement = start_calc_sci_score()
+        stream = deployment.wrapper.stream_answer(question, deadline=deadline)
+        for event in stream:
+            if stop_event.is_set():
+                break
+            if event["type"] == "done":
+                results_count = max(event["completion_tokens"], 1)
+                event["sci_score"] = end_calc_sci_score(measurement, results_count, "DE",
+                                                        energy_callback=lambda joules: observe_energy(joules, 1, event["completion_tokens"]),
+                                                        tokens=0 if event.get("cached") else (event.get("prompt_tokens") or 0) + event["completion_tokens"])
+                event["energy_source"] = measurement.source
+                REQUEST_SECONDS.observe(event["total_time_ms"] / 1000)
+                if not event.get("cached"):
+                    admission.observe(event["completion_tokens"], event.get("decode_tokens_per_second"))
+            events.put(event)
+    except Exception as e:
+        logger.error(f"Manager: Error during streaming: {e}")
+        events.put({"type": ERROR, "message": str(e)})
+    finally:
         try:
-            wrapper = WrapperManager().create_wrapper(json.dumps(config.model_dump(mode='json')))
-            if wrapper is None:
-                deployment_result = f"The Wrapper was unable to deploy the model {config.model}"
-                response_status = FAILURE
-                
-            elif wrapper.llm.status == STATUS_READY:
-                deployment_result = f"The Wrapper succesfully deployed the model {config.model}"
-                response_status = SUCCESS
-            return {"status": response_status, "message": deployment_result}
-        
-        except Exception as e:
-            logging.error(f"Manager: Error during deployment: {e}")
+            if stream is not None:
+                stream.close()  # cancels the generation if the client disconnected
+        finally:
+            registry.release(deployment)
+            # a stream which ended without answer gets no further energy
+            cancel_calc_sci_score(measurement)
+            events.put(None)
 
-    else:
-        deployment_result = f"Unable to deploy the model {config.model}, because there is already a model deployed."
-        response_status = FAILURE
-        return {"status": response_status, "message": deployment_result}
-    
 
-@app.post("/process_prompt", response_model=PromptResponse)
-async def process_prompt(prompt: Prompt) -> Dict[str, int]:
-    """forwards the prompt to the llm and calculates the sci score.add()
+def _stream_events(deployment, future, events: queue.Queue, stop_event: threading.Event) -> Iterator[str]:
+    """yields the events of the generation as ndjson lines, the last line contains the answer, the sci score
+    and the timing of the generation. Stops the generation if the client disconnects.
+
+    Yields:
+        str: one json encoded event per line
+    """
+    try:
+        while (event := events.get()) is not None:
+            yield json.dumps(event) + "\n"
+    finally:
+        stop_event.set()
+        if inference_executor.cancel(future):
+            # the generation never started, so it did not release the deployment
+            registry.release(deployment)
+
+
+@app.post("/process_prompt_stream")
+async def process_prompt_stream(prompt: Prompt):
+    """forwards the prompt to the llm and streams the answer as newline delimited json while it is generated.
+
+    Every generated piece of text is sent as {"type": "token", "text": ...}. The final event
+    {"type": "done", ...} contains the answer, the sci score, the time to the first token and the decode throughput.
+
+    The generation is queued in the inference executor like every other prompt and passes the admission control.
+
+    Returns:
+        StreamingResponse: the ndjson stream, a failure response if no wrapper is deployed
+            or a busy response with status code 503 and a Retry-After header like process_prompt
+    """
+    logger.debug("Manager: request process_prompt_stream")
+    deadline = _deadline(prompt, time.time())
+
+    if len(registry) == 0:
+        return {"status": FAILURE, "message": "The wrapper is not available"}
+    try:
+        deployment = registry.acquire(prompt.model)
+    except RegistryError as e:
+        return {"status": FAILURE, "message": str(e)}
+
+    requests_ahead = inference_executor.queue_depth + inference_executor.in_flight
+    events = queue.Queue()
+    stop_event = threading.Event()
+    try:
+        expected_s = admission.admit(deadline, requests_ahead)
+        future = inference_executor.submit(_generate_stream_with_sci_score, deployment, prompt.question, deadline, events, stop_event)
+    except OverloadError as e:
+        registry.release(deployment)
+        return _busy_response("The llm can not answer the prompt within its deadline, please retry later.", e.retry_after_s,
+                              queue_depth=inference_executor.queue_depth, expected_ms=round(e.expected_s * 1000, 1))
+    except QueueFullError as e:
+        registry.release(deployment)
+        logger.warning(f"Manager: rejected stream because {e.queue_depth} prompts are already queued")
+        admission.shed(SHED_QUEUE_FULL)
+        return _busy_response("The llm is busy, please retry later.", admission.retry_after_s(expected_s), queue_depth=e.queue_depth)
+
+    return StreamingResponse(_stream_events(deployment, future, events, stop_event), media_type="application/x-ndjson")
+
+
+def _iter_jsonl_prompts(lines: Iterable) -> Iterator[Any]:
+    """parses an uploaded jsonl file line by line, so the file is never loaded as a whole.
+    A line contains either a json object with a question or a json string.
+
+    Yields:
+        Prompt | Exception: the prompt of a line or the error why the line is not a valid prompt
+    """
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+            yield Prompt(question=data) if isinstance(data, str) else Prompt.model_validate(data)
+        except ValueError as e:
+            yield e
+
+
+def _process_prompts_with_sci_score(deployment, prompts: Iterable) -> Iterator[str]:
+    """answers the prompts in chunks of BULK_CHUNK_SIZE through the wrapper and yields one ndjson line per prompt.
+    The energy consumption is measured once per chunk and shared between the prompts of the chunk
+    in proportion to their completion tokens.
+
+    Args:
+        deployment (Deployment): the acquired deployment whose wrapper answers the questions, released when the stream ends
+        prompts (Iterable): Prompt objects or exceptions for invalid input lines
+
+    Yields:
+        str: one json encoded result per prompt
+    """
+    try:
+        yield from _process_prompt_chunks(deployment.wrapper, iter(prompts))
+    finally:
+        registry.release(deployment)
+
+
+def _process_prompt_chunks(current_wrapper, prompts: Iterator) -> Iterator[str]:
+    index = 0
+    while True:
+        chunk = list(islice(prompts, BULK_CHUNK_SIZE))
+        if not chunk:
+            return
+        questions = [prompt.question for prompt in chunk if isinstance(prompt, Prompt)]
+        # the deadlines start with the chunk, so the prompts at the end of a long file are not truncated by the wait
+        chunk_start = time.time()
+        deadlines = [_deadline(prompt, chunk_start) for prompt in chunk if isinstance(prompt, Prompt)]
+
+        results = []
+        chunk_carbon = None
+        chunk_energy = []
+        energy_source = None
+        if questions:
+            measurement = start_calc_sci_score()
+            try:
+                results = current_wrapper.process_prompts(questions, deadlines=deadlines)
+            except Exception as e:
+                cancel_calc_sci_score(measurement)
+                logger.error(f"Manager: Error during bulk processing: {e}")
+                results = [e] * len(questions)
+            else:
+                processed_tokens = sum((result.get("prompt_tokens") or 0) + result["completion_tokens"]
+                                       for result in results if isinstance(result, dict) and not result.get("cached"))
+                try:
+                    # with a result count of 1 the sci score equals the carbon attributed to the whole chunk
+                    chunk_carbon = end_calc_sci_score(measurement, 1, "DE", energy_callback=chunk_energy.append, tokens=processed_tokens)
+                    energy_source = measurement.source
+                except RuntimeError as e:
+                    logger.error(f"Manager: Unable to measure the energy of the bulk chunk: {e}")
+
+        # cached results needed no generation and get no share of the measured energy
+        generated = [result for result in results if isinstance(result, dict) and not result.get("cached")]
+        total_tokens = sum(result["completion_tokens"] for result in generated)
+        if chunk_energy:
+            observe_energy(chunk_energy[0], len(generated), total_tokens)
+        results = iter(results)
+        for prompt in chunk:
+            line = {"index": index}
+            index += 1
+            if not isinstance(prompt, Prompt):
+                line.update({"status": ERROR, "message": str(prompt)})
+                yield json.dumps(line) + "\n"
+                continue
+
+            result = next(results)
+            if isinstance(result, Exception):
+                line.update({"status": ERROR, "question": prompt.question, "message": str(result)})
+                yield json.dumps(line) + "\n"
+                continue
+
+            sci_share = None
+            sci_score = None
+            if result.get("cached"):
+                sci_share = 0.0
+                sci_score = 0.0
+            elif chunk_carbon is not None:
+                sci_share = chunk_carbon * result["completion_tokens"] / total_tokens if total_tokens else chunk_carbon / len(generated)
+                sci_score = sci_share / max(result["completion_tokens"], 1)
+            line.update({
+                "status": SUCCESS,
+                "question": prompt.question,
+                "answer": result["answer"],
+                "prompt_tokens": result["prompt_tokens"] if result.get("prompt_tokens") is not None else current_wrapper.llm.count_tokens(prompt.question),
+                "completion_tokens": result["completion_tokens"],
+                "finish_reason": result.get("finish_reason"),
+                "assisted": result.get("assisted"),
+                "sci_share": sci_share,
+                "sci_score": sci_score,
+                "cached": bool(result.get("cached")),
+                "energy_source": None if result.get("cached") else energy_source,
+            })
+            yield json.dumps(line) + "\n"
+
+
+@app.post("/process_prompts")
+async def process_prompts(request: Request):
+    """answers many prompts with one request and streams one newline delimited json result per prompt.
+
+    The prompts are either sent as json body fullfilling the requirements of PromptList or as
+    uploaded jsonl file (multipart form field "file") with one prompt per line. The deployment
+    is selected with the query parameter "model".
 
     Returns:
-        Dict[str, int]: a dictionary with the llm response and the calculated sci score
+        StreamingResponse: the ndjson stream or a failure response if no wrapper is deployed or the input is invalid
     """
-    logging.info("Manager: request process_prompt")
-    global wrapper
+    logger.debug("Manager: request process_prompts")
+
+    if len(registry) == 0:
+        return {"status": FAILURE, "message": "The wrapper is not available"}
 
-    if wrapper is None:
-        answer = "The wrapper is not available"
-        sci_score = 0
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            return JSONResponse(status_code=422, content={"status": FAILURE, "message": "The form field 'file' needs to contain a jsonl file."})
+        prompts = _iter_jsonl_prompts(upload.file)
     else:
-        question = prompt.question
-        powerstat = start_calc_sci_score()
-        start_time = time.time()
-        answer = wrapper.get_answer(question)
-        end_time = time.time()
-        time_diff_in_ms = (end_time - start_time) * 1000
-        sci_score = end_calc_sci_score(powerstat, len(answer.split()), time_diff_in_ms, "DE")
-    return {"answer": answer, "sci_score": sci_score}
+        try:
+            prompts = PromptList.model_validate_json(await request.body()).prompts
+        except ValidationError as e:
+            return JSONResponse(status_code=422, content={"status": FAILURE, "message": str(e)})
+
+    try:
+        deployment = registry.acquire(request.query_params.get("model"))
+    except RegistryError as e:
+        return {"status": FAILURE, "message": str(e)}
+
+    return StreamingResponse(_process_prompts_with_sci_score(deployment, prompts), media_type="application/x-ndjson")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """returns the latency, throughput, load, restart, memory and energy metrics in the Prometheus text format.
+
+    Returns:
+        PlainTextResponse: the metrics in the Prometheus text exposition format
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 @app.post("/shutdown")
-async def shutdown():
-    """Shuts down the currently deployed model if there is one.
+async def shutdown(model: Optional[str] = None):
+    """Shuts down the deployed model with the given name or all deployed models if no name is given.
+
+    Args:
+        model (str, optional): name of the deployment
 
     Returns:
         Dict[str, str]: a dictionary with the response status and message
     """
-    logging.info("Manager: request shutdown")
-    global wrapper
+    logger.info("Manager: request shutdown")
 
-    if wrapper is None:
+    if len(registry) == 0:
         return {"status": FAILURE, "message": "No model is currently deployed."}
-    
+
     try:
-        wrapper.shutdown_llm()
-        wrapper = None
+        # waits for the prompts in flight and shuts down outside of the event loop
+        if model is None:
+            await run_in_threadpool(registry.clear)
+        else:
+            await run_in_threadpool(registry.remove, model)
         return {"status": SUCCESS, "message": "The model has been successfully shut down."}
+    except RegistryError as e:
+        return {"status": FAILURE, "message": str(e)}
     except Exception as e:
-        logging.error(f"Manager: Error during shutdown: {e}")
-        return {"status": FAILURE, "message": "An error occurred during shutdown."}
\ No newline at end of file
+        logger.error(f"Manager: Error during shutdown: {e}")
+        return {"status": FAILURE, "message": "An error occurred during shutdown."}
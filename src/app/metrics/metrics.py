@@ -0,0 +1,247 @@
+import bisect
+import math
+import threading
+import weakref
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+THROUGHPUT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+ENERGY_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class _ThreadShards:
+    """Per thread arrays of floats which are summed up on read.
+
+    Every thread only writes to its own array, so updates need no lock. The lock is only taken when a thread
+    writes for the first time and when the arrays are read. Arrays of finished threads are folded into a
+    retired array, so short living threads don't let the shards grow.
+    """
+
+    def __init__(self, size:int):
+        self._size = size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = [0.0] * size
+
+    def local(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = [0.0] * self._size
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            weakref.finalize(threading.current_thread(), self._retire, shard)
+        return shard
+
+    def _retire(self, shard):
+        with self._lock:
+            for index, value in enumerate(shard):
+                self._retired[index] += value
+            self._shards = [s for s in self._shards if s is not shard]
+
+    def sum(self):
+        with self._lock:
+            shards = list(self._shards) + [self._retired]
+        return [sum(column) for column in zip(*shards)]
+
+
+class Counter:
+    """Counter which is increased with inc from any thread or read from a callback when the metrics are collected.
+
+    The callback returns the total so far, e.g. a count which another component keeps anyway.
+    """
+    typ = "counter"
+
+    def __init__(self, name:str, documentation:str, callback=None):
+        self.name = name
+        self.documentation = documentation
+        self._callback = callback
+        self._shards = _ThreadShards(1)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels):
+        """Returns the counter of the series with these labels, which is created with the first call."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = Counter(self.name, self.documentation)
+        return child
+
+    def inc(self, amount:float=1):
+        self._shards.local()[0] += amount
+
+    @property
+    def value(self):
+        return self._callback() if self._callback is not None else self._shards.sum()[0]
+
+    def samples(self):
+        with self._lock:
+            children = list(self._children.items())
+        if not children:
+            yield self.name, {}, self.value
+            return
+        for key, child in children:
+            yield self.name, dict(key), child.value
+
+
+class Gauge:
+    """Gauge which is changed with inc/dec from any thread or read from a callback when the metrics are collected.
+
+    The callback returns a number or a list of (labels, value) tuples for labeled series.
+    """
+    typ = "gauge"
+
+    def __init__(self, name:str, documentation:str, callback=None):
+        self.name = name
+        self.documentation = documentation
+        self._callback = callback
+        self._shards = _ThreadShards(1)
+
+    def inc(self, amount:float=1):
+        self._shards.local()[0] += amount
+
+    def dec(self, amount:float=1):
+        self._shards.local()[0] -= amount
+
+    @property
+    def value(self):
+        return self._shards.sum()[0]
+
+    def samples(self):
+        if self._callback is None:
+            yield self.name, {}, self.value
+            return
+        value = self._callback()
+        if isinstance(value, (int, float)):
+            yield self.name, {}, value
+            return
+        for labels, labeled_value in value:
+            yield self.name, labels, labeled_value
+
+
+class Histogram:
+    typ = "histogram"
+
+    def __init__(self, name:str, documentation:str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self._buckets = tuple(sorted(buckets))
+        # one count per bucket, one for +Inf and the sum of the observed values
+        self._shards = _ThreadShards(len(self._buckets) + 2)
+
+    def observe(self, value:float):
+        shard = self._shards.local()
+        shard[bisect.bisect_left(self._buckets, value)] += 1
+        shard[-1] += value
+
+    def snapshot(self):
+        """Returns the cumulative bucket counts, the number of observations and their sum."""
+        totals = self._shards.sum()
+        cumulative = []
+        running = 0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, running, totals[-1]
+
+    def samples(self):
+        cumulative, count, total = self.snapshot()
+        for bound, bucket_count in zip(list(self._buckets) + [math.inf], cumulative):
+            yield f"{self.name}_bucket", {"le": _format_value(bound)}, bucket_count
+        yield f"{self.name}_count", {}, count
+        yield f"{self.name}_sum", {}, total
+
+
+class MetricsRegistry:
+    """Collects the metrics of the server and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics = [m for m in self._metrics if m.name != metric.name] + [metric]
+        return metric
+
+    def counter(self, name:str, documentation:str, callback=None):
+        return self.register(Counter(name, documentation, callback))
+
+    def gauge(self, name:str, documentation:str, callback=None):
+        return self.register(Gauge(name, documentation, callback))
+
+    def histogram(self, name:str, documentation:str, buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.typ}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = {key: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for key, value in labels.items()}
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped.items()) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+REGISTRY = MetricsRegistry()
+
+QUEUE_WAIT_SECONDS = REGISTRY.histogram("greenprompt_queue_wait_seconds", "Time prompts waited in the inference queue.")
+PREFILL_SECONDS = REGISTRY.histogram("greenprompt_prefill_seconds", "Time from the start of a generation until the first new token.")
+DECODE_SECONDS = REGISTRY.histogram("greenprompt_decode_seconds", "Time from the first until the last new token of a generation.")
+REQUEST_SECONDS = REGISTRY.histogram("greenprompt_request_duration_seconds", "Total time to answer a prompt including the queue wait.")
+GENERATED_TOKENS = REGISTRY.counter("greenprompt_generated_tokens_total", "Number of generated completion tokens.")
+TOKENS_PER_SECOND = REGISTRY.histogram("greenprompt_batch_tokens_per_second", "Generation throughput of each batch in tokens per second.", THROUGHPUT_BUCKETS)
+ENERGY_JOULES = REGISTRY.counter("greenprompt_energy_joules_total", "Measured energy consumption of the generations in joules.")
+ENERGY_PER_REQUEST = REGISTRY.histogram("greenprompt_energy_per_request_joules", "Measured energy per answered prompt in joules.", ENERGY_BUCKETS)
+RESTART_SECONDS = {
+    "soft": REGISTRY.histogram("greenprompt_soft_restart_seconds", "Duration of soft restarts which cancel the generations and keep the weights."),
+    "full": REGISTRY.histogram("greenprompt_full_restart_seconds", "Duration of full restarts which reload the model."),
+}
+PROBE_SECONDS = REGISTRY.histogram("greenprompt_probe_seconds", "Latency of the responsiveness probes on deploy and restart.")
+REQUESTS_SHED = REGISTRY.counter("greenprompt_requests_shed_total", "Prompts rejected by the admission control, by reason.")
+ENERGY_PER_TOKEN = REGISTRY.histogram("greenprompt_energy_per_token_joules", "Measured energy per generated token in joules.", ENERGY_BUCKETS)
+
+
+def observe_generation(start_time:float, first_token_time:float, end_time:float):
+    """Records the prefill and decode time of a generation, without a first token the whole time counts as prefill."""
+    if first_token_time is None:
+        PREFILL_SECONDS.observe(end_time - start_time)
+        return
+    PREFILL_SECONDS.observe(first_token_time - start_time)
+    DECODE_SECONDS.observe(end_time - first_token_time)
+
+
+def observe_restart(tier:str, seconds:float):
+    RESTART_SECONDS[tier].observe(seconds)
+
+
+def observe_probe(seconds:float):
+    PROBE_SECONDS.observe(seconds)
+
+
+def observe_energy(energy_joules:float, requests:int, tokens:int):
+    """Records the measured energy of a batch and its share per request and per token."""
+    ENERGY_JOULES.inc(energy_joules)
+    for _ in range(requests):
+        ENERGY_PER_REQUEST.observe(energy_joules / requests)
+    if tokens > 0:
+        ENERGY_PER_TOKEN.observe(energy_joules / tokens)
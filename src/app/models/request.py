@@ -1,3 +1,5 @@
+from typing import Dict, List, Optional
+
 from pydantic import BaseModel, ConfigDict, Field
 
 class PromptingArgs(BaseModel):
@@ -5,20 +7,84 @@ class PromptingArgs(BaseModel):
 
 class DeploymentArgs(BaseModel):
     model_config = ConfigDict(extra='allow')
+    quantization: Optional[str] = Field(None, description="'dynamic_int8' quantizes the weights of the linear layers to int8 after the model is loaded, the activations are quantized per batch. Only supported on the CPU, the model runs in float32 apart from the quantized layers.")
+    num_threads: Optional[int] = Field(None, ge=1, description="The number of torch intra-op threads of the threads which run the model. Defaults to the torch default.")
+    num_interop_threads: Optional[int] = Field(None, ge=1, description="The number of torch inter-op threads. Can only be set once per process, so it is only applied by the first deployment.")
+    cpu_affinity: Optional[List[int]] = Field(None, min_length=1, description="The cores the threads which run the model are pinned to, e.g. the cores of one NUMA node. Defaults to all cores of the process.")
+
+class BatchingArgs(BaseModel):
+    max_batch_size: int = Field(1, ge=1, description="The maximum number of prompts which are processed by the llm as one batch. 1 disables batching.")
+    max_wait_ms: float = Field(0, ge=0, description="The time in milliseconds the scheduler waits for further prompts after the first prompt of a batch arrived.")
+
+class CachingArgs(BaseModel):
+    enabled: bool = Field(True, description="Caches the answers if the prompting config is deterministic (do_sample false or temperature 0).")
+    max_entries: int = Field(1024, ge=1, description="The maximum number of answers kept in memory.")
+    ttl_s: float = Field(3600, gt=0, description="The time in seconds after which a cached answer expires.")
+    disk_path: Optional[str] = Field(None, description="Path of a sqlite file which keeps the cached answers across restarts.")
+
+class PrefixCachingArgs(BaseModel):
+    enabled: bool = Field(True, description="Reuses the past key/values of the chat template prefix which is shared by all prompts. Only used by models with chat template.")
+    max_memory_mb: float = Field(256, gt=0, description="The maximum memory in MB used by the cached key/values.")
+
+class ProbeArgs(BaseModel):
+    question: str = Field("What's the capital of Germany?", description="The question of the responsiveness probe which runs on every deploy and restart.")
+    max_new_tokens: int = Field(1, ge=1, description="The number of tokens generated by the probe, the probe always decodes greedily.")
+    timeout_s: float = Field(30, gt=0, description="The time in seconds after which the probe fails and the model counts as unresponsive.")
+    warmup: bool = Field(False, description="Runs prompts of the warmup lengths and batch sizes before the probe to prime the allocator and kernel caches.")
+    warmup_prompt_tokens: List[int] = Field([32, 256], description="The approximate prompt lengths in tokens used by the warmup.")
+    warmup_batch_sizes: List[int] = Field([1], description="The batch sizes used by the warmup, e.g. the max_batch_size of the batching config.")
+
+class SnapshotArgs(BaseModel):
+    directory: Optional[str] = Field(None, description="Directory of the local snapshot store. If set, the model is stored there in its converted dtype after the first load and later deployments and restarts load the snapshot memory-mapped.")
+
+class ReplicaArgs(BaseModel):
+    count: int = Field(1, ge=1, description="The number of worker processes which answer batches with a copy-on-write replica of the loaded weights. 1 keeps everything in the server process.")
+    threads_per_replica: Optional[int] = Field(None, ge=1, description="The number of torch threads of each replica. Defaults to the num_threads of the deployment config.")
+
+class DraftArgs(BaseModel):
+    model: Optional[str] = Field(None, description="A small model with the same tokenizer, e.g. a smaller model of the same family, which proposes tokens that the model verifies in one forward pass (assisted generation). Only used for single prompts, batches are generated without draft model.")
+    num_assistant_tokens: int = Field(5, ge=1, description="The number of tokens the draft model proposes per verification at the start, adapted by transformers to the acceptance of the proposed tokens.")
+    calibration_tokens: int = Field(32, ge=1, description="The number of tokens generated without draft model after the deployment to measure the baseline of the reported speedup.")
+    revision: Optional[str] = Field(None, description="The revision (branch, tag or commit) of the draft model. The revision of the deployment config only applies to the model.")
 
 class ModelArgs(BaseModel):
     prompting: PromptingArgs
     deployment: DeploymentArgs
+    batching: BatchingArgs = Field(default_factory=BatchingArgs, description="The configuration of the micro-batching scheduler in front of the llm.")
+    caching: CachingArgs = Field(default_factory=CachingArgs, description="The configuration of the response cache for deterministic prompting configs.")
+    prefix_caching: PrefixCachingArgs = Field(default_factory=PrefixCachingArgs, description="The configuration of the key/value cache for the shared prompt prefix.")
+    probe: ProbeArgs = Field(default_factory=ProbeArgs, description="The configuration of the responsiveness probe and the warmup on deploy and restart.")
+    snapshot: SnapshotArgs = Field(default_factory=SnapshotArgs, description="The configuration of the local snapshot store for fast cold starts and restarts.")
+    replicas: ReplicaArgs = Field(default_factory=ReplicaArgs, description="The configuration of the replica processes which share the weights of the model.")
+    draft: DraftArgs = Field(default_factory=DraftArgs, description="The configuration of the draft model for assisted generation, which is deployed, restarted and shut down together with the model.")
 
 class ModelConfig(BaseModel):
     modeltyp: str = Field(..., description="The typ or categorie of a llm for example 'text-generation'.")
     model: str = Field(..., description="The name of the llm model you want to use for example 'TinyLlama/TinyLlama-1.1B-Chat-v1.0'.")
     uses_chat_template: bool = Field(..., description="True if the model from hugging face is usable with the function apply_chat_template, otherwise false")
+    name: Optional[str] = Field(None, description="The name of the deployment which is used by prompts to select the model. Defaults to the name of the model.")
+    system_prompt: Optional[str] = Field(None, description="A system message which is put in front of every question if the model uses a chat template.")
     args: ModelArgs
 
 class PromptResponse(BaseModel):
     answer: str = Field(..., description="The llm's answer to a previously asked question.")
     sci_score: float = Field(..., description="A numerical value as a representation of the sci score as a representation of the energy consumption and the associated CO2 emissions generated during the processing of the prompt and the creation of the answer.")
+    queue_wait_ms: Optional[float] = Field(None, description="The time in milliseconds the prompt waited in the inference queue before the llm started processing it.")
+    queue_depth: Optional[int] = Field(None, description="The number of prompts waiting in the inference queue when this prompt was admitted.")
+    batch_size: Optional[int] = Field(None, description="The number of prompts which were processed by the llm together with this prompt.")
+    tokens_per_second: Optional[float] = Field(None, description="The generation throughput of the batch which contained this prompt in tokens per second.")
+    prompt_tokens: Optional[int] = Field(None, description="The number of tokens of the rendered prompt.")
+    completion_tokens: Optional[int] = Field(None, description="The number of tokens generated by the llm for the answer.")
+    finish_reason: Optional[str] = Field(None, description="Why the generation ended: 'stop' (end of sequence token), 'length' (token or time limit), 'truncated' (deadline of the prompt passed, the answer is partial) or 'cancelled'.")
+    timings_ms: Optional[Dict[str, float]] = Field(None, description="The durations in milliseconds of template rendering, tokenization, prefill, decode and detokenization.")
+    assisted: Optional[Dict[str, Optional[float]]] = Field(None, description="The proposed and accepted draft tokens, the acceptance rate and the speedup against the model without draft model if the answer was generated with a draft model.")
+    cached: Optional[bool] = Field(None, description="True if the answer was served from the response cache without running the llm.")
+    energy_source: Optional[str] = Field(None, description="The source of the energy behind the sci score: 'rapl' (energy counters of the cpu), 'powerstat' or 'cpu_model' (estimated from the cpu time and the tdp of the host).")
 
 class Prompt(BaseModel):
-    question: str = Field(..., description="A string formatted question which is to be answered by the llm while measuring the energy consumption needed to generate the answer")
\ No newline at end of file
+    question: str = Field(..., description="A string formatted question which is to be answered by the llm while measuring the energy consumption needed to generate the answer")
+    model: Optional[str] = Field(None, description="The name of the deployment which answers the question. Can be omitted if only one model is deployed.")
+    deadline_ms: Optional[float] = Field(None, gt=0, description="The time in milliseconds after the prompt was received (for bulk requests: after its chunk was started) after which the generation stops and the partial answer is returned with the finish reason 'truncated'. Defaults to the deadline of the server.")
+
+class PromptList(BaseModel):
+    prompts: List[Prompt] = Field(..., description="A list of prompts which are answered one after another by the llm and returned as a stream of newline delimited json results.")
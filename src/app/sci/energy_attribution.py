@@ -0,0 +1,161 @@
+"""Attribution of the measured system energy to requests whose measurement windows overlap.
+
+The time line is settled in segments between the start and end times of the windows. The energy of a segment is
+split between the windows active in it in proportion to their token rate (tokens processed per second of the window),
+so a request is charged for the share of the work it did in the segment. Every segment is settled exactly once,
+when the first window which contains it finishes, hence the attributed energy of all windows adds up to the
+measured energy of the time covered by at least one window. Energy while no window is active is not attributed.
+
+The tokens of a window which is still running are not known when a segment is settled, such a window is assumed
+to process tokens at the average rate of the recently finished windows.
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from src.app.sci.energy_sampler import get_energy_sampler
+
+logger = logging.getLogger(__name__)
+
+# weight of the latest finished window in the average token rate of the running windows
+RATE_SMOOTHING = 0.2
+
+
+@dataclass(eq=False)
+class Measurement:
+    """The measurement window of one request or batch, created by EnergyAttributor.begin."""
+    start_time: float
+    source: Optional[str] = None  # the name of the energy source of the sampler
+    end_time: Optional[float] = None
+    tokens: Optional[int] = None
+    attributed_joules: float = 0.0
+
+    @property
+    def finished(self):
+        return self.end_time is not None
+
+    def rate(self):
+        """Tokens processed per second of the window."""
+        return self.tokens / max(self.end_time - self.start_time, 1e-3)
+
+
+class EnergyAttributor:
+    """Splits the energy of the sampler between overlapping measurement windows."""
+
+    def __init__(self, sampler, smoothing:float=RATE_SMOOTHING):
+        self._sampler = sampler
+        self._smoothing = smoothing
+        self._lock = threading.Lock()
+        self._windows = []  # windows which are running or finished but not yet settled up to their end
+        self._settled_until = None
+        self._average_rate = None
+        self._attributed_joules = 0.0
+
+    def begin(self, start_time:float=None):
+        """Opens a measurement window which starts now or at start_time."""
+        measurement = Measurement(start_time=start_time if start_time is not None else time.time(), source=self._sampler.source)
+        with self._lock:
+            if self._settled_until is not None and measurement.start_time < self._settled_until:
+                # the energy before is already split between the other windows
+                measurement.start_time = self._settled_until
+            self._windows.append(measurement)
+        return measurement
+
+    def finish(self, measurement:Measurement, tokens:int, end_time:float=None):
+        """Closes the window and settles the energy up to its end.
+
+        Args:
+            measurement (Measurement): the window returned by begin
+            tokens (int): the tokens processed in the window, the weight of the window
+            end_time (float, optional): the end of the window, defaults to now
+
+        Raises:
+            RuntimeError: if the samples of the window are no longer available
+            OSError: if the energy source can not be read, the time stays unsettled
+
+        Returns:
+            float: the energy in joules attributed to the window
+        """
+        end_time = end_time if end_time is not None else time.time()
+        with self._lock:
+            measurement.end_time = max(end_time, measurement.start_time)
+            if self._settled_until is not None and measurement.end_time < self._settled_until:
+                # the end was recorded before another window settled past it, the window was charged as running until then
+                measurement.end_time = self._settled_until
+            measurement.tokens = max(tokens or 0, 0)
+            try:
+                self._settle(measurement.end_time)
+            except Exception:
+                # the window is given up, the other windows settle its time when they finish
+                self._windows = [window for window in self._windows if window is not measurement]
+                raise
+            self._windows = [window for window in self._windows
+                             if not window.finished or self._settled_until is None or window.end_time > self._settled_until]
+            if measurement.tokens:
+                self._average_rate = self._average(measurement.rate())
+            return measurement.attributed_joules
+
+    def _average(self, rate):
+        return rate if self._average_rate is None else self._average_rate + self._smoothing * (rate - self._average_rate)
+
+    def _settle(self, until:float):
+        """Splits the energy between the settled time and until between the windows. Called with the lock held."""
+        if self._settled_until is not None and until <= self._settled_until:
+            return
+        windows = [window for window in self._windows if window.start_time < until]
+        if not windows:
+            return
+        start = min(window.start_time for window in windows)
+        if self._settled_until is not None:
+            start = max(start, self._settled_until)
+        boundaries = {start, until}
+        for window in windows:
+            boundaries.update(boundary for boundary in (window.start_time, window.end_time) if boundary is not None and start < boundary < until)
+        boundaries = sorted(boundaries)
+
+        # all segments are read before anything is charged, so a failed read leaves the time unsettled
+        segments = []
+        for segment_start, segment_end in zip(boundaries, boundaries[1:]):
+            active = [window for window in windows if window.start_time <= segment_start
+                      and (not window.finished or window.end_time >= segment_end)]
+            if active:  # otherwise idle, no request was running
+                segments.append((active, self._sampler.energy_between(segment_start, segment_end)))
+        self._settled_until = max(until, self._settled_until or until)
+
+        for active, joules in segments:
+            weights = [self._weight(window) for window in active]
+            total_weight = sum(weights)
+            for window, weight in zip(active, weights):
+                window.attributed_joules += joules * (weight / total_weight if total_weight > 0 else 1 / len(active))
+            self._attributed_joules += joules
+
+    def _weight(self, window):
+        if window.finished:
+            return window.rate()
+        if self._average_rate is not None:
+            return self._average_rate
+        # before the first window finished all running windows are weighted equally with the finishing ones
+        finished = [other.rate() for other in self._windows if other.finished]
+        return sum(finished) / len(finished) if finished else 1.0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "open_windows": sum(1 for window in self._windows if not window.finished),
+                "attributed_joules": round(self._attributed_joules, 3),
+            }
+
+
+_attributor = None
+_attributor_lock = threading.Lock()
+
+
+def get_energy_attributor():
+    """Returns the attributor of the process, which splits the energy of the sampler of the process."""
+    global _attributor
+    with _attributor_lock:
+        if _attributor is None:
+            _attributor = EnergyAttributor(get_energy_sampler())
+    return _attributor
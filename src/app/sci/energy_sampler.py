@@ -0,0 +1,155 @@
+"""Energy measurement by one long-lived sampler thread instead of a powerstat process per request.
+
+The sampler reads the cumulative energy of the first available energy source (see energy_sources) every
+ENERGY_SAMPLE_INTERVAL_S into a fixed-size ring buffer. The energy of a request is the difference of the buffer
+between its start and end time, interpolated linearly between two samples, so requests shorter than the sample
+interval get the average power of the interval they fall into.
+
+Configured by environment variables:
+    ENERGY_SAMPLE_INTERVAL_S: time between two samples, defaults to 0.1
+    ENERGY_BUFFER_SIZE: number of samples which are kept, defaults to 6000 (10 minutes at 0.1 s)
+    ENERGY_SOURCE: the sources which are tried in this order, see energy_sources.create_sources
+"""
+import logging
+import os
+import threading
+import time
+from array import array
+
+from src.app.sci.energy_sources import create_sources
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_INTERVAL_S = 0.1
+DEFAULT_BUFFER_SIZE = 6000
+
+
+class EnergySampler:
+    """Samples the cumulative energy of the first available source into a ring buffer from a background thread.
+
+    The thread is started with the first measurement, the timestamps of the buffer always increase.
+    """
+
+    def __init__(self, sources=None, interval_s:float=DEFAULT_SAMPLE_INTERVAL_S, capacity:int=DEFAULT_BUFFER_SIZE):
+        self._candidates = sources
+        self._source = None
+        self._interval_s = interval_s
+        self._capacity = capacity
+        self._times = array("d", bytes(8 * capacity))
+        self._joules = array("d", bytes(8 * capacity))
+        self._count = 0  # samples written so far, the newest is at (count - 1) % capacity
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def source(self):
+        """The name of the source the samples are read from or None before the sampler started."""
+        return self._source.name if self._source is not None else None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Selects the source and starts the sampler thread if it is not already running."""
+        with self._lock:
+            if self.running:
+                return
+            if self._source is None:
+                candidates = self._candidates if self._candidates is not None else create_sources(os.environ.get("ENERGY_SOURCE"))
+                self._source = next(source for source in candidates if source.available())
+                logger.info(f"Energy: sampling the {self._source.name} source every {self._interval_s} s")
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="energy-sampler", daemon=True)
+            self._thread.start()
+        self.sample()
+
+    def stop(self):
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop_event.set()
+        thread.join()
+        self._thread = None
+        if self._source is not None:
+            self._source.close()
+
+    def _run(self):
+        while not self._stop_event.wait(self._interval_s):
+            try:
+                self.sample()
+            except (OSError, ValueError) as e:
+                logger.warning(f"Energy: reading the {self._source.name} source failed: {e}")
+
+    def sample(self, timestamp:float=None):
+        """Reads the source and appends the cumulative energy to the ring buffer.
+
+        Returns:
+            float: the time of the sample
+        """
+        with self._lock:
+            joules = self._source.read_joules()
+            timestamp = timestamp if timestamp is not None else time.time()
+            if self._count and timestamp < self._times[(self._count - 1) % self._capacity]:
+                timestamp = self._times[(self._count - 1) % self._capacity]  # the clock went backwards
+            index = self._count % self._capacity
+            self._times[index] = timestamp
+            self._joules[index] = joules
+            self._count += 1
+        return timestamp
+
+    def _energy_at(self, timestamp:float):
+        """Cumulative energy at timestamp, interpolated between the samples around it. Called with the lock held."""
+        oldest = max(0, self._count - self._capacity)
+        if not self._count or timestamp < self._times[oldest % self._capacity]:
+            raise RuntimeError("The energy samples do not cover the start of the measurement.")
+        # binary search for the first sample after timestamp
+        low, high = oldest, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._times[middle % self._capacity] <= timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        before = (low - 1) % self._capacity
+        if low == self._count:
+            return self._joules[before]
+        after = low % self._capacity
+        span = self._times[after] - self._times[before]
+        share = (timestamp - self._times[before]) / span if span > 0 else 1.0
+        return self._joules[before] + share * (self._joules[after] - self._joules[before])
+
+    def energy_between(self, start_time:float, end_time:float=None):
+        """Returns the energy in joules consumed between start_time and end_time (defaults to now).
+
+        Raises:
+            RuntimeError: if the sampler was not started before start_time or the samples were already overwritten
+        """
+        # a fresh sample closes the window, so the end of a request does not wait for the next interval
+        if end_time is None:
+            end_time = self.sample()
+        elif end_time > self.latest_time:
+            end_time = min(end_time, self.sample())
+        with self._lock:
+            return max(0.0, self._energy_at(end_time) - self._energy_at(start_time))
+
+    @property
+    def latest_time(self):
+        with self._lock:
+            return self._times[(self._count - 1) % self._capacity] if self._count else float("-inf")
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_energy_sampler():
+    """Returns the sampler of the process, created from the environment variables and started with the first call."""
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = EnergySampler(interval_s=float(os.environ.get("ENERGY_SAMPLE_INTERVAL_S", DEFAULT_SAMPLE_INTERVAL_S)),
+                                     capacity=int(os.environ.get("ENERGY_BUFFER_SIZE", DEFAULT_BUFFER_SIZE)))
+    _sampler.start()
+    return _sampler
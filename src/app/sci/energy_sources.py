@@ -0,0 +1,281 @@
+"""Sources of the cumulative energy which the EnergySampler reads.
+
+Every source implements EnergySource. The sampler uses the first source of its list which is available:
+    rapl: the energy counters of the cpu packages in /sys/class/powercap (intel-rapl and amd via the same interface)
+    powerstat: one powerstat process which prints the system power every second
+    cpu_model: an estimate from the cpu time of this process and its children with a tdp and idle power profile,
+        always available and the normal case in containers without access to the counters
+
+Further sources are added with register_energy_source and selected with the environment variable ENERGY_SOURCE.
+
+Configured by environment variables:
+    ENERGY_SOURCE: comma separated names of the sources in the order they are tried, defaults to rapl,powerstat,cpu_model
+    CPU_POWER_PROFILE: json file with the power profile per host name,
+        e.g. {"gpu-node-1": {"tdp_w": 125, "idle_w": 20}, "default": {"tdp_w": 65, "idle_w": 8}}
+    CPU_TDP_W, CPU_IDLE_W: the power profile of this host, override the profile file
+"""
+import glob
+import json
+import logging
+import os
+import re
+import socket
+import subprocess
+import threading
+import time
+from abc import ABC, abstractmethod
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+POWERCAP_ROOT = "/sys/class/powercap"
+# time powerstat needs for its first sample
+POWERSTAT_STARTUP_S = 3
+# power profile of the cpu model without configuration: the nominal power of the example in the readme, no idle power,
+# which equals the tdp x utilization approach
+DEFAULT_CPU_TDP_W = 65.0
+DEFAULT_CPU_IDLE_W = 0.0
+# interval in which new child processes (e.g. replicas) are looked up by the cpu model
+CHILDREN_REFRESH_S = 1.0
+
+SOURCE_RAPL = "rapl"
+SOURCE_POWERSTAT = "powerstat"
+SOURCE_CPU_MODEL = "cpu_model"
+DEFAULT_SOURCES = (SOURCE_RAPL, SOURCE_POWERSTAT, SOURCE_CPU_MODEL)
+
+# a data line of powerstat starts with the time and ends with the power in watts
+POWERSTAT_LINE = re.compile(r"^\d\d:\d\d:\d\d\s.*\s([\d.]+)\s*$")
+
+
+class EnergySource(ABC):
+    """A source of the energy consumed since the source was first read, read by the sampler thread."""
+
+    name = None
+
+    @abstractmethod
+    def available(self) -> bool:
+        """Returns whether the source can measure on this host, called once before the first read."""
+
+    @abstractmethod
+    def read_joules(self) -> float:
+        """Returns the cumulative energy in joules, the value must not decrease."""
+
+    def close(self):
+        """Releases the resources of the source when the sampler stops."""
+
+
+class RaplSource(EnergySource):
+    """Reads the energy counters of the top level powercap zones (one per cpu package).
+
+    The sub zones (core, uncore, dram) are part of their package and are not added. The counters wrap around at
+    max_energy_range_uj, which is corrected between two reads. Since kernel 5.10 only root can read energy_uj.
+    """
+
+    name = SOURCE_RAPL
+
+    def __init__(self, root:str=POWERCAP_ROOT):
+        self._root = root
+        self._zones = None
+        self._last = {}
+        self._joules = 0.0
+
+    def _find_zones(self):
+        zones = []
+        for path in sorted(glob.glob(os.path.join(self._root, "*-rapl:*"))):
+            # intel-rapl:0 is a package, intel-rapl:0:0 one of its sub zones
+            if path.rsplit("-rapl:", 1)[1].count(":") or not os.path.isfile(os.path.join(path, "energy_uj")):
+                continue
+            zones.append(path)
+        # psys measures the whole platform including the packages, adding them would count them twice
+        psys = [zone for zone in zones if self._read_name(zone) == "psys"]
+        return psys or zones
+
+    @staticmethod
+    def _read_name(zone):
+        try:
+            with open(os.path.join(zone, "name")) as file:
+                return file.read().strip()
+        except OSError:
+            return None
+
+    @staticmethod
+    def _read_int(path):
+        with open(path) as file:
+            return int(file.read())
+
+    def available(self):
+        """Returns whether at least one zone exists and its counter can be read."""
+        if self._zones is None:
+            self._zones = self._find_zones()
+        try:
+            return bool(self._zones) and self.read_joules() is not None
+        except (OSError, ValueError) as e:
+            logger.info(f"Energy: RAPL counters in {self._root} are not readable: {e}")
+            return False
+
+    def read_joules(self):
+        """Returns the energy of all zones in joules since the first read."""
+        for zone in self._zones:
+            energy_uj = self._read_int(os.path.join(zone, "energy_uj"))
+            last = self._last.get(zone)
+            if last is not None:
+                delta = energy_uj - last
+                if delta < 0:
+                    delta += self._read_int(os.path.join(zone, "max_energy_range_uj"))
+                self._joules += delta / 1e6
+            self._last[zone] = energy_uj
+        return self._joules
+
+
+class PowerstatSource(EnergySource):
+    """Keeps one powerstat process running and integrates the power of its one second samples over time."""
+
+    name = SOURCE_POWERSTAT
+
+    def __init__(self, command=("powerstat", "-d", "0", "-z", "1", "1000000")):
+        self._command = list(command)
+        self._process = None
+        self._reader = None
+        self._watts = None
+        self._joules = 0.0
+        self._last_read = None
+
+    def available(self):
+        try:
+            self._process = subprocess.Popen(self._command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        except OSError as e:
+            logger.info(f"Energy: powerstat is not available: {e}")
+            return False
+        self._reader = threading.Thread(target=self._read_output, args=(self._process,), name="powerstat-reader", daemon=True)
+        self._reader.start()
+        # powerstat exits right away if it can not measure, e.g. without battery or rapl access
+        deadline = time.time() + POWERSTAT_STARTUP_S
+        while self._watts is None and self._process.poll() is None and time.time() < deadline:
+            time.sleep(0.05)
+        if self._watts is None:
+            logger.info("Energy: powerstat reported no power")
+            self.close()
+            return False
+        return True
+
+    def _read_output(self, process):
+        for line in process.stdout:
+            match = POWERSTAT_LINE.match(line.strip())
+            if match:
+                self._watts = float(match.group(1))
+        if process.poll() is not None and process.returncode:
+            logger.warning(f"Energy: powerstat exited with code {process.returncode}")
+
+    def read_joules(self):
+        now = time.time()
+        if self._last_read is not None and self._watts is not None:
+            self._joules += self._watts * (now - self._last_read)
+        self._last_read = now
+        return self._joules
+
+    def close(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait()
+            self._process = None
+
+
+class CpuModelSource(EnergySource):
+    """Estimates the power from the cpu time of this process and its child processes:
+
+        power = idle_w + (tdp_w - idle_w) * cpu seconds / (wall seconds * logical cpus)
+
+    Only the sampler thread reads the cpu times, a request adds no work.
+    """
+
+    name = SOURCE_CPU_MODEL
+
+    def __init__(self, tdp_w:float=DEFAULT_CPU_TDP_W, idle_w:float=DEFAULT_CPU_IDLE_W, process=None, cpu_count:int=None):
+        self.tdp_w = tdp_w
+        self.idle_w = idle_w
+        self._process = process or psutil.Process()
+        self._cpu_count = cpu_count or psutil.cpu_count() or 1
+        self._children = []
+        self._children_time = None
+        self._cpu_seconds = {}  # cpu seconds of every process at the last read
+        self._last_read = None
+        self._joules = 0.0
+
+    @classmethod
+    def from_profile(cls, path:str=None, hostname:str=None):
+        """Creates the source with the power profile of this host from CPU_POWER_PROFILE, CPU_TDP_W and CPU_IDLE_W."""
+        profile = {}
+        path = path or os.environ.get("CPU_POWER_PROFILE")
+        if path:
+            with open(path) as file:
+                profiles = json.load(file)
+            profile = profiles.get(hostname or socket.gethostname(), profiles.get("default", {}))
+        tdp_w = float(os.environ.get("CPU_TDP_W", profile.get("tdp_w", DEFAULT_CPU_TDP_W)))
+        idle_w = float(os.environ.get("CPU_IDLE_W", profile.get("idle_w", DEFAULT_CPU_IDLE_W)))
+        return cls(tdp_w=tdp_w, idle_w=idle_w)
+
+    def available(self):
+        self.read_joules()
+        return True
+
+    def _processes(self, now):
+        if self._children_time is None or now - self._children_time >= CHILDREN_REFRESH_S:
+            try:
+                self._children = self._process.children(recursive=True)
+            except psutil.Error:
+                self._children = []
+            self._children_time = now
+        return [self._process, *self._children]
+
+    def _cpu_delta(self, now):
+        """The cpu seconds of all processes since the last read, exited processes are dropped."""
+        delta = 0.0
+        cpu_seconds = {}
+        for process in self._processes(now):
+            try:
+                times = process.cpu_times()
+            except psutil.Error:
+                continue
+            seconds = times.user + times.system
+            cpu_seconds[process.pid] = seconds
+            delta += max(0.0, seconds - self._cpu_seconds.get(process.pid, 0.0))
+        self._cpu_seconds = cpu_seconds
+        return delta
+
+    def read_joules(self):
+        now = time.time()
+        delta = self._cpu_delta(now)
+        if self._last_read is not None and now > self._last_read:
+            wall_seconds = now - self._last_read
+            utilization = min(1.0, delta / (wall_seconds * self._cpu_count))
+            self._joules += (self.idle_w + (self.tdp_w - self.idle_w) * utilization) * wall_seconds
+        self._last_read = now
+        return self._joules
+
+
+_factories = {
+    SOURCE_RAPL: RaplSource,
+    SOURCE_POWERSTAT: PowerstatSource,
+    SOURCE_CPU_MODEL: CpuModelSource.from_profile,
+}
+
+
+def register_energy_source(name:str, factory):
+    """Registers a source under name, factory is called without arguments and returns an EnergySource."""
+    _factories[name] = factory
+
+
+def create_sources(names:str=None):
+    """Creates the sources in the order of the comma separated names, the cpu model is always the last resort.
+
+    Raises:
+        ValueError: if a name is not registered
+    """
+    names = [name.strip() for name in names.split(",") if name.strip()] if names else list(DEFAULT_SOURCES)
+    unknown = [name for name in names if name not in _factories]
+    if unknown:
+        raise ValueError(f"Unknown energy sources {unknown}, available are {sorted(_factories)}")
+    if SOURCE_CPU_MODEL not in names:
+        names.append(SOURCE_CPU_MODEL)
+    return [_factories[name]() for name in names]
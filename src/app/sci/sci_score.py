@@ -1,56 +1,58 @@
+import logging
 import re
-import subprocess
 
-# Globale Variable zur Speicherung der Messdaten
+from src.app.sci.energy_attribution import get_energy_attributor
+
+logger = logging.getLogger(__name__)
 
 
 def start_calc_sci_score():
     """
-    Startet die Messung des Energieverbrauchs mit powerstat.
+    Startet die Messung des Energieverbrauchs. Der Sampler des Prozesses läuft dauerhaft im Hintergrund,
+    es wird nur ein Messfenster geöffnet.
+
+    :return: Das Messfenster (Measurement), mit start_time als Startzeitpunkt und source als Name der Energiequelle.
     """
-    print("Messung mit powerstat gestartet...")
-    powerstat_process = subprocess.Popen(
-        ["powerstat", "1", "-d 0", "-z"],  # 1-Sekunden-Intervall
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True
-    )
-    return powerstat_process
+    return get_energy_attributor().begin()
 
 
-def end_calc_sci_score(powerstat_process, results_count,time_diff_in_ms, country_code="DE"):
+def end_calc_sci_score(measurement, results_count, country_code="DE", energy_callback=None, end_time=None, tokens=None):
     """
-    Beendet die Messung und berechnet den SCI-Score basierend auf dem Powerstat-Summary.
+    Beendet die Messung und berechnet den SCI-Score aus der Energie des Messfensters. Überlappen sich
+    Messfenster, wird die Energie anteilig nach den verarbeiteten Tokens aufgeteilt.
 
+    :param measurement: Rückgabewert von start_calc_sci_score().
     :param results_count: Anzahl der Ergebnisse (z. B. verarbeitete Anfragen).
     :param country_code: Ländercode zur Berechnung der Kohlenstoffintensität.
+    :param energy_callback: Wird mit der zugeordneten Energie in Joule aufgerufen (z. B. für Metriken).
+    :param end_time: Endzeitpunkt der Messung, standardmäßig jetzt.
+    :param tokens: Verarbeitete Tokens (Prompt und Antwort) als Gewicht, standardmäßig results_count.
     :return: Berechneter SCI-Score.
     """
 
-    if powerstat_process is None:
+    if measurement is None:
         raise RuntimeError("Messung wurde nicht gestartet. Rufen Sie start_calc_sci_score() auf.")
 
-    # Powerstat beenden
-    print("Messung beenden...")
-    powerstat_process.terminate()
-    stdout, stderr = powerstat_process.communicate()
+    energy_joules = get_energy_attributor().finish(measurement, tokens if tokens is not None else results_count, end_time)
+    logger.debug("SCI: %s Joule", energy_joules)
+    if energy_callback is not None:
+        energy_callback(energy_joules)
+    return calc_sci_score(energy_joules, results_count, country_code)
 
-    if stderr:
-        print(f"Fehler bei powerstat: {stderr}")
-        
-    print(stdout)
 
-    # Parse den Powerstat-Summary   
-    energy_watts = parse_powerstat_summary(stdout)
-    
-    print(energy_watts)
+def cancel_calc_sci_score(measurement):
+    """
+    Schließt ein Messfenster ohne Ergebnis (z. B. nach einem Fehler), damit es keine Energie mehr zugeordnet bekommt.
+    """
+    if measurement is not None and not measurement.finished:
+        get_energy_attributor().finish(measurement, 0)
 
-    if energy_watts is None:
-        raise RuntimeError("Konnte keinen gültigen Watt-Wert aus der powerstat-Ausgabe extrahieren.")
 
-    # Berechnung der Energie in kWh
-    duration_seconds = time_diff_in_ms / 1000  # Millisekunden => Sekunden
-    energy_kwh = (energy_watts * duration_seconds) / 3600  # Watt * Sekunden => kWh
+def calc_sci_score(energy_joules, results_count, country_code="DE"):
+    """
+    Berechnet den SCI-Score aus der gemessenen Energie in Joule.
+    """
+    energy_kwh = energy_joules / 3.6e6  # Joule => kWh
 
     # Kohlenstoffintensität holen
     grid_intensity = get_grid_intensity(country_code)
@@ -61,7 +63,7 @@ def end_calc_sci_score(powerstat_process, results_count,time_diff_in_ms, country
     # SCI-Score berechnen
     sci_score = calculate_sci(energy_kwh, grid_intensity, hardware_carbon, results_count)
 
-    print("Messung beendet.")
+    logger.debug("SCI: Messung beendet, SCI-Score %s", sci_score)
     return sci_score
 
 
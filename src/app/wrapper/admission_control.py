@@ -0,0 +1,105 @@
+import logging
+import math
+import threading
+import time
+
+from src.app.metrics.metrics import REQUESTS_SHED
+
+logger = logging.getLogger(__name__)
+
+SHED_QUEUE_FULL = "queue_full"
+SHED_DEADLINE = "deadline"
+
+# weight of the latest observation in the moving averages of the decode rate and the completion length
+DEFAULT_SMOOTHING = 0.2
+
+
+class OverloadError(Exception):
+    def __init__(self, message, expected_s, retry_after_s):
+        super().__init__(message)
+        self.expected_s = expected_s
+        self.retry_after_s = retry_after_s
+
+
+class AdmissionController:
+    """Estimates how long a new prompt takes from the recent decode rate and the prompts ahead of it
+    and sheds prompts which can not finish within their deadline.
+
+    The decode rate is the throughput of the recent batches in tokens per second, so batching is already part of it.
+    Every prompt ahead is assumed to generate the average number of completion tokens of the recent prompts.
+    """
+
+    def __init__(self, smoothing:float=DEFAULT_SMOOTHING):
+        self._smoothing = smoothing
+        self._lock = threading.Lock()
+        self._tokens_per_second = None
+        self._completion_tokens = None
+        self._admitted = 0
+        self._shed = {SHED_QUEUE_FULL: 0, SHED_DEADLINE: 0}
+
+    def observe(self, completion_tokens:int, tokens_per_second:float):
+        """Updates the averages with a generated answer and the throughput of its batch."""
+        if not completion_tokens or not tokens_per_second:
+            return
+        with self._lock:
+            self._tokens_per_second = self._average(self._tokens_per_second, tokens_per_second)
+            self._completion_tokens = self._average(self._completion_tokens, completion_tokens)
+
+    def _average(self, average, value):
+        return value if average is None else average + self._smoothing * (value - average)
+
+    def expected_seconds(self, requests_ahead:int):
+        """Expected time until a new prompt is answered, which waits for requests_ahead prompts,
+        or None as long as nothing was observed."""
+        with self._lock:
+            if self._tokens_per_second is None:
+                return None
+            return (requests_ahead + 1) * self._completion_tokens / self._tokens_per_second
+
+    def admit(self, deadline:float, requests_ahead:int):
+        """Admits a prompt if it is expected to finish before its deadline.
+
+        Args:
+            deadline (float): time.time() until which the prompt has to be answered, None admits every prompt
+            requests_ahead (int): the prompts which are queued or processed before the new prompt
+
+        Raises:
+            OverloadError: if the prompt is expected to miss its deadline, with the time after which a retry can succeed
+
+        Returns:
+            Optional[float]: the expected time in seconds until the prompt is answered
+        """
+        expected_s = self.expected_seconds(requests_ahead)
+        if deadline is not None and expected_s is not None:
+            remaining_s = deadline - time.time()
+            if expected_s > remaining_s:
+                retry_after_s = self.retry_after_s(expected_s - max(remaining_s, 0))
+                self.shed(SHED_DEADLINE)
+                logger.warning(f"Admission: shed prompt, expected {expected_s:.1f} s with {requests_ahead} prompts ahead exceeds the deadline in {remaining_s:.1f} s")
+                raise OverloadError(f"The prompt is expected to take {expected_s:.1f} seconds which exceeds its deadline.", expected_s, retry_after_s)
+        with self._lock:
+            self._admitted += 1
+        return expected_s
+
+    @staticmethod
+    def retry_after_s(excess_s:float):
+        """Whole seconds until the work which exceeds the deadline is done, at least 1."""
+        return max(1, math.ceil(excess_s)) if excess_s is not None else 1
+
+    def shed(self, reason:str):
+        with self._lock:
+            self._shed[reason] = self._shed.get(reason, 0) + 1
+        REQUESTS_SHED.labels(reason=reason).inc()
+
+    def shed_counts(self):
+        with self._lock:
+            return dict(self._shed)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "decode_tokens_per_second": round(self._tokens_per_second, 2) if self._tokens_per_second is not None else None,
+                "completion_tokens_per_prompt": round(self._completion_tokens, 1) if self._completion_tokens is not None else None,
+                "admitted": self._admitted,
+                "shed": dict(self._shed),
+            }
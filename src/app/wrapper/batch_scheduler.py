@@ -0,0 +1,218 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from src.app.metrics.metrics import (GENERATED_TOKENS, TOKENS_PER_SECOND,
+                                     observe_energy)
+from src.app.sci.sci_score import (cancel_calc_sci_score, end_calc_sci_score,
+                                   start_calc_sci_score)
+
+logger = logging.getLogger(__name__)
+
+
+class BatchScheduler:
+    """Collects prompts which arrive within a short window and runs them through the llm as one batch.
+
+    With max_batch_size = 1 every prompt is processed on its own, which equals the behaviour of calling
+    LLMModel.answer_question directly but still serializes the access to the model.
+
+    If a backend (e.g. a ReplicaPool) is given, the batches are answered by the backend instead of the llm and up to
+    max_concurrent_batches batches are processed at the same time. The model lock is not held for backend batches.
+    """
+
+    def __init__(self, llm, max_batch_size:int=1, max_wait_ms:float=0, country_code:str="DE", backend=None, max_concurrent_batches:int=1):
+        self._llm = llm
+        self._backend = backend if backend is not None else llm
+        self._max_concurrent_batches = max(1, max_concurrent_batches)
+        self._batch_slots = threading.Semaphore(self._max_concurrent_batches)
+        self._executor = None
+        self._max_batch_size = max(1, max_batch_size)
+        self._max_wait_ms = max(0, max_wait_ms)
+        self._country_code = country_code
+        self._queue = queue.Queue()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._model_lock = threading.Lock()
+        self._last_batch = None
+
+    def start(self):
+        """Starts the scheduler thread if it is not already running."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            if self._max_concurrent_batches > 1:
+                self._executor = ThreadPoolExecutor(max_workers=self._max_concurrent_batches, thread_name_prefix="batch")
+            self._thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops the scheduler thread after the current batch, waiting prompts are processed before."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+            executor = self._executor
+            self._executor = None
+        if thread is None:
+            return
+        self._stop_event.set()
+        thread.join()
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def submit(self, question:str, measure_sci:bool=False, deadline:float=None):
+        """Queues a question for the next batch.
+
+        Args:
+            question (str): the question for the llm
+            measure_sci (bool): True if the energy consumption of the batch should be measured for this question
+            deadline (float, optional): time.time() after which the generation of the question stops with the finish reason "truncated"
+
+        Returns:
+            Future: resolves to a dict with the answer, the sci score (if measured) and the batch statistics
+        """
+        self.start()
+        future = Future()
+        self._queue.put((question, measure_sci, future, deadline))
+        return future
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop_event.is_set():
+                    return
+                continue
+            if self._executor is None:
+                self._process_batch(self._collect_batch(first))
+                continue
+            # wait for a free slot before collecting, so the batch keeps filling while all slots are busy
+            self._batch_slots.acquire()
+            self._executor.submit(self._process_batch_in_slot, self._collect_batch(first))
+
+    def _process_batch_in_slot(self, batch):
+        try:
+            self._process_batch(batch)
+        finally:
+            self._batch_slots.release()
+
+    @staticmethod
+    def _start_measurement():
+        """Opens the measurement window of a batch or returns None if the energy can not be measured."""
+        try:
+            return start_calc_sci_score()
+        except (RuntimeError, OSError, ValueError) as e:
+            logger.warning(f"Scheduler: starting the energy measurement failed: {e}")
+            return None
+
+    def _collect_batch(self, first):
+        """Waits up to max_wait_ms after the first prompt for further prompts until the batch is full."""
+        batch = [first]
+        deadline = time.time() + self._max_wait_ms / 1000
+        while len(batch) < self._max_batch_size:
+            remaining = deadline - time.time()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _process_batch(self, batch):
+        questions = [question for question, _, _, _ in batch]
+        measure_sci = any(measure for _, measure, _, _ in batch)
+        deadlines = [deadline for _, _, _, deadline in batch]
+        logger.debug("Scheduler: processing batch of %d prompts", len(batch))
+
+        measurement = None
+        try:
+            if self._backend is self._llm:
+                with self._model_lock:
+                    # the energy is measured without the wait for the model lock, another batch consumes it meanwhile
+                    measurement = self._start_measurement() if measure_sci else None
+                    start_time = time.time()
+                    results = self._llm.answer_questions(questions, deadlines=deadlines)
+                    end_time = time.time()
+            else:
+                measurement = self._start_measurement() if measure_sci else None
+                start_time = time.time()
+                results = self._backend.answer_questions(questions, deadlines=deadlines)
+                end_time = time.time()
+            if results is None:
+                results = [None] * len(batch)
+
+            duration_ms = (end_time - start_time) * 1000
+            completion_tokens = [result.completion_tokens if result is not None else 0 for result in results]
+            prompt_tokens = [result.prompt_tokens if result is not None else 0 for result in results]
+            tokens_per_second = sum(completion_tokens) / (duration_ms / 1000) if duration_ms > 0 else 0.0
+
+            sci_score = None
+            if measurement is not None:
+                # all prompts of the batch share the energy attributed to the batch in proportion to their generated tokens,
+                # so every prompt of the batch has the same carbon per token. Concurrent batches and streams share the
+                # measured energy in proportion to the tokens they processed.
+                try:
+                    sci_score = end_calc_sci_score(measurement, max(sum(completion_tokens), 1), self._country_code,
+                                                   energy_callback=lambda joules: observe_energy(joules, len(batch), sum(completion_tokens)),
+                                                   end_time=end_time, tokens=sum(prompt_tokens) + sum(completion_tokens))
+                except (RuntimeError, OSError, ValueError) as e:
+                    # the answers are still valid, the prompts get no sci score
+                    logger.warning(f"Scheduler: measuring the energy of the batch failed: {e}")
+        except Exception as e:
+            cancel_calc_sci_score(measurement)
+            logger.error(f"Scheduler: batch of {len(batch)} prompts failed: {e}")
+            for _, _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        GENERATED_TOKENS.inc(sum(completion_tokens))
+        TOKENS_PER_SECOND.observe(tokens_per_second)
+        self._last_batch = {
+            "batch_size": len(batch),
+            "duration_ms": duration_ms,
+            "completion_tokens": sum(completion_tokens),
+            "tokens_per_second": tokens_per_second,
+            "sci_score": sci_score,
+        }
+        logger.debug("Scheduler: batch of %d prompts took %.0f ms, %.2f tokens/s", len(batch), duration_ms, tokens_per_second)
+
+        for (_, measure, future, _), result in zip(batch, results):
+            future.set_result({
+                "answer": result.text if result is not None else None,
+                "sci_score": sci_score if measure else None,
+                "energy_source": measurement.source if measure and measurement is not None else None,
+                "prompt_tokens": result.prompt_tokens if result is not None else None,
+                "completion_tokens": result.completion_tokens if result is not None else 0,
+                "finish_reason": result.finish_reason if result is not None else None,
+                "timings_ms": result.timings_ms if result is not None else None,
+                "assisted": result.assisted if result is not None else None,
+                "batch_size": len(batch),
+                "tokens_per_second": tokens_per_second,
+            })
+
+    @property
+    def max_batch_size(self):
+        return self._max_batch_size
+
+    @property
+    def max_wait_ms(self):
+        return self._max_wait_ms
+
+    @property
+    def max_concurrent_batches(self):
+        return self._max_concurrent_batches
+
+    @property
+    def model_lock(self):
+        """Lock which is held while the llm processes a batch, other users of the llm have to acquire it as well."""
+        return self._model_lock
+
+    @property
+    def last_batch(self):
+        return self._last_batch
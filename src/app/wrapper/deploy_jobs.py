@@ -0,0 +1,112 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_READY = "ready"
+JOB_FAILED = "failed"
+
+
+class DeployJob:
+    """State of a deployment which is loaded in the background, the loading phases are reported by enter_phase."""
+
+    def __init__(self, name:str, model:str):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.model = model
+        self.created = time.time()
+        self._lock = threading.Lock()
+        self._state = JOB_QUEUED
+        self._phase_started = self.created
+        self._phases = []
+        self._error = None
+
+    def enter_phase(self, phase:str):
+        """Finishes the current phase and starts the next one."""
+        with self._lock:
+            now = time.time()
+            self._phases.append({"phase": self._state, "duration_s": now - self._phase_started})
+            self._state = phase
+            self._phase_started = now
+        logger.info(f"DeployJob {self.id}: model {self.model} entered phase '{phase}'")
+
+    def finish(self):
+        self.enter_phase(JOB_READY)
+
+    def fail(self, error:str):
+        with self._lock:
+            self._error = error
+        self.enter_phase(JOB_FAILED)
+
+    @property
+    def state(self):
+        return self._state
+
+    @property
+    def done(self):
+        return self._state in (JOB_READY, JOB_FAILED)
+
+    def describe(self):
+        with self._lock:
+            phases = list(self._phases)
+            if not self.done:
+                phases.append({"phase": self._state, "duration_s": time.time() - self._phase_started})
+            return {
+                "job_id": self.id,
+                "name": self.name,
+                "model": self.model,
+                "state": self._state,
+                "error": self._error,
+                "phases": [{"phase": p["phase"], "duration_s": round(p["duration_s"], 3)} for p in phases],
+                "total_duration_s": round(sum(p["duration_s"] for p in phases), 3),
+            }
+
+
+class DeployJobManager:
+    """Runs deployments on a background thread and keeps the state of the last max_jobs jobs for polling."""
+
+    def __init__(self, max_workers:int=1, max_jobs:int=100):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="deploy")
+        self._jobs = OrderedDict()
+        self._max_jobs = max_jobs
+        self._lock = threading.Lock()
+
+    def submit(self, name:str, model:str, run):
+        """Creates a job and runs it in the background.
+
+        Args:
+            name (str): name of the deployment
+            model (str): the hugging face model which is deployed
+            run (Callable[[DeployJob], None]): loads the model and reports the phases to the job, raises if the deployment failed
+
+        Returns:
+            DeployJob: the queued job
+        """
+        job = DeployJob(name, model)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self._max_jobs:
+                self._jobs.popitem(last=False)
+        self._executor.submit(self._run, job, run)
+        return job
+
+    def _run(self, job, run):
+        try:
+            run(job)
+            job.finish()
+        except Exception as e:
+            logger.error(f"DeployJob {job.id}: deployment of {job.model} failed: {e}")
+            job.fail(str(e))
+
+    def get(self, job_id:str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def describe(self):
+        with self._lock:
+            return [job.describe() for job in self._jobs.values()]
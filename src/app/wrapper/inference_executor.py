@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    def __init__(self, message, queue_depth):
+        super().__init__(message)
+        self.queue_depth = queue_depth
+
+
+class InferenceExecutor:
+    """Runs blocking inference calls on a dedicated thread pool behind a bounded admission queue,
+    so that the event loop of the API stays responsive while a prompt is processed."""
+
+    def __init__(self, max_queue_size:int=8, max_workers:int=1):
+        self._max_queue_size = max_queue_size
+        self._max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._last_wait_time_ms = 0.0
+
+    def submit(self, func, *args, **kwargs):
+        """Admits the call into the queue and schedules it on the inference threads without waiting for it.
+
+        Args:
+            func (Callable): blocking function, e.g. LLMWrapper.get_answer
+            *args, **kwargs: arguments which are passed to func
+
+        Raises:
+            QueueFullError: if max_queue_size calls are already waiting for execution
+
+        Returns:
+            concurrent.futures.Future: resolves to the result of func and the time in ms the call waited in the queue
+        """
+        with self._lock:
+            if self._queued >= self._max_queue_size:
+                logger.warning(f"Executor: rejected request because the queue is full ({self._queued} waiting)")
+                raise QueueFullError("The inference queue is full.", self._queued)
+            self._queued += 1
+        enqueue_time = time.time()
+
+        def execute():
+            wait_time_ms = (time.time() - enqueue_time) * 1000
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._last_wait_time_ms = wait_time_ms
+            try:
+                return func(*args, **kwargs), wait_time_ms
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        return self._executor.submit(execute)
+
+    def cancel(self, future):
+        """Cancels a submitted call which did not start yet and releases its queue slot.
+
+        Returns:
+            bool: True if the call was cancelled before it started
+        """
+        if future.cancelled() or future.cancel():
+            with self._lock:
+                self._queued -= 1
+            return True
+        return False
+
+    async def run(self, func, *args, **kwargs):
+        """Admits the call into the queue and awaits its execution on the inference thread.
+
+        Raises:
+            QueueFullError: if max_queue_size calls are already waiting for execution
+
+        Returns:
+            Tuple[Any, float]: the result of func and the time in ms the call waited in the queue
+        """
+        future = self.submit(func, *args, **kwargs)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # a call which never reached the inference thread releases its queue slot
+            self.cancel(future)
+            logger.info("Executor: caller stopped waiting for the inference result")
+            raise
+
+    def stats(self):
+        """Returns the current load of the executor.
+
+        Returns:
+            Dict[str, Any]: number of waiting and running calls, the queue limit and the last wait time in ms
+        """
+        with self._lock:
+            return {
+                "queue_depth": self._queued,
+                "in_flight": self._running,
+                "max_queue_size": self._max_queue_size,
+                "last_wait_time_ms": round(self._last_wait_time_ms, 3),
+            }
+
+    @property
+    def queue_depth(self):
+        return self._queued
+
+    @property
+    def in_flight(self):
+        return self._running
+
+    def shutdown(self, wait:bool=True):
+        """Stops the worker threads of the executor."""
+        self._executor.shutdown(wait=wait)
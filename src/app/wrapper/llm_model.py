@@ -1,42 +1,286 @@
+import copy
 import gc
 import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass, field
 
 import psutil  # for memory monitoring
-from transformers import pipeline
+import torch
+from transformers import (AutoConfig, AutoModelForCausalLM, AutoTokenizer,
+                          DynamicCache, StoppingCriteria, StoppingCriteriaList,
+                          TextIteratorStreamer, pipeline)
 
-logging.basicConfig(
-    filename="llm.log",
-    filemode="w",
-    level=logging.DEBUG,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-)
+from src.app.metrics.metrics import (observe_generation, observe_probe,
+                                     observe_restart)
+from src.app.wrapper.prefix_cache import PrefixCache
+from src.app.wrapper.snapshot_store import SnapshotStore
+
+logger = logging.getLogger(__name__)
 
 STATUS_NOT_READY = "not ready"
 STATUS_READY = "ready"
 STATUS_FAILURE = "failure"
 STATUS_IDLE = "idle"
 
+# phases of download_model which are reported to the progress callback
+PHASE_RESOLVING = "resolving"
+PHASE_LOADING_WEIGHTS = "loading weights"
+PHASE_WARMUP = "warmup"
+PHASE_SNAPSHOT = "saving snapshot"
+PHASE_QUANTIZING = "quantizing"
+PHASE_LOADING_DRAFT = "loading draft"
+PHASE_CALIBRATING_DRAFT = "calibrating draft"
+
+# quantization modes of the deployment config, which are applied after the weights are loaded
+QUANTIZATION_DYNAMIC_INT8 = "dynamic_int8"
+SUPPORTED_QUANTIZATIONS = {QUANTIZATION_DYNAMIC_INT8}
+
+# arguments of the deployment config which are applied by the LLMModel and not passed to pipeline()
+CPU_ARGS = ("num_threads", "num_interop_threads", "cpu_affinity")
+MODEL_ONLY_DEPLOYMENT_ARGS = {"quantization", *CPU_ARGS}
+# affinity of the process at start, e.g. restricted by taskset, which is used by deployments without an affinity
+_DEFAULT_CPU_AFFINITY = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else None
+# the model and the version of its cpu config which were applied last to a thread
+_applied_cpu_config = threading.local()
+
+# interval of the watchdogs which cancel requests that run past their deadline
+DEADLINE_CHECK_INTERVAL_S = 1
+# time after the deadline before the watchdog cancels a request which did not stop by itself
+DEADLINE_GRACE_S = 5
+# time a cancelled request has to stop before the model counts as hung and is restarted
+CANCELLED_REQUEST_TIMEOUT_S = 30
+# time the replicas wait for the generations of the server process to finish before they are forked
+QUIESCE_TIMEOUT_S = 30
+
+# tiers of restart, a soft restart keeps the weights and only a failed soft restart reloads the model
+RESTART_SOFT = "soft"
+RESTART_FULL = "full"
+# time a soft restart waits for the cancelled generations to stop
+SOFT_RESTART_TIMEOUT_S = 10
+# share of the footprint of the model which a shutdown has to return to the system, models below the minimum are not
+# checked because their small allocations stay with the allocator
+SHUTDOWN_MIN_RELEASED_SHARE = 0.5
+SHUTDOWN_CHECK_MIN_BYTES = 64 * 1024 * 1024
+
+# defaults of the responsiveness probe, which runs on every deploy and restart
+DEFAULT_PROBE_CONFIG = {
+    "question": "What's the capital of Germany?",
+    "max_new_tokens": 1,
+    "timeout_s": 30,
+    "warmup": False,
+    "warmup_prompt_tokens": [32, 256],
+    "warmup_batch_sizes": [1],
+}
+
+# defaults of the draft model for assisted generation
+DEFAULT_DRAFT_CONFIG = {
+    "model": None,
+    "num_assistant_tokens": 5,
+    "calibration_tokens": 32,
+    "revision": None,
+}
+
+# finish reasons of a generation
+FINISH_STOP = "stop"
+FINISH_LENGTH = "length"
+FINISH_CANCELLED = "cancelled"
+FINISH_TRUNCATED = "truncated"  # the deadline of the request passed, the answer is partial
+
+# timings of a generation in milliseconds
+TIMING_TEMPLATE = "template"
+TIMING_TOKENIZATION = "tokenization"
+TIMING_PREFILL = "prefill"
+TIMING_DECODE = "decode"
+TIMING_DETOKENIZATION = "detokenization"
+
+# sampling arguments which are dropped from the prompting config for the greedy probe
+SAMPLING_ARGS = {"temperature", "top_k", "top_p", "typical_p", "min_p", "min_new_tokens", "min_length", "max_length"}
+
+# arguments of the prompting config which are only understood by the pipeline and not by model.generate
+PIPELINE_ONLY_ARGS = {
+    "return_full_text", "return_tensors", "return_text", "return_type", "clean_up_tokenization_spaces",
+    "prefix", "handle_long_generation", "stop_sequence", "truncation", "add_special_tokens", "padding",
+    "continue_final_message",
+}
+# placeholder for the question while rendering the chat template to find the prefix shared by all prompts
+_PROMPT_PLACEHOLDER = "\x00question\x00"
+
 class RestartError(Exception):
     def __init__(self, message, errors):
         super().__init__(message)
         self.errors = errors
 
 
+class TimedTextStreamer(TextIteratorStreamer):
+    """TextIteratorStreamer which counts the generated tokens and remembers when the first one arrived.
+    The tokens are decoded under the tokenizer lock of the model, if one is given."""
+
+    def __init__(self, tokenizer, tokenizer_lock=None, **kwargs):
+        super().__init__(tokenizer, **kwargs)
+        self.token_count = 0
+        self.first_token_time = None
+        self._tokenizer_lock = tokenizer_lock or threading.RLock()
+
+    def put(self, value):
+        if not (self.skip_prompt and self.next_tokens_are_prompt):
+            if self.first_token_time is None:
+                self.first_token_time = time.time()
+            self.token_count += value.numel()
+        with self._tokenizer_lock:
+            super().put(value)
+
+    def end(self):
+        with self._tokenizer_lock:
+            super().end()
+
+
+class FirstTokenTimer:
+    """Minimal streamer for model.generate which only remembers when the first new token was generated."""
+
+    def __init__(self):
+        self.first_token_time = None
+        self._prompt_received = False
+
+    def put(self, value):
+        if not self._prompt_received:
+            self._prompt_received = True
+        elif self.first_token_time is None:
+            self.first_token_time = time.time()
+
+    def end(self):
+        pass
+
+
+@dataclass
+class GenerationResult:
+    """Result of a generation, the text is decoded from the generated tokens only."""
+    text: str
+    prompt_tokens: int
+    completion_tokens: int
+    finish_reason: str
+    timings_ms: dict = field(default_factory=dict)
+    assisted: dict = None  # draft tokens, acceptance rate and speedup if the draft model was used
+
+    def to_dict(self):
+        return asdict(self)
+
+
+@dataclass(eq=False)  # compared and hashed by identity, so it can be tracked in a set while it is generated
+class RequestContext:
+    """State of a single request, every call has its own context so concurrent calls do not share it.
+    The generation of the request stops after the current token once its deadline passed or it was cancelled."""
+    question: str = None
+    message: object = None  # the question or the chat messages for the template
+    prompt: str = None
+    prompting_config: dict = None
+    result: GenerationResult = None
+    deadline: float = None  # time.time() after which the generation stops and the partial answer is returned
+    start_time: float = field(default_factory=time.time)
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+    cancelled_at: float = None
+    stopped_by: str = None  # FINISH_TRUNCATED or FINISH_CANCELLED if the generation was stopped early
+    stopped_length: int = None  # length of the generated sequence when it was stopped
+
+    def cancel(self):
+        if self.cancelled_at is None:
+            self.cancelled_at = time.time()
+        self.cancel_event.set()
+
+    @property
+    def expired(self):
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def overdue(self, max_runtime_s:float=None, grace_s:float=DEADLINE_GRACE_S, now:float=None):
+        """True if the request was not cancelled yet and runs grace_s past its deadline or,
+        without a deadline, longer than max_runtime_s (dreaming)."""
+        now = now if now is not None else time.time()
+        if self.cancelled_at is not None:
+            return False
+        if self.deadline is not None:
+            return now > self.deadline + grace_s
+        return max_runtime_s is not None and now - self.start_time > max_runtime_s
+
+
+class CancellationCriteria(StoppingCriteria):
+    """Stops all running generations after the current token once the cancel event is set."""
+
+    def __init__(self, cancel_event:threading.Event):
+        self._cancel_event = cancel_event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self._cancel_event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+class RequestCriteria(StoppingCriteria):
+    """Stops the rows of a batch whose request passed its deadline or was cancelled, the other rows continue."""
+
+    def __init__(self, contexts):
+        self._contexts = contexts
+
+    def __call__(self, input_ids, scores, **kwargs):
+        stops = []
+        for context in self._contexts:
+            if context.stopped_by is None:
+                if context.expired:
+                    context.stopped_by = FINISH_TRUNCATED
+                elif context.cancel_event.is_set():
+                    context.stopped_by = FINISH_CANCELLED
+                if context.stopped_by is not None:
+                    context.stopped_length = input_ids.shape[1]
+            stops.append(context.stopped_by is not None)
+        return torch.tensor(stops, dtype=torch.bool, device=input_ids.device)
+
+
 class LLMModel:
-    def __init__(self, modeltyp:str, model:str, prompting_config:dict, deployment_config:dict, **other_configs):
+    def __init__(self, modeltyp:str, model:str, prompting_config:dict, deployment_config:dict, prefix_cache_config:dict=None, snapshot_config:dict=None, probe_config:dict=None, draft_config:dict=None, **other_configs):
         self._modeltyp = modeltyp
         self._model = model
         self._prompting_config = prompting_config
         self._deployment_config = deployment_config
+        self._quantization = deployment_config.get("quantization")
+        self._cpu_config = {arg: deployment_config.get(arg) for arg in CPU_ARGS}
+        self._cpu_config_version = 0
+        self._cpu_settings = {}
         self._other_configs = other_configs
+        prefix_cache_config = prefix_cache_config or {}
+        self._prefix_cache = None
+        if other_configs.get("uses_chat_template") and prefix_cache_config.get("enabled", True):
+            self._prefix_cache = PrefixCache(max_memory_bytes=int(prefix_cache_config.get("max_memory_mb", 256) * 1e6))
+        snapshot_config = snapshot_config or {}
+        self._snapshot_store = SnapshotStore(snapshot_config["directory"]) if snapshot_config.get("directory") else None
+        self._loaded_from_snapshot = False
+        self._probe_config = {**DEFAULT_PROBE_CONFIG, **(probe_config or {})}
+        self._probe_baseline_ms = None
+        self._last_probe_ms = None
+        self._draft_config = {**DEFAULT_DRAFT_CONFIG, **(draft_config or {})}
+        self._draft_model = None
+        self._draft_hooks = []
+        self._draft_baseline_ms_per_token = None
+        self._draft_stats = {"generations": 0, "draft_tokens": 0, "accepted_tokens": 0}
+        self._draft_stats_lock = threading.Lock()
+        self._forward_counts = threading.local()
         self._pipe = None
-        self._message = None
-        self._answer = None
-        self._prompt = None
+        # the context of the last answer_question of each thread, for the message, prompt and answer properties
+        self._last_request = threading.local()
+        # fast tokenizers fail with "Already borrowed" if they are used by several threads at once
+        self._tokenizer_lock = threading.RLock()
         self._status = STATUS_NOT_READY# Standardstatus auf "not ready" gesetzt
         self._process = psutil.Process()
-        self._init_memory_usage = self._process.memory_info().rss
         self._restart_attempt = 0
+        self._restart_count = 0
+        self._restart_timings = {}
+        self._cancel_event = threading.Event()
+        self._stopping_criteria = StoppingCriteriaList([CancellationCriteria(self._cancel_event)])
+        self._active_requests = set()
+        self._active_requests_lock = threading.Lock()
+        self._active_generations = 0
+        self._generations_finished = threading.Condition()
+        self._load_timings = {}
+        self._load_rss_bytes = None
+        self._last_error = None
 
 
     _status_codes = {
@@ -46,121 +290,819 @@ class LLMModel:
         "idle": "LLM Wrapper has no deployed LLM and is waiting for a new deployment"
     }
 
-    def download_model(self):
+    def download_model(self, progress_callback=None):
         """
-        downloads a model from huggingface via the api with self.modeltyp and self.model
+        downloads a model from huggingface via the api with self.modeltyp and self.model.
+        If a snapshot store is configured, the model is loaded from its local snapshot instead
+        and a snapshot is stored after the first successful load.
+        A configured quantization is applied after the weights are loaded, the snapshot keeps the unquantized weights.
+        A configured draft model is loaded next to the model and used for assisted generation of single prompts.
+
+        Args:
+            progress_callback (Callable[[str], None], optional): is called with the name of each loading phase when it starts
         """
+        self._load_timings = {}
+        self._last_error = None
+        self._probe_baseline_ms = None
+        rss_before_load = self._process.memory_info().rss
         try:
-            self._pipe = pipeline(
-                self.modeltyp,
-                model=self.model,
-                **self._deployment_config
-            )
-            if self._isresponsive():
+            snapshot_path = self._snapshot_store.find(self.model, self._deployment_config) if self._snapshot_store is not None else None
+            source = snapshot_path or self.model
+            self._loaded_from_snapshot = snapshot_path is not None
+
+            with self._load_phase(PHASE_RESOLVING, progress_callback):
+                AutoConfig.from_pretrained(source, trust_remote_code=self._deployment_config.get("trust_remote_code", False))
+
+            with self._load_phase(PHASE_LOADING_WEIGHTS, progress_callback):
+                _applied_cpu_config.owner = None
+                self._apply_cpu_config(strict=True)
+                self._pipe = pipeline(
+                    self.modeltyp,
+                    model=source,
+                    **{arg: value for arg, value in self._deployment_config.items() if arg not in MODEL_ONLY_DEPLOYMENT_ARGS}
+                )
+
+            if self._draft_config["model"] is not None:
+                with self._load_phase(PHASE_LOADING_DRAFT, progress_callback):
+                    self._load_draft()
+
+            save_snapshot = self._snapshot_store is not None and snapshot_path is None
+            if self._quantization is not None:
+                if save_snapshot:
+                    # quantized layers can not be stored with save_pretrained, so the snapshot is taken before
+                    with self._load_phase(PHASE_SNAPSHOT, progress_callback):
+                        self._save_snapshot()
+                    save_snapshot = False
+                with self._load_phase(PHASE_QUANTIZING, progress_callback):
+                    self._quantize()
+
+            with self._load_phase(PHASE_WARMUP, progress_callback):
+                if self._probe_config["warmup"]:
+                    self._warmup()
+                is_responsive = self._isresponsive()
+
+            if is_responsive and self._draft_model is not None:
+                with self._load_phase(PHASE_CALIBRATING_DRAFT, progress_callback):
+                    self._calibrate_draft()
+
+            if is_responsive and save_snapshot:
+                with self._load_phase(PHASE_SNAPSHOT, progress_callback):
+                    self._save_snapshot()
+
+            self._load_rss_bytes = self._process.memory_info().rss - rss_before_load
+            if is_responsive:
                 self._status = STATUS_READY
                 self._restart_attempt = 0
-                logging.info(f"Modell: {self._status_codes[self.status]}, model = {self.model}")
+                logger.info(f"Modell: {self._status_codes[self.status]}, model = {self.model}")
             else:
                 self._status = STATUS_NOT_READY 
-                logging.info(f"Model: Downloaded LLM is unresponsive. Status set to '{self.status}'.")
+                logger.info(f"Model: Downloaded LLM is unresponsive. Status set to '{self.status}'.")
         except Exception as e:
             self._status = STATUS_FAILURE
-            logging.error(f"Modell: Failed to download the LLM-Model {self.model} because of following Exception: {e}")
-            logging.error(f"Modell: {self._status_codes[self.status]}, model = {self.model}")
+            self._last_error = str(e)
+            logger.error(f"Modell: Failed to download the LLM-Model {self.model} because of following Exception: {e}")
+            logger.error(f"Modell: {self._status_codes[self.status]}, model = {self.model}")
+
+    def _save_snapshot(self):
+        """Stores the loaded pipeline in the snapshot store, a failure only costs the faster next load."""
+        try:
+            self._snapshot_store.save(self.model, self._deployment_config, self._pipe)
+        except Exception as e:
+            logger.error(f"Modell: Unable to store a snapshot of {self.model}: {e}")
+
+    def configure_cpu(self, **cpu_config):
+        """Replaces the given thread counts or cpu affinity of the deployment config and applies them to the calling thread.
+        Generating threads pick up the new settings with their next generation."""
+        self._cpu_config.update({arg: value for arg, value in cpu_config.items() if arg in CPU_ARGS and value is not None})
+        self._cpu_config_version += 1
+        self._apply_cpu_config(strict=True)
+
+    def _apply_cpu_config(self, strict:bool=False):
+        """Applies the thread counts and the cpu affinity of the deployment to the calling thread.
+
+        The affinity of a Linux thread and torch's OpenMP thread count are settings of the calling thread
+        and the worker threads torch starts for an operation inherit the affinity of that thread,
+        so the settings are applied in every thread which runs the model, again only if another model ran in between.
+        The number of inter-op threads can only be set once per process before any inter-op work.
+
+        Raises:
+            ValueError: if strict and the affinity is not valid on this machine
+        """
+        if getattr(_applied_cpu_config, "owner", None) == (id(self), self._cpu_config_version):
+            return
+        _applied_cpu_config.owner = (id(self), self._cpu_config_version)
+        num_threads = self._cpu_config["num_threads"]
+        num_interop_threads = self._cpu_config["num_interop_threads"]
+        cpu_affinity = self._cpu_config["cpu_affinity"] or _DEFAULT_CPU_AFFINITY
+
+        if cpu_affinity:
+            if hasattr(os, "sched_setaffinity"):
+                try:
+                    os.sched_setaffinity(0, cpu_affinity)
+                except (OSError, ValueError) as e:
+                    logger.error(f"Modell: Unable to pin {self.model} to the cores {cpu_affinity}: {e}")
+                    if strict:
+                        raise ValueError(f"The cpu affinity {cpu_affinity} is not valid on this machine: {e}")
+            else:
+                logger.warning("Modell: Setting the cpu affinity is not supported on this platform.")
+        if num_threads and torch.get_num_threads() != num_threads:
+            torch.set_num_threads(num_threads)
+        if num_interop_threads and torch.get_num_interop_threads() != num_interop_threads:
+            try:
+                torch.set_num_interop_threads(num_interop_threads)
+            except RuntimeError as e:
+                logger.warning(f"Modell: Unable to set {num_interop_threads} inter-op threads, {torch.get_num_interop_threads()} are used: {e}")
+
+        self._cpu_settings = {
+            "num_threads": torch.get_num_threads(),
+            "num_interop_threads": torch.get_num_interop_threads(),
+            "cpu_affinity": sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else None,
+        }
+
+    def _quantize(self):
+        """Replaces the linear layers of the loaded model and of the draft model by dynamically quantized int8 layers.
+        The weights are stored as int8 and the activations are quantized per batch, which only works on the CPU
+        and with float32 activations, so the remaining layers are converted to float32 first.
+
+        Raises:
+            ValueError: if the quantization is not supported or the model is not placed on the CPU
+        """
+        if self._quantization not in SUPPORTED_QUANTIZATIONS:
+            raise ValueError(f"Unsupported quantization '{self._quantization}', supported are {sorted(SUPPORTED_QUANTIZATIONS)}.")
+        for name, model in ((self.model, self._pipe.model), (self._draft_config["model"], self._draft_model)):
+            if model is None:
+                continue
+            if model.device.type != "cpu":
+                raise ValueError(f"Quantization '{self._quantization}' is only supported on the CPU, the model is placed on {model.device}.")
+            if model.dtype != torch.float32:
+                logger.info(f"Modell: Converting {name} from {model.dtype} to torch.float32 for the int8 quantization.")
+                model.float()
+            torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+            logger.info(f"Modell: Quantized the linear layers of {name} to int8.")
+
+    def _load_draft(self):
+        """Loads the draft model in the dtype of the model and places it on the device of the model.
+        Assisted generation compares the tokens of both models, so the draft model needs the same tokenizer.
+
+        Raises:
+            ValueError: if the vocabulary of the draft model differs from the one of the model
+        """
+        self._shutdown_draft()
+        source = self._draft_config["model"]
+        load_args = {arg: self._deployment_config[arg] for arg in ("torch_dtype", "trust_remote_code") if arg in self._deployment_config}
+        revision = self._draft_config["revision"]
+        if AutoTokenizer.from_pretrained(source, revision=revision, trust_remote_code=load_args.get("trust_remote_code", False)).get_vocab() != self._pipe.tokenizer.get_vocab():
+            raise ValueError(f"The draft model {source} does not use the tokenizer of {self.model}.")
+        draft_model = AutoModelForCausalLM.from_pretrained(source, revision=revision, **load_args).to(self._pipe.model.device)
+        draft_model.eval()
+        draft_model.generation_config.num_assistant_tokens = self._draft_config["num_assistant_tokens"]
+        self._draft_model = draft_model
+        # every forward of the draft model proposes one token, every forward of the model verifies the proposed tokens
+        self._draft_hooks = [
+            self._pipe.model.register_forward_hook(lambda *args: self._count_forward("model")),
+            draft_model.register_forward_hook(lambda *args: self._count_forward("draft")),
+        ]
+        logger.info(f"Modell: Loaded the draft model {source} for assisted generation.")
+
+    def _count_forward(self, model):
+        counts = getattr(self._forward_counts, "counts", None)
+        if counts is not None:
+            counts[model] += 1
+
+    def _calibrate_draft(self):
+        """Measures the time per token of the model without draft model as baseline for the speedup of assisted generation."""
+        tokens = self._draft_config["calibration_tokens"]
+        config = {**self._probe_prompting_config(), "max_new_tokens": tokens, "min_new_tokens": tokens}
+        config.pop("max_time", None)
+        result = self._generate_batch([self._render_prompt(self._probe_config["question"])[1]], prompting_config=config, use_draft=False)
+        generation_ms = result[0].timings_ms[TIMING_PREFILL] + result[0].timings_ms[TIMING_DECODE]
+        self._draft_baseline_ms_per_token = generation_ms / max(result[0].completion_tokens, 1)
+        logger.info(f"Modell: {self.model} needs {self._draft_baseline_ms_per_token:.1f} ms per token without draft model.")
+
+    def _shutdown_draft(self):
+        for hook in self._draft_hooks:
+            hook.remove()
+        self._draft_hooks = []
+        self._draft_model = None
+        self._draft_baseline_ms_per_token = None
+
+    @contextmanager
+    def _load_phase(self, phase, progress_callback=None):
+        """Reports the start of a loading phase and records its duration in seconds."""
+        if progress_callback is not None:
+            progress_callback(phase)
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self._load_timings[phase] = time.time() - start_time
 
 
     def shutdown(self):
-        """Tries to shut down the LLM and check resource usage."""
+        """Tries to shut down the LLM and checks that the memory of its weights was released.
+        Only the footprint of this model is compared, the other deployments of the process keep their memory."""
         try:
+            rss_before = self._process.memory_info().rss
+            footprint = self.memory_footprint()
             self._status = STATUS_NOT_READY
+            self._shutdown_draft()
             del self._pipe
+            if self._prefix_cache is not None:
+                self._prefix_cache.clear()
             gc.collect()
             self._pipe = None
 
-            # Erhöht den Grenzwert auf 40% anstatt 20%
-            memory_threshold = self._init_memory_usage * 1.4
-
-            if self._process.memory_info().rss > memory_threshold:
-                logging.error(f"Modell: Shutdown failed: memory usage of {self._process.memory_info().rss / 1e6} MBexceeds the threshold of {memory_threshold / 1e6} MB.")
+            released = rss_before - self._process.memory_info().rss
+            if footprint >= SHUTDOWN_CHECK_MIN_BYTES and released < footprint * SHUTDOWN_MIN_RELEASED_SHARE:
+                logger.error(f"Modell: Shutdown failed: only {released / 1e6:.0f} MB of the {footprint / 1e6:.0f} MB of the model were released.")
                 self._status = STATUS_FAILURE
             else:
                 self._status = STATUS_IDLE
-                logging.info("Modell: Shutdown completed successfully.")
+                logger.info("Modell: Shutdown completed successfully.")
         except Exception as e:
-            logging.error(f"Modell: Error during shutdown: {e}")
+            logger.error(f"Modell: Error during shutdown: {e}")
 
             self._status = STATUS_FAILURE
 
     def restart(self):
-        """Restarts the llm, attempts up to 3 times."""
+        """Restarts the llm, attempts up to 3 times.
+
+        First a soft restart cancels the running generations and keeps the loaded weights,
+        only if the model is still unresponsive afterwards the model is shut down and loaded again.
+        The duration of each tier is recorded in restart_timings.
+        """
         if self._restart_attempt >= 3:
             self._status = STATUS_FAILURE
-            logging.error(f"Modell: failed to restart the llm after {self._restart_attempt} attempts.")
+            logger.error(f"Modell: failed to restart the llm after {self._restart_attempt} attempts.")
             return
 
         if self.status == STATUS_IDLE or self._pipe is None:
-            logging.info("Modell: Restart not possible, because no LLM is running.")
+            logger.info("Modell: Restart not possible, because no LLM is running.")
             return
 
+        self._restart_attempt +=  1
+        self._restart_count += 1
+        self._restart_timings = {}
+        logger.info(f"Modell: Restarting the llm (attempt {self._restart_attempt}).")
+
+        with self._restart_tier(RESTART_SOFT):
+            soft_restarted = self._soft_restart()
+        if soft_restarted:
+            self._status = STATUS_READY
+            self._restart_attempt = 0
+            logger.info(f"Modell: Soft restart of {self.model} succeeded, the weights were kept.")
+            return
+
+        logger.warning(f"Modell: Soft restart of {self.model} failed, reloading the model.")
         try:
-            self._restart_attempt +=  1
-            logging.info(f"Modell: Restarting the llm (attempt {self._restart_attempt}).")
-            self.shutdown()
-            self.download_model()
+            with self._restart_tier(RESTART_FULL):
+                self.shutdown()
+                self.download_model()
         except Exception as e:
-            logging.error(f"Modell: Error when restarting the llm {self.model}, exception: {e}")
-            logging.error(f"Modell: Attempt {self._restart_attempt} failed. Retrying...")
+            logger.error(f"Modell: Error when restarting the llm {self.model}, exception: {e}")
+            logger.error(f"Modell: Attempt {self._restart_attempt} failed. Retrying...")
             self.restart()
 
-    def _isresponsive(self):
-        """Checks if the model can respond to queries."""
-        example = "What's the capital of Germany?"
-        logging.info("Modell: Model responsiveness check started.")
+    def _soft_restart(self, timeout_s:float=SOFT_RESTART_TIMEOUT_S):
+        """Cancels the running generations, resets the generation state and checks if the model responds again.
 
+        Returns:
+            bool: True if the model is responsive with the kept weights
+        """
+        self._status = STATUS_NOT_READY
+        self._cancel_event.set()
         try:
-            llmresponse = self.answer_question(example)
+            with self._generations_finished:
+                stopped = self._generations_finished.wait_for(lambda: self._active_generations == 0, timeout=timeout_s)
+        finally:
+            self._cancel_event.clear()
+        if not stopped:
+            logger.warning(f"Modell: {self._active_generations} generations did not stop within {timeout_s} seconds.")
+            return False
+
+        if self._prefix_cache is not None:
+            self._prefix_cache.clear()
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        return self._isresponsive()
+
+    @contextmanager
+    def _restart_tier(self, tier):
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self._restart_timings[tier] = time.time() - start_time
+            observe_restart(tier, self._restart_timings[tier])
+            logger.info(f"Modell: {tier} restart took {self._restart_timings[tier]:.2f} seconds.")
+
+    @contextmanager
+    def quiesced(self, timeout_s:float=QUIESCE_TIMEOUT_S):
+        """Waits until no generation runs and holds the locks of the model until the block ends, so no new generation starts.
+        Replicas are forked within the block: the forked process only inherits the forking thread, a lock which
+        another thread holds at the fork would stay locked in the replica forever.
+
+        Raises:
+            TimeoutError: if the running generations do not finish within timeout_s
+        """
+        with self._generations_finished:
+            if not self._generations_finished.wait_for(lambda: self._active_generations == 0, timeout=timeout_s):
+                raise TimeoutError(f"{self._active_generations} generations did not finish within {timeout_s} seconds.")
+            with self._tokenizer_lock, self._active_requests_lock, self._draft_stats_lock:
+                yield
+
+    @contextmanager
+    def _generation(self):
+        """Tracks a running generation, so a soft restart can wait until all cancelled generations stopped.
+        The cpu settings of the deployment are applied to the generating thread."""
+        self._apply_cpu_config()
+        with self._generations_finished:
+            self._active_generations += 1
+        try:
+            yield
+        finally:
+            with self._generations_finished:
+                self._active_generations -= 1
+                self._generations_finished.notify_all()
+
+    def _isresponsive(self):
+        """Checks if the model can respond to queries with a short greedy probe, which is bounded by the probe timeout.
+        The latency of the first probe after a load is kept as baseline."""
+        example = self._probe_config["question"]
+        timeout_s = self._probe_config["timeout_s"]
+        logger.info("Modell: Model responsiveness check started.")
+
+        result = {}
 
-            if llmresponse is None:
-                logging.warning(f"Modell: The model {self.model} did not provide any response.")
-                return False
-            if isinstance(llmresponse, str):
-                logging.info(f"Modell: The model {self.model} successfully responded: {llmresponse}")
-                return True
+        def probe():
+            try:
+                result["response"] = self.answer_question(example, prompting_config=self._probe_prompting_config())
+            except Exception as e:
+                result["error"] = e
 
-            logging.error(f"Modell: Unexpected response type from the model {self.model}: {type(llmresponse)}")
+        start_time = time.time()
+        probe_thread = threading.Thread(target=probe, name="llm-probe", daemon=True)
+        probe_thread.start()
+        probe_thread.join(timeout_s)
+        if probe_thread.is_alive():
+            logger.error(f"Modell: The model {self.model} did not respond within {timeout_s} seconds.")
             return False
-        except Exception as e:
-            logging.error(f"Modell: Error during model responsiveness check: {e}")
+        if "error" in result:
+            logger.error(f"Modell: Error during model responsiveness check: {result['error']}")
+            return False
+
+        llmresponse = result.get("response")
+        if llmresponse is None:
+            logger.warning(f"Modell: The model {self.model} did not provide any response.")
             return False
+        if not isinstance(llmresponse, GenerationResult):
+            logger.error(f"Modell: Unexpected response type from the model {self.model}: {type(llmresponse)}")
+            return False
+
+        self._last_probe_ms = (time.time() - start_time) * 1000
+        if self._probe_baseline_ms is None:
+            self._probe_baseline_ms = self._last_probe_ms
+        observe_probe(self._last_probe_ms / 1000)
+        logger.info(f"Modell: The model {self.model} successfully responded within {self._last_probe_ms:.0f} ms: {llmresponse.text}")
+        return True
+
+    def _probe_prompting_config(self):
+        """The prompting config for the probe: greedy, only a few new tokens and limited to the probe timeout."""
+        config = {key: value for key, value in self._prompting_config.items() if key not in SAMPLING_ARGS}
+        config.update({"max_new_tokens": self._probe_config["max_new_tokens"], "do_sample": False, "max_time": self._probe_config["timeout_s"]})
+        return config
+
+    def _warmup(self):
+        """Runs prompts of the configured lengths and batch sizes through the model to prime the allocator and kernel caches,
+        so the first real request does not pay for it."""
+        config = self._probe_prompting_config()
+        for batch_size in self._probe_config["warmup_batch_sizes"]:
+            for prompt_tokens in self._probe_config["warmup_prompt_tokens"]:
+                prompt = " ".join(["hello"] * prompt_tokens)
+                start_time = time.time()
+                try:
+                    self._generate_batch([prompt] * batch_size, prompting_config=config)
+                except Exception as e:
+                    logger.warning(f"Modell: Warmup with batch size {batch_size} and {prompt_tokens} prompt tokens failed: {e}")
+                    continue
+                logger.info(f"Modell: Warmup with batch size {batch_size} and {prompt_tokens} prompt tokens took {(time.time() - start_time) * 1000:.0f} ms")
+
+    def answer_question(self, question, prompting_config:dict=None, deadline:float=None):
+        """Generates an answer to the given question with the downloaded LLM.
+
+        Args:
+            question (str): the question for the llm
+            prompting_config (dict, optional): replaces the prompting config of the model for this answer
+            deadline (float, optional): time.time() after which the generation stops with the finish reason "truncated"
+
+        Returns:
+            GenerationResult: the answer with its token counts, finish reason and timings or None if no LLM is loaded
+        """
+        if self._pipe is None:
+            logger.info("Modell: No LLM in pipe")
+            return
+
+        context = RequestContext(question=question, prompting_config=prompting_config, deadline=deadline)
+        self._last_request.context = context
+        start_time = time.time()
+        context.message, context.prompt = self._render_prompt(question)
+        template_ms = (time.time() - start_time) * 1000
+        context.result = self._generate(context.prompt, prompting_config=prompting_config, context=context)
+        context.result.timings_ms[TIMING_TEMPLATE] = template_ms
+
+        return context.result
+
+    def answer_questions(self, questions, deadlines=None):
+        """Generates answers to several questions by running them through the model as one padded batch.
+
+        Args:
+            questions (List[str]): the questions to answer
+            deadlines (List[float], optional): the deadline of each question, a question whose deadline passed
+                stops generating while the rest of the batch continues
+
+        Returns:
+            List[GenerationResult]: the results in the order of the questions or None if no LLM is loaded
+        """
+        if self._pipe is None:
+            logger.info("Modell: No LLM in pipe")
+            return
+
+        deadlines = deadlines or [None] * len(questions)
+        contexts = [RequestContext(question=question, deadline=deadline) for question, deadline in zip(questions, deadlines)]
+        start_time = time.time()
+        for context in contexts:
+            context.message, context.prompt = self._render_prompt(context.question)
+        template_ms = (time.time() - start_time) * 1000
+        results = self._generate_batch([context.prompt for context in contexts], contexts=contexts)
+        for context, result in zip(contexts, results):
+            result.timings_ms[TIMING_TEMPLATE] = template_ms
+            context.result = result
+        return results
+
+    def stream_answer(self, question, deadline:float=None, lock=None):
+        """Generates an answer to the given question and yields the text while the tokens are generated,
+        the generation stops with the finish reason "truncated" once the deadline passed.
+        The lock (e.g. the model lock of the batch scheduler) is held by the generation only, not while the
+        caller consumes the events. Closing the generator cancels the generation.
 
-    def answer_question(self, question):
-        """Generates an answer to the given question with the downloaded LLM."""
+        Yields:
+            dict: {"type": "token", "text": ...} for every decoded piece of text and a final
+                {"type": "done", ...} event with the full answer, the token counts and the timing of the generation
+        """
         if self._pipe is None:
-            logging.info("Modell: No LLM in pipe")
+            logger.info("Modell: No LLM in pipe")
             return
 
-        if "uses_chat_template" in self._other_configs.keys():
-            if self._other_configs["uses_chat_template"]:
-                self._message = [{"role": "user", "content": question}]
-                self._prompt = self._pipe.tokenizer.apply_chat_template(self.message, tokenize=False, add_generation_prompt=True)
-            else: 
-                self._message = question
-                self._prompt = self.message
-
-        else: 
-            self._message = question
-            self._prompt = self.message
-
-        output = self._pipe(self.prompt, **self._prompting_config)
-        parts = output[0]["generated_text"].split("<|assistant|>\n")
-        if len(parts) > 1:
-            self._answer = parts[1]
+        context = RequestContext(question=question, deadline=deadline)
+        start_time = time.time()
+        context.message, context.prompt = self._render_prompt(question)
+        template_ms = (time.time() - start_time) * 1000
+        streamer = TimedTextStreamer(self._pipe.tokenizer, tokenizer_lock=self._tokenizer_lock, skip_prompt=True, skip_special_tokens=True)
+        results = []
+        generation_errors = []
+
+        def generate():
+            try:
+                with lock if lock is not None else nullcontext():
+                    if context.cancel_event.is_set():
+                        streamer.end()  # the stream was closed while waiting for the lock
+                        return
+                    results.append(self._generate(context.prompt, streamer=streamer, context=context))
+            except Exception as e:
+                generation_errors.append(e)
+                streamer.end()
+
+        generation_thread = threading.Thread(target=generate, name="llm-stream", daemon=True)
+        generation_thread.start()
+
+        try:
+            for text in streamer:
+                if text:
+                    yield {"type": "token", "text": text}
+        finally:
+            if generation_thread.is_alive():
+                # the consumer stopped early, e.g. because the client disconnected
+                context.cancel()
+            generation_thread.join()
+        end_time = time.time()
+
+        if generation_errors:
+            raise generation_errors[0]
+
+        result = results[0]
+        result.timings_ms[TIMING_TEMPLATE] = template_ms
+        first_token_time = streamer.first_token_time or end_time
+        decode_time = end_time - first_token_time
+        yield {
+            "type": "done",
+            "answer": result.text,
+            "prompt_tokens": result.prompt_tokens,
+            "completion_tokens": result.completion_tokens,
+            "finish_reason": result.finish_reason,
+            "timings_ms": result.timings_ms,
+            "assisted": result.assisted,
+            "time_to_first_token_ms": (first_token_time - start_time) * 1000,
+            "decode_tokens_per_second": (result.completion_tokens - 1) / decode_time if result.completion_tokens > 1 and decode_time > 0 else 0.0,
+            "total_time_ms": (end_time - start_time) * 1000,
+        }
+
+    def _generate(self, prompt, streamer=None, prompting_config:dict=None, context:RequestContext=None):
+        """Runs a single prompt through the LLM and returns its GenerationResult."""
+        return self._generate_batch([prompt], streamer=streamer, prompting_config=prompting_config,
+                                    contexts=[context] if context is not None else None)[0]
+
+    def _generate_batch(self, prompts, streamer=None, prompting_config:dict=None, use_draft:bool=True, contexts=None):
+        """Tokenizes the prompts, generates the answers with model.generate and decodes only the generated tokens.
+        A single prompt reuses the cached key/values of the template prefix if the prefix cache is enabled
+        and is generated with the draft model as assistant if one is loaded,
+        several prompts are left padded into one batch.
+        Every prompt is tracked with its RequestContext while it is generated, so it can be stopped on its own
+        by its deadline or by cancel_request.
+
+        Returns:
+            List[GenerationResult]: the results in the order of the prompts
+        """
+        prompting_config = prompting_config if prompting_config is not None else self._prompting_config
+        tokenizer = self._pipe.tokenizer
+        model = self._pipe.model
+        generate_args = {key: value for key, value in prompting_config.items() if key not in PIPELINE_ONLY_ARGS}
+        tokenizer_args = {key: prompting_config[key] for key in ("add_special_tokens", "truncation") if key in prompting_config}
+        prefix_text = prompting_config.get("prefix", "")
+        timings = {}
+
+        start_time = time.time()
+        with self._tokenizer_lock:
+            if len(prompts) > 1:
+                self._prepare_batching()
+            encoded = tokenizer([prefix_text + prompt for prompt in prompts], return_tensors="pt", padding=len(prompts) > 1, **tokenizer_args).to(model.device)
+        input_ids = encoded["input_ids"]
+        timings[TIMING_TOKENIZATION] = (time.time() - start_time) * 1000
+
+        prefix = self._template_prefix() if self._prefix_cache is not None and len(prompts) == 1 else None
+        cached = self._prefix_cache.get(prefix) if prefix else None
+        if cached is not None:
+            past_key_values = self._prefix_key_values(cached, input_ids)
+            if past_key_values is not None:
+                generate_args["past_key_values"] = past_key_values
+
+        # assisted generation only supports a batch size of 1
+        assisted = use_draft and self._draft_model is not None and len(prompts) == 1
+        if assisted:
+            generate_args["assistant_model"] = self._draft_model
+            self._forward_counts.counts = {"model": 0, "draft": 0}
+
+        contexts = contexts or [RequestContext() for _ in prompts]
+        stopping_criteria = StoppingCriteriaList([*self._stopping_criteria, RequestCriteria(contexts)])
+        timer = streamer if streamer is not None else FirstTokenTimer()
+        generation_start = time.time()
+        with self._active_requests_lock:
+            self._active_requests.update(contexts)
+        try:
+            with self._generation():
+                output = model.generate(input_ids=input_ids, attention_mask=encoded["attention_mask"], streamer=timer,
+                                        stopping_criteria=stopping_criteria, **generate_args)
+                cancelled = self._cancel_event.is_set()
+        finally:
+            with self._active_requests_lock:
+                self._active_requests.difference_update(contexts)
+            forward_counts = getattr(self._forward_counts, "counts", None)
+            self._forward_counts.counts = None
+        generation_end = time.time()
+        first_token_time = timer.first_token_time or generation_end
+        timings[TIMING_PREFILL] = (first_token_time - generation_start) * 1000
+        timings[TIMING_DECODE] = (generation_end - first_token_time) * 1000
+        observe_generation(generation_start, timer.first_token_time, generation_end)
+
+        if prefix:
+            if timer.first_token_time is not None:
+                self._prefix_cache.record_prefill(timings[TIMING_PREFILL], cached="past_key_values" in generate_args)
+            if cached is None:
+                self._cache_prefix(prefix)
+
+        start_time = time.time()
+        prompt_length = 1 if model.config.is_encoder_decoder else input_ids.shape[1]
+        new_tokens = output[:, prompt_length:]
+        eos_token_ids = self._eos_token_ids()
+        max_new_tokens = generate_args.get("max_new_tokens", model.generation_config.max_new_tokens)
+        results = []
+        for index, (row, context) in enumerate(zip(new_tokens.tolist(), contexts)):
+            if context.stopped_length is not None:
+                # the rest of a stopped row of a batch is padding
+                row = row[:context.stopped_length - prompt_length]
+            completion = self._completion_tokens(row, eos_token_ids)
+            unfinished = max_new_tokens is None or len(completion) < max_new_tokens
+            if completion and completion[-1] in eos_token_ids:
+                finish_reason = FINISH_STOP
+            elif context.stopped_by is not None and unfinished:
+                finish_reason = context.stopped_by
+            elif cancelled and unfinished:
+                finish_reason = FINISH_CANCELLED
+            else:
+                finish_reason = FINISH_LENGTH
+            with self._tokenizer_lock:
+                text = tokenizer.decode(completion, skip_special_tokens=True)
+            results.append(GenerationResult(
+                text=text,
+                prompt_tokens=int(encoded["attention_mask"][index].sum()),
+                completion_tokens=len(completion),
+                finish_reason=finish_reason,
+                timings_ms=dict(timings),
+            ))
+        detokenization_ms = (time.time() - start_time) * 1000
+        for result in results:
+            result.timings_ms[TIMING_DETOKENIZATION] = detokenization_ms
+        if assisted:
+            results[0].assisted = self._assisted_stats(results[0], forward_counts)
+        return results
+
+    def _assisted_stats(self, result:GenerationResult, forward_counts:dict):
+        """Derives the acceptance rate of the draft tokens from the number of forwards of both models.
+        Every verification by the model yields the accepted draft tokens and one token of the model itself,
+        the speedup compares the time per token with the calibrated time per token without draft model."""
+        draft_tokens = forward_counts["draft"]
+        accepted_tokens = min(max(result.completion_tokens - forward_counts["model"], 0), draft_tokens)
+        generation_ms = result.timings_ms[TIMING_PREFILL] + result.timings_ms[TIMING_DECODE]
+        speedup = None
+        if self._draft_baseline_ms_per_token is not None and result.completion_tokens and generation_ms > 0:
+            speedup = self._draft_baseline_ms_per_token / (generation_ms / result.completion_tokens)
+        with self._draft_stats_lock:
+            self._draft_stats["generations"] += 1
+            self._draft_stats["draft_tokens"] += draft_tokens
+            self._draft_stats["accepted_tokens"] += accepted_tokens
+        return {
+            "draft_tokens": draft_tokens,
+            "accepted_tokens": accepted_tokens,
+            "acceptance_rate": accepted_tokens / draft_tokens if draft_tokens else None,
+            "speedup": speedup,
+        }
+
+    @staticmethod
+    def _completion_tokens(tokens, eos_token_ids):
+        """Cuts the generated tokens after the first end of sequence token, the rest is padding of the batch."""
+        for index, token in enumerate(tokens):
+            if token in eos_token_ids:
+                return tokens[:index + 1]
+        return tokens
+
+    def _eos_token_ids(self):
+        eos_token_ids = self._pipe.model.generation_config.eos_token_id
+        if eos_token_ids is None:
+            eos_token_ids = []
+        elif isinstance(eos_token_ids, int):
+            eos_token_ids = [eos_token_ids]
+        eos_token_ids = set(eos_token_ids)
+        if self._pipe.tokenizer.eos_token_id is not None:
+            eos_token_ids.add(self._pipe.tokenizer.eos_token_id)
+        return eos_token_ids
+
+    def _prefix_key_values(self, cached, input_ids):
+        """Returns a copy of the cached key/values cropped to the part of the prefix which the prompt shares."""
+        prefix_ids, prefix_key_values = cached
+        shared_length = self._shared_length(prefix_ids, input_ids)
+        if shared_length <= 0:
+            return None
+        past_key_values = copy.deepcopy(prefix_key_values)
+        if shared_length < past_key_values.get_seq_length():
+            past_key_values.crop(shared_length)
+        return past_key_values
+
+    def _cache_prefix(self, prefix):
+        """Computes the past key/values of the prefix and stores them in the prefix cache."""
+        model = self._pipe.model
+        with self._tokenizer_lock:
+            prefix_ids = self._pipe.tokenizer(prefix, return_tensors="pt")["input_ids"].to(model.device)
+        with torch.no_grad():
+            output = model(input_ids=prefix_ids, past_key_values=DynamicCache(), use_cache=True)
+        self._prefix_cache.put(prefix, prefix_ids, output.past_key_values)
+
+    def _template_prefix(self):
+        """Returns the part of the rendered chat template which is the same for every question."""
+        rendered = self._render_prompt(_PROMPT_PLACEHOLDER)[1]
+        if _PROMPT_PLACEHOLDER not in rendered:
+            return None
+        return rendered.split(_PROMPT_PLACEHOLDER)[0] or None
+
+    @staticmethod
+    def _shared_length(prefix_ids, input_ids):
+        """Number of leading tokens of the prompt which equal the prefix, at least the last prompt token is prefilled."""
+        limit = min(prefix_ids.shape[1], input_ids.shape[1] - 1)
+        if limit <= 0:
+            return 0
+        mismatches = (prefix_ids[0, :limit] != input_ids[0, :limit]).nonzero()
+        return int(mismatches[0]) if len(mismatches) else limit
+
+    def prefix_cache_stats(self):
+        """Returns the hits, memory usage and average prefill time with and without cached prefix or None if disabled."""
+        if self._prefix_cache is None:
+            return None
+        return self._prefix_cache.stats()
+
+    def active_requests(self):
+        """Returns the RequestContexts of the prompts which are currently generated."""
+        with self._active_requests_lock:
+            return list(self._active_requests)
+
+    def cancel_request(self, context:RequestContext):
+        """Stops the generation of a single request after its current token, the other requests continue.
+
+        Returns:
+            bool: True if the request was still generating
+        """
+        context.cancel()
+        with self._active_requests_lock:
+            return context in self._active_requests
+
+    def rss_bytes(self):
+        """Returns the resident memory of the process which serves the model."""
+        return self._process.memory_info().rss
+
+    @property
+    def load_rss_bytes(self):
+        """The growth of the resident memory of the process while the model was loaded by its last download_model."""
+        return self._load_rss_bytes
+
+    def memory_footprint(self):
+        """Returns the memory in bytes used by the weights and buffers of the loaded model and its draft model."""
+        if self._pipe is None:
+            return 0
+        draft_footprint = self._state_dict_bytes(self._draft_model) if self._draft_model is not None else 0
+        return self._state_dict_bytes(self._pipe.model) + draft_footprint
+
+    @staticmethod
+    def _state_dict_bytes(model):
+        """Sums the tensors of the state dict. Unlike get_memory_footprint this includes the packed weights of
+        quantized linear layers, which are neither parameters nor buffers. Shared tensors are counted once."""
+        seen = set()
+        total = 0
+
+        def add(value):
+            nonlocal total
+            if isinstance(value, torch.Tensor):
+                key = (value.data_ptr(), value.nelement())
+                if key not in seen:
+                    seen.add(key)
+                    total += value.nelement() * value.element_size()
+            elif isinstance(value, (tuple, list)):
+                for item in value:
+                    add(item)
+
+        for value in model.state_dict().values():
+            add(value)
+        # non persistent buffers (e.g. the rotary frequencies) are not part of the state dict
+        for buffer in model.buffers():
+            add(buffer)
+        return total
+
+    def draft_stats(self):
+        """Returns the acceptance of the draft tokens over all assisted generations or None if no draft model is configured."""
+        if self._draft_config["model"] is None:
+            return None
+        with self._draft_stats_lock:
+            stats = dict(self._draft_stats)
+        return {
+            "model": self._draft_config["model"],
+            "loaded": self._draft_model is not None,
+            "num_assistant_tokens": self._draft_config["num_assistant_tokens"],
+            **stats,
+            "acceptance_rate": stats["accepted_tokens"] / stats["draft_tokens"] if stats["draft_tokens"] else None,
+            "baseline_ms_per_token": self._draft_baseline_ms_per_token,
+        }
+
+    def count_tokens(self, text):
+        """Returns the number of tokens the tokenizer of the LLM produces for the text."""
+        if self._pipe is None or not text:
+            return 0
+        with self._tokenizer_lock:
+            return len(self._pipe.tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    def render_prompt(self, question):
+        """Returns the prompt which the pipeline receives for the question or None if no LLM is loaded."""
+        if self._pipe is None:
+            return None
+        return self._render_prompt(question)[1]
+
+    def _render_prompt(self, question):
+        """Builds the message and the prompt for the pipeline, applying the chat template if the model uses one."""
+        if self._other_configs.get("uses_chat_template"):
+            message = [{"role": "user", "content": question}]
+            if self._other_configs.get("system_prompt"):
+                message.insert(0, {"role": "system", "content": self._other_configs["system_prompt"]})
+            with self._tokenizer_lock:
+                prompt = self._pipe.tokenizer.apply_chat_template(message, tokenize=False, add_generation_prompt=True)
         else:
-            self._answer = output[0]["generated_text"]
+            message = question
+            prompt = message
+        return message, prompt
 
+    def _prepare_batching(self):
+        """Padded batches need a pad token, decoder-only models have to be padded on the left."""
+        tokenizer = self._pipe.tokenizer
+        if tokenizer.pad_token_id is None:
+            eos_token_id = self._pipe.model.config.eos_token_id
+            tokenizer.pad_token_id = eos_token_id[0] if isinstance(eos_token_id, list) else eos_token_id
+        tokenizer.padding_side = "left"
 
-        return self.answer
-    
     @property
     def modeltyp(self):
         return self._modeltyp
@@ -171,17 +1113,76 @@ class LLMModel:
         return self._model
 
 
+    @property
+    def prompting_config(self):
+        return self._prompting_config
+
+    @property
+    def deployment_config(self):
+        return dict(self._deployment_config)
+
     @property
     def message(self):
-        return self._message
+        """The message of the last answer_question of the calling thread."""
+        context = getattr(self._last_request, "context", None)
+        return context.message if context is not None else None
 
     @property
     def answer(self):
-        return self._answer
+        """The answer of the last answer_question of the calling thread."""
+        context = getattr(self._last_request, "context", None)
+        return context.result.text if context is not None and context.result is not None else None
 
     @property
     def prompt(self):
-        return self._prompt
+        """The prompt of the last answer_question of the calling thread."""
+        context = getattr(self._last_request, "context", None)
+        return context.prompt if context is not None else None
+
+    @property
+    def restart_count(self):
+        """Number of restarts since the model was created, unlike the restart attempts it is not reset after a successful restart."""
+        return self._restart_count
+
+    @property
+    def restart_attempt(self):
+        return self._restart_attempt
+
+    @property
+    def restart_timings(self):
+        """Durations in seconds of the restart tiers of the last restart."""
+        return dict(self._restart_timings)
+
+    @property
+    def probe_baseline_ms(self):
+        """Latency of the first probe after the last load, later probes can be compared against it."""
+        return self._probe_baseline_ms
+
+    @property
+    def last_probe_ms(self):
+        return self._last_probe_ms
+
+    @property
+    def quantization(self):
+        return self._quantization
+
+    @property
+    def cpu_settings(self):
+        """The configured thread counts and cpu affinity and the effective ones of the last thread which applied them."""
+        return {"configured": dict(self._cpu_config), "effective": dict(self._cpu_settings) or None}
+
+    @property
+    def loaded_from_snapshot(self):
+        return self._loaded_from_snapshot
+
+    @property
+    def load_timings(self):
+        """Durations in seconds of the loading phases of the last download_model call."""
+        return dict(self._load_timings)
+
+    @property
+    def last_error(self):
+        return self._last_error
 
     @property
     def status(self):
@@ -4,18 +4,22 @@ import time
 
 import schedule
 
-from src.app.wrapper.llm_model import (STATUS_FAILURE, STATUS_IDLE,
-                                   STATUS_NOT_READY, STATUS_READY, LLMModel)
-
-logging.basicConfig(
-    filename="wrapper.log",
-    filemode="w",
-    level=logging.DEBUG,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-)
-
-def run_continuously(interval=1):
-    """Continuously run, while executing pending jobs at each
+from src.app.wrapper.batch_scheduler import BatchScheduler
+from src.app.wrapper.llm_model import (CANCELLED_REQUEST_TIMEOUT_S,
+                                       DEADLINE_CHECK_INTERVAL_S,
+                                       DEADLINE_GRACE_S, FINISH_CANCELLED,
+                                       FINISH_TRUNCATED, RESTART_FULL,
+                                       STATUS_FAILURE, STATUS_IDLE,
+                                       STATUS_NOT_READY, STATUS_READY,
+                                       LLMModel)
+from src.app.wrapper.replica_pool import ReplicaError, ReplicaPool
+from src.app.wrapper.response_cache import ResponseCache
+
+logger = logging.getLogger(__name__)
+
+def run_continuously(interval=1, scheduler=None):
+    """Continuously run, while executing pending jobs of the scheduler
+    (defaults to the default scheduler of schedule) at each
     elapsed time interval.
     @return cease_continuous_run: threading. Event which can
     be set to cease continuous run. Please note that it is
@@ -26,12 +30,13 @@ def run_continuously(interval=1):
     at each interval but only once.
     """
     cease_continuous_run = threading.Event()
+    scheduler = scheduler if scheduler is not None else schedule.default_scheduler
 
     class ScheduleThread(threading.Thread):
         @classmethod
         def run(cls):
             while not cease_continuous_run.is_set():
-                schedule.run_pending()
+                scheduler.run_pending()
                 time.sleep(interval)
 
     continuous_thread = ScheduleThread()
@@ -39,85 +44,249 @@ def run_continuously(interval=1):
     return cease_continuous_run
 
 class LLMWrapper:
-    def __init__(self, modeltyp:str, model:str, prompting_config:dict, deployment_config:dict, **other_configs):
+    def __init__(self, modeltyp:str, model:str, prompting_config:dict, deployment_config:dict, batching_config:dict=None, caching_config:dict=None, replica_config:dict=None, progress_callback=None, **other_configs):
         self._is_llm_healthy = True
-        self.llm = LLMModel(modeltyp=modeltyp, model=model, prompting_config=prompting_config, deployment_config=deployment_config, **other_configs)
-        self.llm.download_model()
         self._max_timeout = 240  # Timeout für den Health-Check
+        self.llm = LLMModel(modeltyp=modeltyp, model=model, prompting_config=prompting_config, deployment_config=deployment_config, **other_configs)
+        self.llm.download_model(progress_callback=progress_callback)
+        self.replicas = self._create_replicas(replica_config or {})
+        if self.replicas is not None:
+            self.scheduler = BatchScheduler(self.llm, backend=self.replicas, max_concurrent_batches=len(self.replicas), **(batching_config or {}))
+        else:
+            self.scheduler = BatchScheduler(self.llm, **(batching_config or {}))
+        self.cache = self._create_cache(caching_config or {})
         self._continous_task = None
-        self._prompting_starting_time = None
+        # every wrapper runs its own jobs, so several deployments do not run the jobs of each other
+        self._monitoring = schedule.Scheduler()
         self._is_restarting_or_shutdown = False
 
     def health_check_wrapper(self):
         """Health-Check every 60 seconds."""
-        if self._prompting_starting_time is not None:
-            if (time.time() - self._prompting_starting_time) > self._max_timeout:
-                logging.warning("Wrapper: The LLM is unhealthy (dreaming), trying to restart...")
-                self.restart_llm()
+        if self.replicas is not None and self.llm.status == STATUS_READY:
+            states = self.replicas.check_health(self._max_timeout)
+            logger.info(f"Wrapper: replica health {states}")
 
         if self.llm.status in [STATUS_READY, STATUS_IDLE, STATUS_NOT_READY]:
             self._is_llm_healthy = True
-            logging.info("Wrapper: The LLM is healthy")
-            if self._prompting_starting_time is not None:
-                logging.debug(f"Wrapper: trying to answer since {time.time() - self._prompting_starting_time:.2f} seconds")
+            logger.info("Wrapper: The LLM is healthy")
             if self.llm.status == STATUS_READY:
                 self._is_restarting_or_shutdown = False
         else: 
             self._is_llm_healthy = False
-            logging.warning("Wrapper: The LLM is unhealthy, trying to restart...")
+            logger.warning("Wrapper: The LLM is unhealthy, trying to restart...")
+            self.restart_llm()
+
+    def check_deadlines(self):
+        """Watchdog for single requests (dreaming), runs every DEADLINE_CHECK_INTERVAL_S seconds.
+        A request which runs DEADLINE_GRACE_S past its deadline, or longer than max_timeout without a deadline,
+        is cancelled while the other requests continue. Only if a cancelled request does not stop within
+        CANCELLED_REQUEST_TIMEOUT_S the model is hung and restarted.
+        The replicas cancel their overdue requests themselves, a hung replica is restarted by the health check.
+
+        Returns:
+            int: the number of cancelled requests
+        """
+        now = time.time()
+        cancelled = 0
+        hung = False
+        for context in self.llm.active_requests():
+            if context.cancelled_at is not None:
+                hung = hung or now - context.cancelled_at > CANCELLED_REQUEST_TIMEOUT_S
+            elif context.overdue(self._max_timeout, DEADLINE_GRACE_S, now):
+                logger.warning(f"Wrapper: request running for {now - context.start_time:.1f} seconds passed its deadline (dreaming), cancelling it")
+                self.llm.cancel_request(context)
+                cancelled += 1
+        if hung:
+            logger.warning(f"Wrapper: a cancelled request did not stop within {CANCELLED_REQUEST_TIMEOUT_S} seconds, the LLM is unhealthy (hung), trying to restart...")
             self.restart_llm()
+        return cancelled
 
     def start_monitoring(self):
-        """Start health monitoring with schedule."""
+        """Start health monitoring and the deadline watchdog with schedule."""
         if self._continous_task is None:
-            schedule.every(60).seconds.do(self.health_check_wrapper)
-            self._continous_task = run_continuously()
+            self._monitoring.every(60).seconds.do(self.health_check_wrapper)
+            self._monitoring.every(DEADLINE_CHECK_INTERVAL_S).seconds.do(self.check_deadlines)
+            self._continous_task = run_continuously(scheduler=self._monitoring)
 
     def stop_monitoring(self):
         """Ends health monitoring."""
         if self._continous_task is None:
             return
+        self._monitoring.clear()
         self._continous_task.set()
         self._continous_task = None
 
+    def _create_replicas(self, replica_config):
+        """Forks the replica processes after the model is loaded, so they share its weights copy-on-write."""
+        count = replica_config.get("count", 1)
+        if count <= 1 or self.llm.status != STATUS_READY:
+            return None
+        try:
+            return ReplicaPool(self.llm, count, threads_per_replica=replica_config.get("threads_per_replica"), max_runtime_s=self._max_timeout)
+        except ReplicaError as e:
+            logger.warning(f"Wrapper: {e} Serving from the server process only.")
+            return None
+
+    def replica_health(self):
+        """Returns the state of every replica process or None if the model is served without replicas."""
+        if self.replicas is None:
+            return None
+        return self.replicas.describe(self._max_timeout)
+
+    def _create_cache(self, caching_config):
+        """Creates the response cache if caching is enabled and the prompting config is deterministic."""
+        caching_config = dict(caching_config)
+        if not caching_config.pop("enabled", True):
+            return None
+        if not ResponseCache.is_deterministic(self.llm.prompting_config):
+            logger.info("Wrapper: response cache disabled because the prompting config samples")
+            return None
+        return ResponseCache(**caching_config)
+
+    def _cache_key(self, question):
+        if self.cache is None:
+            return None
+        prompt = self.llm.render_prompt(question)
+        if prompt is None:
+            return None
+        return ResponseCache.make_key(self.llm.model, self.llm.prompting_config, prompt, self.llm.deployment_config)
+
+    def _cached_result(self, cache_key, measure_sci):
+        cached = self.cache.get(cache_key) if cache_key is not None else None
+        if cached is None:
+            return None
+        # a cache hit needs no generation, its energy consumption is negligible
+        return {
+            "answer": cached["answer"],
+            "sci_score": 0.0 if measure_sci else None,
+            "prompt_tokens": cached.get("prompt_tokens"),
+            "completion_tokens": cached["completion_tokens"],
+            "finish_reason": cached.get("finish_reason"),
+            "timings_ms": None,
+            "assisted": None,
+            "batch_size": 0,
+            "tokens_per_second": None,
+            "cached": True,
+        }
+
+    def _store_result(self, cache_key, result):
+        # partial answers of requests which were stopped early are not the answer to the question
+        if result.get("finish_reason") in (FINISH_TRUNCATED, FINISH_CANCELLED):
+            return
+        if cache_key is not None and result["answer"] is not None:
+            self.cache.put(cache_key, {key: result.get(key) for key in ("answer", "prompt_tokens", "completion_tokens", "finish_reason")})
+
     def get_answer(self, question):
-        self._prompting_starting_time = time.time()
-        logging.info("Wrapper: task is being executed...")
-        answer = self.llm.answer_question(question)
-        logging.info(f"Answer: {answer} - Question: {question}")
-        return answer
+        return self.process_prompt(question)["answer"]
+
+    def process_prompt(self, question, measure_sci:bool=False, deadline:float=None):
+        """Answers the question from the response cache or through the batch scheduler,
+        blocks until the batch containing the question is processed.
+        If the deadline (time.time()) passes, the partial answer is returned with the finish reason "truncated".
+
+        Returns:
+            dict: the answer, the sci score (if measure_sci is True) and the statistics of the batch
+        """
+        logger.debug("Wrapper: task is being executed...")
+        cache_key = self._cache_key(question)
+        result = self._cached_result(cache_key, measure_sci)
+        if result is None:
+            result = self.scheduler.submit(question, measure_sci=measure_sci, deadline=deadline).result()
+            self._store_result(cache_key, result)
+        logger.info("Wrapper: answered question", extra={"payload": True, "question": question, "answer": result["answer"]})
+        return result
     
     
+    def process_prompts(self, questions, deadlines=None):
+        """Hands all questions which are not cached to the batch scheduler at once, so they are processed in as few batches as possible.
+
+        Returns:
+            List[dict]: the results in the order of the questions, cached results are marked with "cached"
+        """
+        logger.debug("Wrapper: %d tasks are being executed...", len(questions))
+        deadlines = deadlines or [None] * len(questions)
+        cache_keys = [self._cache_key(question) for question in questions]
+        results = [self._cached_result(cache_key, False) for cache_key in cache_keys]
+        futures = [self.scheduler.submit(question, deadline=deadline) if result is None else None
+                   for question, deadline, result in zip(questions, deadlines, results)]
+        for index, future in enumerate(futures):
+            if future is not None:
+                results[index] = future.result()
+                self._store_result(cache_keys[index], results[index])
+        return results
+
+    def stream_answer(self, question, deadline:float=None):
+        """Streams the answer to the question, the llm is blocked for batches while the answer is generated.
+        Cached answers are sent as a single piece of text. Closing the generator cancels the generation.
+
+        Yields:
+            dict: the events of LLMModel.stream_answer
+        """
+        start_time = time.time()
+        logger.debug("Wrapper: streaming task is being executed...")
+        cached = self._cached_result(self._cache_key(question), False)
+        if cached is not None:
+            yield {"type": "token", "text": cached["answer"]}
+            yield {"type": "done", "answer": cached["answer"], "prompt_tokens": cached["prompt_tokens"],
+                   "completion_tokens": cached["completion_tokens"], "finish_reason": cached["finish_reason"],
+                   "time_to_first_token_ms": (time.time() - start_time) * 1000,
+                   "decode_tokens_per_second": None, "total_time_ms": (time.time() - start_time) * 1000,
+                   "cached": True}
+            return
+
+        stream = self.llm.stream_answer(question, deadline=deadline, lock=self.scheduler.model_lock)
+        try:
+            for event in stream:
+                if event["type"] == "done":
+                    logger.info("Wrapper: streamed answer", extra={"payload": True, "question": question, "answer": event["answer"]})
+                yield event
+        finally:
+            stream.close()
+
     def shutdown_llm(self):
+        self.stop_monitoring()
+        self.scheduler.stop()
+        if self.replicas is not None:
+            self.replicas.stop()
+        if self.cache is not None:
+            self.cache.close()
         if self.llm.status == STATUS_READY:
             self._is_restarting_or_shutdown = True
             self.llm.shutdown()
         elif self.llm.status == STATUS_FAILURE:
-            logging.info("Wrapper ignores shutdown request because llm is in failure state")
+            logger.info("Wrapper ignores shutdown request because llm is in failure state")
         elif self.llm.status == STATUS_IDLE:
-            logging.info("Wrapper ignores shutdown request because no llm is deployed/running")
+            logger.info("Wrapper ignores shutdown request because no llm is deployed/running")
         elif self.llm.status == STATUS_NOT_READY:
             if self._is_restarting_or_shutdown:
-                logging.info("Wrapper ignores restart request because llm is already performing a shutdown or a restart")
+                logger.info("Wrapper ignores restart request because llm is already performing a shutdown or a restart")
             else:
                 self._is_restarting_or_shutdown = True
                 self.llm.shutdown()
 
 
     def restart_llm(self):
+        restart_count = self.llm.restart_count
+        self._restart_llm()
+        # after a soft restart the replicas still share the kept weights, only a reload needs new replicas
+        reloaded = self.llm.restart_count != restart_count and RESTART_FULL in self.llm.restart_timings
+        if self.replicas is not None and reloaded and self.llm.status == STATUS_READY:
+            self.replicas.restart_all()
+
+    def _restart_llm(self):
         if self.llm.status == STATUS_READY:
             self._is_restarting_or_shutdown = True
             self.llm.restart()
         elif self.llm.status == STATUS_FAILURE:
             if self._is_restarting_or_shutdown:
-                logging.info("Wrapper ignores restart request because llm is in failure state")
+                logger.info("Wrapper ignores restart request because llm is in failure state")
             else:
                 self.llm.restart()
         elif self.llm.status == STATUS_IDLE:
-            logging.info("Wrapper ignores restart request because no llm is deployed/running")
+            logger.info("Wrapper ignores restart request because no llm is deployed/running")
         elif self.llm.status == STATUS_NOT_READY:
             if self._is_restarting_or_shutdown:
-                logging.info("Wrapper ignores restart request because llm is already performing a shutdown or a restart")
+                logger.info("Wrapper ignores restart request because llm is already performing a shutdown or a restart")
             else:
                 self._is_restarting_or_shutdown = True
                 self.llm.restart()
\ No newline at end of file
@@ -4,63 +4,105 @@ import logging
 import torch
 
 from src.app.wrapper.llm_model import (STATUS_FAILURE, STATUS_IDLE,
-                                   STATUS_NOT_READY, STATUS_READY)
+                                   STATUS_NOT_READY, STATUS_READY,
+                                   SUPPORTED_QUANTIZATIONS)
 from src.app.wrapper.llm_wrapper import LLMWrapper
 
-logging.basicConfig(
-    filename="manager.log",
-    filemode="w",
-    level=logging.DEBUG,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-)
+logger = logging.getLogger(__name__)
 
 
 class WrapperManager:
-    def create_wrapper(self, config: str):
+    def create_wrapper(self, config: str, progress_callback=None):
         """creates a LLMWrapper Object based on a json structured config
         
         Args: 
             config (str): json formatted string containing the config data for the llm model from hugging face.
+            progress_callback (Callable[[str], None], optional): is called with the name of each loading phase of the model
 
         Returns:
             LLMWrapper: LLMWrapper object with downloaded llm model
         """
         try:
-            logging.info("Start of wrapper creation")
+            logger.info("Start of wrapper creation")
             config_data = json.loads(config)
 
             if not isinstance(config_data, dict):
-                logging.error("Manager: Value Error because config is not of type dict")
+                logger.error("Manager: Value Error because config is not of type dict")
                 raise ValueError("The JSON-config needs to contain a dictionary.")
 
             # read args and kwargs
             model = config_data.get("model")
             modeltyp = config_data.get("modeltyp")
-            uses_chat_template = {"uses_chat_template": config_data.get("uses_chat_template")}
+            other_configs = {"uses_chat_template": config_data.get("uses_chat_template")}
+            if config_data.get("system_prompt"):
+                other_configs["system_prompt"] = config_data["system_prompt"]
             args = config_data.get("args", {})
             prompting_config = args.get("prompting", {})
             deployment_config = args.get("deployment", {})
+            batching_config = args.get("batching") or {}
+            caching_config = args.get("caching") or {}
+            prefix_cache_config = args.get("prefix_caching") or {}
+            replica_config = args.get("replicas") or {}
+            snapshot_config = args.get("snapshot") or {}
+            probe_config = args.get("probe") or {}
+            draft_config = args.get("draft") or {}
         
 
             if not isinstance(args, dict):
-                logging.error("Manager: Value Error because args is not of type dict")
+                logger.error("Manager: Value Error because args is not of type dict")
                 raise ValueError("The 'args'-key needs to contain a list.")
 
             if not isinstance(prompting_config, dict):
-                logging.error("Manager: Value Error because prompting_config is not of type dict")
+                logger.error("Manager: Value Error because prompting_config is not of type dict")
                 raise ValueError("The 'prompting'-key needs to contain a dictionary.")
             
             if not isinstance(deployment_config, dict):
-                logging.error("Manager: Value Error because deployment_config is not of type dict")
+                logger.error("Manager: Value Error because deployment_config is not of type dict")
                 raise ValueError("The 'deployment'-key needs to contain a dictionary.")
             
+            if not isinstance(batching_config, dict):
+                logger.error("Manager: Value Error because batching_config is not of type dict")
+                raise ValueError("The 'batching'-key needs to contain a dictionary.")
+
+            if not isinstance(caching_config, dict):
+                logger.error("Manager: Value Error because caching_config is not of type dict")
+                raise ValueError("The 'caching'-key needs to contain a dictionary.")
+
+            if not isinstance(prefix_cache_config, dict):
+                logger.error("Manager: Value Error because prefix_cache_config is not of type dict")
+                raise ValueError("The 'prefix_caching'-key needs to contain a dictionary.")
+            other_configs["prefix_cache_config"] = prefix_cache_config
+
+            if not isinstance(snapshot_config, dict):
+                logger.error("Manager: Value Error because snapshot_config is not of type dict")
+                raise ValueError("The 'snapshot'-key needs to contain a dictionary.")
+            other_configs["snapshot_config"] = snapshot_config
+
+            if not isinstance(probe_config, dict):
+                logger.error("Manager: Value Error because probe_config is not of type dict")
+                raise ValueError("The 'probe'-key needs to contain a dictionary.")
+            other_configs["probe_config"] = probe_config
+
+            if not isinstance(draft_config, dict):
+                logger.error("Manager: Value Error because draft_config is not of type dict")
+                raise ValueError("The 'draft'-key needs to contain a dictionary.")
+            other_configs["draft_config"] = draft_config
+
+            if not isinstance(replica_config, dict):
+                logger.error("Manager: Value Error because replica_config is not of type dict")
+                raise ValueError("The 'replicas'-key needs to contain a dictionary.")
+
             if "torch_dtype" in deployment_config.keys():
                 if isinstance(deployment_config["torch_dtype"], str) and deployment_config["torch_dtype"] == "torch.bfloat16":
                     deployment_config["torch_dtype"] = torch.bfloat16
 
+            if deployment_config.get("quantization") is not None and deployment_config["quantization"] not in SUPPORTED_QUANTIZATIONS:
+                logger.error(f"Manager: Value Error because the quantization '{deployment_config['quantization']}' is not supported")
+                raise ValueError(f"The 'quantization'-key needs to be one of {sorted(SUPPORTED_QUANTIZATIONS)}.")
+
             # call target function (create LLMWrapper with config)
-            return LLMWrapper(model=model, modeltyp=modeltyp, prompting_config=prompting_config, deployment_config=deployment_config, **uses_chat_template)
+            return LLMWrapper(model=model, modeltyp=modeltyp, prompting_config=prompting_config, deployment_config=deployment_config, batching_config=batching_config, caching_config=caching_config, replica_config=replica_config, progress_callback=progress_callback, **other_configs)
 
         except json.JSONDecodeError:
-            logging.error("Manager: Value Error because the given config '{config}' doesn`t contain a valid json structur.")
+            logger.error("Manager: Value Error because the given config '{config}' doesn`t contain a valid json structur.")
             raise ValueError(f"The given config '{config}' doesn`t contain a valid json structur.")
\ No newline at end of file
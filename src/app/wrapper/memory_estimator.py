@@ -0,0 +1,209 @@
+import glob
+import json
+import logging
+import math
+import os
+import struct
+from collections import Counter
+
+from huggingface_hub import get_safetensors_metadata
+from transformers import AutoConfig
+
+from src.app.wrapper.llm_model import QUANTIZATION_DYNAMIC_INT8
+from src.app.wrapper.snapshot_store import SnapshotStore
+
+logger = logging.getLogger(__name__)
+
+# bytes per element of the dtypes in safetensors headers
+SAFETENSORS_DTYPE_BYTES = {
+    "F64": 8, "F32": 4, "F16": 2, "BF16": 2, "F8_E4M3": 1, "F8_E5M2": 1,
+    "I64": 8, "I32": 4, "I16": 2, "I8": 1, "U8": 1, "BOOL": 1,
+}
+FLOAT_DTYPES = {"F64", "F32", "F16", "BF16", "F8_E4M3", "F8_E5M2"}
+# bytes per element of the torch_dtype of the deployment config, without torch_dtype transformers loads float32
+TORCH_DTYPE_BYTES = {"float64": 8, "float32": 4, "float": 4, "float16": 2, "half": 2, "bfloat16": 2}
+DEFAULT_TORCH_DTYPE_BYTES = 4
+
+# assumed prompt length for the key/value cache, the answer adds max_new_tokens
+DEFAULT_PROMPT_TOKENS = 512
+# transformers generates 20 tokens if max_new_tokens is not configured
+DEFAULT_MAX_NEW_TOKENS = 20
+# activations and temporary buffers while loading and generating, as share of the weights
+RUNTIME_OVERHEAD = 0.1
+
+SOURCE_SAFETENSORS = "safetensors"
+SOURCE_CONFIG = "config"
+
+
+def read_safetensors_header(path:str):
+    """Reads the dtype and shape of every tensor from the json header at the start of a safetensors file,
+    without reading the weights.
+
+    Returns:
+        Dict[str, Tuple[str, List[int]]]: dtype and shape by tensor name
+    """
+    with open(path, "rb") as file:
+        header_length = struct.unpack("<Q", file.read(8))[0]
+        header = json.loads(file.read(header_length))
+    return {name: (info["dtype"], info["shape"]) for name, info in header.items() if name != "__metadata__"}
+
+
+class MemoryEstimator:
+    """Estimates the resident memory of a deployment from the config of its model before the weights are loaded.
+
+    The weights are taken from the headers of the safetensors files (local files, the snapshot store or
+    the headers on hugging face, which are fetched without the weights) in the dtype the model is converted to.
+    The key/value cache is sized for the prompt and max_new_tokens of every prompt which can run at once.
+    If no safetensors headers are available, the parameters are derived from the architecture in the config.
+    """
+
+    def estimate(self, config:dict):
+        """Estimates the memory of the deployment of a ModelConfig.
+
+        Args:
+            config (dict): the ModelConfig as dictionary
+
+        Raises:
+            Exception: if the config of the model can not be resolved
+
+        Returns:
+            dict: the estimated total in bytes and its parts
+        """
+        args = config.get("args") or {}
+        deployment_config = args.get("deployment") or {}
+        prompting_config = args.get("prompting") or {}
+        draft_config = args.get("draft") or {}
+        # every replica and every prompt of a batch keeps its own key/value cache
+        concurrent_prompts = (args.get("batching") or {}).get("max_batch_size", 1) * (args.get("replicas") or {}).get("count", 1)
+        kv_cache_tokens = prompting_config.get("max_new_tokens") or DEFAULT_MAX_NEW_TOKENS
+        kv_cache_tokens += DEFAULT_PROMPT_TOKENS
+
+        snapshot_directory = (args.get("snapshot") or {}).get("directory")
+        snapshot_path = SnapshotStore(snapshot_directory).find(config["model"], deployment_config) if snapshot_directory else None
+        model = self._estimate_model(snapshot_path or config["model"], deployment_config, kv_cache_tokens, concurrent_prompts,
+                                     revision=None if snapshot_path else deployment_config.get("revision"))
+
+        draft = None
+        if draft_config.get("model"):
+            # assisted generation only runs single prompts, the revision of the deployment only applies to the model
+            draft = self._estimate_model(draft_config["model"], deployment_config, kv_cache_tokens, (args.get("replicas") or {}).get("count", 1),
+                                         revision=draft_config.get("revision"))
+
+        prefix_caching = args.get("prefix_caching") or {}
+        prefix_cache_bytes = 0
+        if config.get("uses_chat_template") and prefix_caching.get("enabled", True):
+            prefix_cache_bytes = int(prefix_caching.get("max_memory_mb", 256) * 1e6)
+
+        weights_bytes = model["weights_bytes"] + (draft["weights_bytes"] if draft else 0)
+        peak_weights_bytes = model["peak_weights_bytes"] + (draft["peak_weights_bytes"] if draft else 0)
+        kv_cache_bytes = model["kv_cache_bytes"] + (draft["kv_cache_bytes"] if draft else 0)
+        overhead_bytes = int(weights_bytes * RUNTIME_OVERHEAD)
+        # both models are quantized after they were loaded in float32, the key/value cache is only allocated later
+        total_bytes = max(weights_bytes + kv_cache_bytes + prefix_cache_bytes, peak_weights_bytes) + overhead_bytes
+        return {
+            "total_bytes": total_bytes,
+            "weights_bytes": weights_bytes,
+            "peak_weights_bytes": peak_weights_bytes,
+            "kv_cache_bytes": kv_cache_bytes,
+            "prefix_cache_bytes": prefix_cache_bytes,
+            "overhead_bytes": overhead_bytes,
+            "kv_cache_tokens": model["kv_cache_tokens"],
+            "concurrent_prompts": concurrent_prompts,
+            "source": model["source"],
+        }
+
+    def _estimate_model(self, model:str, deployment_config:dict, kv_cache_tokens:int, concurrent_prompts:int, revision:str=None):
+        model_config = AutoConfig.from_pretrained(model, revision=revision, trust_remote_code=deployment_config.get("trust_remote_code", False))
+        torch_dtype = str(deployment_config.get("torch_dtype") or "").replace("torch.", "")
+        quantization = deployment_config.get("quantization")
+
+        tensors = self._tensors(model, revision)
+        if tensors:
+            weights_bytes = sum(self._tensor_bytes(name, dtype, shape, torch_dtype, quantization) for name, (dtype, shape) in tensors.items())
+            source = SOURCE_SAFETENSORS
+            float_dtypes = Counter(dtype for dtype, _ in tensors.values() if dtype in FLOAT_DTYPES)
+            header_dtype = float_dtypes.most_common(1)[0][0] if float_dtypes else "F32"
+        else:
+            element_bytes = 1 if quantization == QUANTIZATION_DYNAMIC_INT8 else TORCH_DTYPE_BYTES.get(torch_dtype, DEFAULT_TORCH_DTYPE_BYTES)
+            weights_bytes = self.parameters_from_config(model_config) * element_bytes
+            source = SOURCE_CONFIG
+            header_dtype = "F32"
+
+        peak_weights_bytes = weights_bytes
+        if quantization == QUANTIZATION_DYNAMIC_INT8:
+            # the whole model is converted to float32 before its linear layers are quantized
+            if tensors:
+                peak_weights_bytes = sum(self._tensor_bytes(name, dtype, shape, "float32", None) for name, (dtype, shape) in tensors.items())
+            else:
+                peak_weights_bytes = self.parameters_from_config(model_config) * TORCH_DTYPE_BYTES["float32"]
+
+        # the cache is kept in the dtype of the activations, which is float32 for quantized models
+        if quantization == QUANTIZATION_DYNAMIC_INT8:
+            activation_bytes = 4
+        elif torch_dtype == "auto":
+            activation_bytes = SAFETENSORS_DTYPE_BYTES[header_dtype]
+        else:
+            activation_bytes = TORCH_DTYPE_BYTES.get(torch_dtype, DEFAULT_TORCH_DTYPE_BYTES)
+        max_positions = getattr(model_config, "max_position_embeddings", None)
+        if max_positions:
+            kv_cache_tokens = min(kv_cache_tokens, max_positions)
+        return {
+            "weights_bytes": weights_bytes,
+            "peak_weights_bytes": peak_weights_bytes,
+            "kv_cache_bytes": self.kv_cache_bytes(model_config, kv_cache_tokens, concurrent_prompts, activation_bytes),
+            "kv_cache_tokens": kv_cache_tokens,
+            "source": source,
+        }
+
+    @staticmethod
+    def _tensors(model:str, revision:str=None):
+        """Returns the dtype and shape of all weights from the safetensors headers or None if there are none."""
+        if os.path.isdir(model):
+            tensors = {}
+            for path in sorted(glob.glob(os.path.join(model, "*.safetensors"))):
+                tensors.update(read_safetensors_header(path))
+            return tensors or None
+        try:
+            metadata = get_safetensors_metadata(model, revision=revision)
+        except Exception as e:
+            logger.warning(f"Estimator: No safetensors headers for {model}, estimating the parameters from the config: {e}")
+            return None
+        return {name: (info.dtype, info.shape) for file in metadata.files_metadata.values() for name, info in file.tensors.items()}
+
+    @staticmethod
+    def _tensor_bytes(name:str, dtype:str, shape:list, torch_dtype:str, quantization:str):
+        elements = math.prod(shape)
+        if dtype not in FLOAT_DTYPES:
+            return elements * SAFETENSORS_DTYPE_BYTES.get(dtype, 4)
+        if quantization == QUANTIZATION_DYNAMIC_INT8:
+            # the weights of linear layers are stored as int8, embeddings, norms and biases stay float32
+            return elements * (1 if len(shape) == 2 and "embed" not in name else 4)
+        if torch_dtype == "auto":
+            return elements * SAFETENSORS_DTYPE_BYTES[dtype]
+        return elements * TORCH_DTYPE_BYTES.get(torch_dtype, DEFAULT_TORCH_DTYPE_BYTES)
+
+    @staticmethod
+    def parameters_from_config(model_config):
+        """Approximates the parameters of a decoder-only transformer from the sizes in its config."""
+        hidden_size = model_config.hidden_size
+        num_heads = model_config.num_attention_heads
+        head_dim = getattr(model_config, "head_dim", None) or hidden_size // num_heads
+        num_kv_heads = getattr(model_config, "num_key_value_heads", None) or num_heads
+        intermediate_size = getattr(model_config, "intermediate_size", None) or getattr(model_config, "ffn_dim", None) or 4 * hidden_size
+        # gated feed forward layers (e.g. llama) have three projections, the others two
+        feed_forward_matrices = 3 if getattr(model_config, "hidden_act", None) in ("silu", "swiglu") else 2
+
+        attention = hidden_size * head_dim * (2 * num_heads + 2 * num_kv_heads)
+        feed_forward = feed_forward_matrices * hidden_size * intermediate_size
+        embeddings = model_config.vocab_size * hidden_size
+        if not getattr(model_config, "tie_word_embeddings", True):
+            embeddings *= 2
+        return model_config.num_hidden_layers * (attention + feed_forward) + embeddings
+
+    @staticmethod
+    def kv_cache_bytes(model_config, tokens:int, concurrent_prompts:int, element_bytes:int):
+        """Returns the memory of the keys and values of all layers for tokens tokens of concurrent_prompts prompts."""
+        num_heads = model_config.num_attention_heads
+        head_dim = getattr(model_config, "head_dim", None) or model_config.hidden_size // num_heads
+        num_kv_heads = getattr(model_config, "num_key_value_heads", None) or num_heads
+        return 2 * model_config.num_hidden_layers * num_kv_heads * head_dim * tokens * concurrent_prompts * element_bytes
@@ -0,0 +1,230 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# time remove waits for the prompts in flight before the deployment is shut down
+DRAIN_TIMEOUT_S = 30
+
+
+class RegistryError(Exception):
+    pass
+
+
+class Deployment:
+    """A named LLMWrapper within the registry together with its memory usage and load."""
+
+    def __init__(self, name:str, wrapper, memory_bytes:int, memory_estimate:dict=None):
+        self.name = name
+        self.wrapper = wrapper
+        self.memory_bytes = memory_bytes
+        self.memory_estimate = memory_estimate
+        self.in_flight = 0
+        self.last_used = time.time()
+
+    @property
+    def is_idle(self):
+        return self.in_flight == 0
+
+    def describe(self):
+        cache = getattr(self.wrapper, "cache", None)
+        replica_health = getattr(self.wrapper, "replica_health", None)
+        load_rss_bytes = getattr(self.wrapper.llm, "load_rss_bytes", None)
+        return {
+            "model": self.wrapper.llm.model,
+            "status": self.wrapper.llm.status,
+            "memory_mb": round(self.memory_bytes / 1e6, 1),
+            "projected_memory": {
+                key.replace("_bytes", "_mb") if key.endswith("_bytes") else key: round(value / 1e6, 1) if key.endswith("_bytes") else value
+                for key, value in self.memory_estimate.items()
+            } if self.memory_estimate else None,
+            "load_rss_mb": round(load_rss_bytes / 1e6, 1) if isinstance(load_rss_bytes, (int, float)) else None,
+            "quantization": self.wrapper.llm.quantization,
+            "cpu": self.wrapper.llm.cpu_settings,
+            "loaded_from_snapshot": self.wrapper.llm.loaded_from_snapshot,
+            "load_timings": self.wrapper.llm.load_timings,
+            "restart_timings": self.wrapper.llm.restart_timings,
+            "probe_baseline_ms": self.wrapper.llm.probe_baseline_ms,
+            "last_probe_ms": self.wrapper.llm.last_probe_ms,
+            "in_flight": self.in_flight,
+            "last_used": self.last_used,
+            "cache": cache.stats() if cache is not None else None,
+            "prefix_cache": self.wrapper.llm.prefix_cache_stats(),
+            "replicas": replica_health() if replica_health is not None else None,
+            "draft": self.wrapper.llm.draft_stats(),
+        }
+
+
+class ModelRegistry:
+    """Keeps several named deployments within a total memory budget.
+
+    If a new deployment does not fit into the budget, the least recently used idle deployments
+    are shut down through LLMWrapper.shutdown_llm until it fits. The shutdowns run after the lock is released,
+    so prompts of the other deployments are not blocked by them.
+
+    A deployment is reserved with reserve before its model is loaded and registered with complete afterwards.
+    """
+
+    def __init__(self, memory_budget_bytes:int):
+        self._memory_budget_bytes = memory_budget_bytes
+        self._deployments = OrderedDict()  # least recently used first
+        self._known_footprints = {}  # memory usage of models which were deployed before
+        self._pending = {}  # memory reserved for the deployments which are currently loading, by name
+        self._lock = threading.RLock()
+        self._released = threading.Condition(self._lock)  # notified whenever a prompt releases its deployment
+
+    def reserve(self, name:str, model:str=None, expected_memory_bytes:int=None):
+        """Reserves the name for a deployment which is about to be loaded and makes room for its expected memory usage.
+        The reservation is finished with complete or cancel.
+
+        Raises:
+            RegistryError: if the name is already deployed or the deployment can never fit into the budget
+        """
+        if expected_memory_bytes is None:
+            expected_memory_bytes = self._known_footprints.get(model, 0)
+
+        with self._lock:
+            if name in self._deployments or name in self._pending:
+                raise RegistryError(f"The model {name} is already deployed.")
+            if expected_memory_bytes > self._memory_budget_bytes:
+                raise RegistryError(f"The model {name} needs {expected_memory_bytes / 1e6:.0f} MB which exceeds the memory budget of {self._memory_budget_bytes / 1e6:.0f} MB.")
+            evicted = self._evict_until_free(expected_memory_bytes)
+            self._pending[name] = expected_memory_bytes
+        self._shutdown_evicted(evicted)
+
+    def complete(self, name:str, wrapper, model:str=None, memory_estimate:dict=None):
+        """Registers the loaded wrapper of a reserved deployment with its measured and its projected memory usage."""
+        memory_bytes = wrapper.llm.memory_footprint()
+        with self._lock:
+            self._pending.pop(name, None)
+            if model is not None:
+                self._known_footprints[model] = memory_bytes
+            self.add(name, wrapper, memory_bytes, memory_estimate=memory_estimate)
+
+    def cancel(self, name:str):
+        """Releases the reservation of a deployment which failed to load."""
+        with self._lock:
+            self._pending.pop(name, None)
+
+    def add(self, name:str, wrapper, memory_bytes:int=0, memory_estimate:dict=None):
+        """Registers an already created wrapper and evicts idle deployments if the budget is exceeded."""
+        with self._lock:
+            self._deployments[name] = Deployment(name, wrapper, memory_bytes, memory_estimate)
+            evicted = self._evict_until_free(0, keep=name)
+            if self.used_memory_bytes > self._memory_budget_bytes:
+                logger.warning(f"Registry: memory budget exceeded by {(self.used_memory_bytes - self._memory_budget_bytes) / 1e6:.0f} MB, no idle model left to evict")
+        self._shutdown_evicted(evicted)
+
+    def remove(self, name:str, drain_timeout_s:float=DRAIN_TIMEOUT_S):
+        """Removes the deployment from the registry and shuts it down once its prompts in flight are answered.
+        New prompts can not acquire the deployment while it drains.
+
+        Raises:
+            RegistryError: if no model is deployed under name or its prompts are not answered within drain_timeout_s
+        """
+        with self._lock:
+            deployment = self._deployments.pop(name, None)
+            if deployment is None:
+                raise RegistryError(f"The model {name} is not deployed.")
+            if not self._released.wait_for(lambda: deployment.is_idle, timeout=drain_timeout_s):
+                self._deployments[name] = deployment
+                raise RegistryError(f"The model {name} is still processing {deployment.in_flight} prompts, it was not shut down.")
+        deployment.wrapper.shutdown_llm()
+        logger.info(f"Registry: removed deployment {name}")
+
+    def get(self, name:str=None):
+        """Returns the deployment with the given name. Without name the only deployment is returned.
+
+        Raises:
+            RegistryError: if the name is unknown or no name is given while several models are deployed
+        """
+        with self._lock:
+            if name is None:
+                if len(self._deployments) == 1:
+                    return next(iter(self._deployments.values()))
+                if not self._deployments:
+                    raise RegistryError("No model is currently deployed.")
+                raise RegistryError(f"Several models are deployed ({', '.join(self._deployments)}), the model needs to be specified.")
+            if name not in self._deployments:
+                raise RegistryError(f"The model {name} is not deployed.")
+            return self._deployments[name]
+
+    def acquire(self, name:str=None):
+        """Marks the deployment as used by a request, used deployments are never evicted.
+
+        Returns:
+            Deployment: the acquired deployment, has to be handed back with release
+        """
+        with self._lock:
+            deployment = self.get(name)
+            deployment.in_flight += 1
+            deployment.last_used = time.time()
+            self._deployments.move_to_end(deployment.name)
+            return deployment
+
+    def release(self, deployment:Deployment):
+        with self._lock:
+            deployment.in_flight -= 1
+            deployment.last_used = time.time()
+            self._released.notify_all()
+
+    @contextmanager
+    def use(self, name:str=None):
+        deployment = self.acquire(name)
+        try:
+            yield deployment.wrapper
+        finally:
+            self.release(deployment)
+
+    def _evict_until_free(self, required_bytes:int, keep:str=None):
+        """Removes least recently used idle deployments until required_bytes fit into the budget. Called with the lock held.
+
+        Returns:
+            List[Deployment]: the evicted deployments, which are shut down with _shutdown_evicted after the lock is released
+        """
+        evicted = []
+        for deployment in list(self._deployments.values()):
+            if self.used_memory_bytes + required_bytes <= self._memory_budget_bytes:
+                break
+            if not deployment.is_idle or deployment.name == keep:
+                continue
+            logger.info(f"Registry: evicting idle model {deployment.name} ({deployment.memory_bytes / 1e6:.0f} MB) to stay within the memory budget")
+            del self._deployments[deployment.name]
+            evicted.append(deployment)
+        return evicted
+
+    @staticmethod
+    def _shutdown_evicted(evicted):
+        for deployment in evicted:
+            try:
+                deployment.wrapper.shutdown_llm()
+            except Exception as e:
+                logger.error(f"Registry: Error during eviction of {deployment.name}: {e}")
+
+    def clear(self):
+        """Shuts down all deployments."""
+        for name in self.names():
+            self.remove(name)
+
+    def names(self):
+        with self._lock:
+            return list(self._deployments)
+
+    def describe(self):
+        with self._lock:
+            return {name: deployment.describe() for name, deployment in self._deployments.items()}
+
+    @property
+    def used_memory_bytes(self):
+        """The memory of the deployments and the memory reserved for the deployments which are loading."""
+        return sum(deployment.memory_bytes for deployment in self._deployments.values()) + sum(self._pending.values())
+
+    @property
+    def memory_budget_bytes(self):
+        return self._memory_budget_bytes
+
+    def __len__(self):
+        return len(self._deployments)
@@ -0,0 +1,76 @@
+import threading
+from collections import OrderedDict
+
+
+def cache_memory_bytes(past_key_values):
+    """Returns the memory in bytes used by the key and value tensors of a transformers cache."""
+    total = 0
+    for layer in past_key_values.to_legacy_cache():
+        for tensor in layer:
+            total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class PrefixCache:
+    """Keeps the past key/values of prompt prefixes (e.g. the rendered chat template) in a LRU within a memory cap,
+    so the generation only has to prefill the suffix of a prompt."""
+
+    def __init__(self, max_memory_bytes:int):
+        self._max_memory_bytes = max_memory_bytes
+        self._entries = OrderedDict()  # prefix text -> (input_ids, past_key_values, memory bytes)
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._prefill_ms = {True: [0.0, 0], False: [0.0, 0]}  # cached -> [sum, count]
+
+    def get(self, prefix:str):
+        """Returns the token ids and past key/values of the prefix or None if the prefix is not cached."""
+        with self._lock:
+            entry = self._entries.get(prefix)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(prefix)
+            self._hits += 1
+            return entry[0], entry[1]
+
+    def put(self, prefix:str, input_ids, past_key_values):
+        """Stores the past key/values of the prefix, least recently used prefixes are dropped if the memory cap is exceeded."""
+        memory_bytes = cache_memory_bytes(past_key_values)
+        if memory_bytes > self._max_memory_bytes:
+            return
+        with self._lock:
+            if prefix in self._entries:
+                self._memory_bytes -= self._entries.pop(prefix)[2]
+            self._entries[prefix] = (input_ids, past_key_values, memory_bytes)
+            self._memory_bytes += memory_bytes
+            while self._memory_bytes > self._max_memory_bytes:
+                _, (_, _, dropped_bytes) = self._entries.popitem(last=False)
+                self._memory_bytes -= dropped_bytes
+
+    def record_prefill(self, prefill_ms:float, cached:bool):
+        """Records the prefill time of a generation with or without a cached prefix."""
+        with self._lock:
+            self._prefill_ms[cached][0] += prefill_ms
+            self._prefill_ms[cached][1] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            def average(cached):
+                total, count = self._prefill_ms[cached]
+                return round(total / count, 3) if count else None
+
+            return {
+                "entries": len(self._entries),
+                "memory_mb": round(self._memory_bytes / 1e6, 3),
+                "hits": self._hits,
+                "misses": self._misses,
+                "avg_prefill_ms_cached": average(True),
+                "avg_prefill_ms_uncached": average(False),
+            }
@@ -0,0 +1,292 @@
+import logging
+import multiprocessing
+import threading
+import time
+
+from src.app.logs.logging_setup import shutdown_logging
+from src.app.wrapper.llm_model import (CANCELLED_REQUEST_TIMEOUT_S,
+                                       DEADLINE_CHECK_INTERVAL_S,
+                                       DEADLINE_GRACE_S)
+
+logger = logging.getLogger(__name__)
+
+REPLICA_HEALTHY = "healthy"
+REPLICA_DEAD = "dead"
+REPLICA_HUNG = "hung"
+
+
+class ReplicaError(Exception):
+    pass
+
+
+def _serve_replica(llm, connection, num_threads, max_runtime_s):
+    """Main loop of a replica process, answers batches with the llm which was inherited from the parent by fork."""
+    if num_threads:
+        # the replica owns its copy of the llm, so its thread count replaces the one of the deployment
+        llm.configure_cpu(num_threads=num_threads)
+    # the requests run in this process, so the watchdog of the parent does not see them
+    stop_event = threading.Event()
+    threading.Thread(target=_cancel_overdue_requests, args=(llm, max_runtime_s, stop_event), name="replica-deadlines", daemon=True).start()
+    try:
+        _answer_commands(llm, connection)
+    finally:
+        stop_event.set()
+        # the process ends without atexit handlers, the queued log records are written before
+        shutdown_logging()
+
+
+def _cancel_overdue_requests(llm, max_runtime_s, stop_event):
+    """Watchdog of a replica, cancels the requests which run past their deadline like LLMWrapper.check_deadlines."""
+    while not stop_event.wait(DEADLINE_CHECK_INTERVAL_S):
+        now = time.time()
+        for context in llm.active_requests():
+            if context.overdue(max_runtime_s, now=now):
+                logger.warning(f"Replica: request running for {now - context.start_time:.1f} seconds passed its deadline (dreaming), cancelling it")
+                llm.cancel_request(context)
+
+
+def _answer_commands(llm, connection):
+    while True:
+        try:
+            command, payload = connection.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if command == "stop":
+            return
+        try:
+            if command == "answer_questions":
+                questions, deadlines = payload
+                connection.send((True, llm.answer_questions(questions, deadlines=deadlines)))
+            elif command == "ping":
+                connection.send((True, "pong"))
+            else:
+                connection.send((False, f"unknown command {command}"))
+        except Exception as e:
+            connection.send((False, str(e)))
+
+
+class Replica:
+    """A forked worker process which serves a copy-on-write replica of the loaded model."""
+
+    def __init__(self, index:int, llm, num_threads:int=None, max_runtime_s:float=None):
+        self.index = index
+        self._llm = llm
+        self._num_threads = num_threads
+        self._max_runtime_s = max_runtime_s
+        self._lock = threading.Lock()  # one request at a time per connection
+        self._process_lock = threading.RLock()  # the call on timeout and the health check may restart at once
+        self.in_flight = 0
+        self.busy_since = None
+        self.served = 0
+        self.failures = 0
+        self.restarts = 0
+        self._process = None
+        self._connection = None
+        self.start()
+
+    def start(self):
+        """Forks the replica process from the quiesced llm.
+
+        Raises:
+            ReplicaError: if the generations of the server process do not finish, so the llm can not be forked safely
+        """
+        # forking after the model is loaded shares the weights with the parent until they are written to
+        context = multiprocessing.get_context("fork")
+        with self._process_lock:
+            connection, child_connection = context.Pipe()
+            process = context.Process(target=_serve_replica, args=(self._llm, child_connection, self._num_threads, self._max_runtime_s),
+                                      name=f"llm-replica-{self.index}", daemon=True)
+            try:
+                with self._llm.quiesced():
+                    process.start()
+            except TimeoutError as e:
+                connection.close()
+                raise ReplicaError(f"Replica {self.index} was not started: {e}")
+            finally:
+                child_connection.close()
+            self._connection, self._process = connection, process
+        logger.info(f"Replica {self.index}: started process {self._process.pid}")
+
+    def stop(self, timeout:float=5):
+        with self._process_lock:
+            if self._process is None:
+                return
+            try:
+                self._connection.send(("stop", None))
+            except (OSError, ValueError):
+                pass
+            self._process.join(timeout)
+            if self._process.is_alive():
+                self._process.kill()
+                self._process.join()
+            self._connection.close()
+            self._process = None
+
+    def restart(self):
+        """Stops the process and forks it again.
+
+        Raises:
+            ReplicaError: if the new process could not be started
+        """
+        logger.warning(f"Replica {self.index}: restarting process")
+        with self._process_lock:
+            self.stop(timeout=1)
+            self.restarts += 1
+            self.start()
+
+    def call(self, command, payload=None, timeout_s:float=None):
+        """Sends a command to the replica process and waits for its result.
+        A replica which does not answer within timeout_s is hung, it is restarted.
+
+        Raises:
+            ReplicaError: if the replica failed to process the command, died or did not answer within timeout_s
+        """
+        with self._lock:
+            self.busy_since = time.time()
+            deadline = self.busy_since + timeout_s if timeout_s is not None else None
+            try:
+                self._connection.send((command, payload))
+                while not self._connection.poll(1.0 if deadline is None else min(1.0, max(deadline - time.time(), 0))):
+                    if not self.is_alive:
+                        self.failures += 1
+                        self._reap()
+                        raise ReplicaError(f"Replica {self.index} died while processing {command}")
+                    if deadline is not None and time.time() >= deadline:
+                        self.failures += 1
+                        logger.warning(f"Replica {self.index}: no answer to {command} within {timeout_s:.1f} seconds, the replica is hung")
+                        self.restart()
+                        raise ReplicaError(f"Replica {self.index} did not answer {command} within {timeout_s:.1f} seconds and was restarted")
+                success, result = self._connection.recv()
+            except (EOFError, OSError) as e:
+                self.failures += 1
+                self._reap()
+                raise ReplicaError(f"Replica {self.index} is not reachable: {e}")
+            finally:
+                self.busy_since = None
+        if not success:
+            self.failures += 1
+            raise ReplicaError(f"Replica {self.index} failed: {result}")
+        self.served += 1
+        return result
+
+    def _reap(self):
+        """Waits for the exit of the dead process, so the health check sees it as dead."""
+        process = self._process
+        if process is not None:
+            process.join(1)
+
+    @property
+    def is_alive(self):
+        return self._process is not None and self._process.is_alive()
+
+    @property
+    def pid(self):
+        return self._process.pid if self._process is not None else None
+
+    def health(self, max_busy_s:float):
+        if not self.is_alive:
+            return REPLICA_DEAD
+        if self.busy_since is not None and time.time() - self.busy_since > max_busy_s:
+            return REPLICA_HUNG
+        return REPLICA_HEALTHY
+
+    def describe(self, max_busy_s:float):
+        return {
+            "index": self.index,
+            "pid": self.pid,
+            "health": self.health(max_busy_s),
+            "in_flight": self.in_flight,
+            "served": self.served,
+            "failures": self.failures,
+            "restarts": self.restarts,
+        }
+
+
+class ReplicaPool:
+    """Serves batches with several forked replicas of a loaded LLMModel and routes every batch to the least loaded replica.
+
+    Can be used as backend of the BatchScheduler.
+    """
+
+    def __init__(self, llm, num_replicas:int, threads_per_replica:int=None, max_runtime_s:float=None):
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise ReplicaError("Replicas need the 'fork' start method which is not available on this platform.")
+        self._llm = llm
+        self._max_runtime_s = max_runtime_s
+        self._lock = threading.Lock()
+        # requests without deadline are cancelled after max_runtime_s within the replica
+        self._replicas = []
+        try:
+            for index in range(num_replicas):
+                self._replicas.append(Replica(index, llm, threads_per_replica, max_runtime_s))
+        except ReplicaError:
+            self.stop()
+            raise
+
+    def answer_questions(self, questions, deadlines=None):
+        """Answers a batch on the least loaded replica, the deadlines are absolute times and keep their meaning in the replica."""
+        replica = self._acquire()
+        try:
+            return replica.call("answer_questions", (questions, deadlines), timeout_s=self._timeout(deadlines, len(questions)))
+        finally:
+            with self._lock:
+                replica.in_flight -= 1
+
+    def _timeout(self, deadlines, count):
+        """Time to wait for the answer of a batch: the watchdog of the replica cancels its requests DEADLINE_GRACE_S after
+        the latest deadline, a replica which did not answer CANCELLED_REQUEST_TIMEOUT_S later is hung.
+
+        Returns:
+            float: the seconds to wait or None if a request has neither a deadline nor a maximum runtime
+        """
+        now = time.time()
+        deadlines = deadlines or [None] * count
+        if None in deadlines:
+            if self._max_runtime_s is None:
+                return None
+            deadlines = [deadline for deadline in deadlines if deadline is not None] + [now + self._max_runtime_s]
+        return max(max(deadlines) - now, 0) + DEADLINE_GRACE_S + CANCELLED_REQUEST_TIMEOUT_S
+
+    def _acquire(self):
+        """Returns the replica with the fewest requests in flight, dead replicas are skipped if possible."""
+        with self._lock:
+            candidates = [replica for replica in self._replicas if replica.is_alive] or self._replicas
+            replica = min(candidates, key=lambda r: r.in_flight)
+            replica.in_flight += 1
+            return replica
+
+    def check_health(self, max_busy_s:float):
+        """Restarts dead replicas and replicas which are busy for longer than max_busy_s.
+
+        Returns:
+            List[str]: the health of each replica before the restarts
+        """
+        states = []
+        for replica in self._replicas:
+            state = replica.health(max_busy_s)
+            states.append(state)
+            if state != REPLICA_HEALTHY:
+                logger.warning(f"Replica {replica.index}: replica is {state}, restarting it")
+                try:
+                    replica.restart()
+                except ReplicaError as e:
+                    logger.warning(f"Replica {replica.index}: {e}, retrying with the next health check")
+        return states
+
+    def restart_all(self):
+        """Forks all replicas again, e.g. after the model in the parent process was reloaded."""
+        for replica in self._replicas:
+            try:
+                replica.restart()
+            except ReplicaError as e:
+                logger.warning(f"Replica {replica.index}: {e}, retrying with the next health check")
+
+    def stop(self):
+        for replica in self._replicas:
+            replica.stop()
+
+    def describe(self, max_busy_s:float):
+        return [replica.describe(max_busy_s) for replica in self._replicas]
+
+    def __len__(self):
+        return len(self._replicas)
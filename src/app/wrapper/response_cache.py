@@ -0,0 +1,113 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from src.app.metrics.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# deployment args which change the answers of the same model, they are part of the cache key
+OUTPUT_DEPLOYMENT_ARGS = ("torch_dtype", "revision", "quantization")
+
+CACHE_HITS = REGISTRY.counter("greenprompt_cache_hits_total", "Prompts answered from the response cache.")
+CACHE_MISSES = REGISTRY.counter("greenprompt_cache_misses_total", "Cacheable prompts which were not found in the response cache.")
+
+
+class ResponseCache:
+    """Caches the answers of deterministic prompting configs.
+
+    The first tier is an in-memory LRU, the optional second tier is a sqlite file which survives restarts.
+    Entries of both tiers expire after ttl_s seconds.
+    """
+
+    def __init__(self, max_entries:int=1024, ttl_s:float=3600, disk_path:str=None):
+        self._max_entries = max_entries
+        self._ttl_s = ttl_s
+        self._entries = OrderedDict()  # key -> (created, value), least recently used first
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._disk = None
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, created REAL, value TEXT)")
+            self._disk.commit()
+
+    @staticmethod
+    def is_deterministic(prompting_config:dict):
+        """Greedy decoding always produces the same answer for the same prompt, sampling does not."""
+        return prompting_config.get("do_sample") is False or prompting_config.get("temperature") == 0
+
+    @staticmethod
+    def make_key(model:str, prompting_config:dict, prompt:str, deployment_config:dict=None):
+        """Builds the cache key from the model, the normalized prompting config, the rendered prompt and
+        the deployment args which change the answers (OUTPUT_DEPLOYMENT_ARGS)."""
+        normalized_config = json.dumps(prompting_config, sort_keys=True, default=str)
+        output_args = {arg: (deployment_config or {}).get(arg) for arg in OUTPUT_DEPLOYMENT_ARGS}
+        normalized_args = json.dumps(output_args, sort_keys=True, default=str)
+        return hashlib.sha256("\x00".join([model, normalized_config, normalized_args, prompt]).encode("utf-8")).hexdigest()
+
+    def get(self, key:str):
+        """Returns the cached value or None if the key is unknown or expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] > self._ttl_s:
+                del self._entries[key]
+                entry = None
+            if entry is None and self._disk is not None:
+                entry = self._get_from_disk(key, now)
+                if entry is not None:
+                    self._store_in_memory(key, entry)
+            if entry is None:
+                self._misses += 1
+                CACHE_MISSES.inc()
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            CACHE_HITS.inc()
+            return dict(entry[1])
+
+    def put(self, key:str, value:dict):
+        entry = (time.time(), dict(value))
+        with self._lock:
+            self._store_in_memory(key, entry)
+            if self._disk is not None:
+                try:
+                    self._disk.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, entry[0], json.dumps(value)))
+                    self._disk.commit()
+                except sqlite3.Error as e:
+                    logger.error(f"Cache: unable to store the response on disk: {e}")
+
+    def _store_in_memory(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def _get_from_disk(self, key, now):
+        try:
+            row = self._disk.execute("SELECT created, value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[0] > self._ttl_s:
+                self._disk.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._disk.commit()
+                return None
+            return row[0], json.loads(row[1])
+        except sqlite3.Error as e:
+            logger.error(f"Cache: unable to read the response from disk: {e}")
+            return None
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self._hits, "misses": self._misses}
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
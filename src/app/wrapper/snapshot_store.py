@@ -0,0 +1,76 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MARKER = "snapshot.json"
+# deployment args which change the stored weights, all other args (e.g. device_map) are applied when loading the snapshot
+SNAPSHOT_RELEVANT_ARGS = ("torch_dtype", "trust_remote_code", "revision")
+
+
+class SnapshotStore:
+    """Keeps loaded models as local snapshots, which contain the weights in the converted dtype as safetensors
+    and the tokenizer assets. Loading a snapshot maps the safetensors files into memory and skips the
+    resolution on hugging face as well as the dtype conversion.
+
+    A snapshot is written to a temporary directory and moved into place together with its marker file,
+    so incomplete snapshots are never loaded.
+    """
+
+    def __init__(self, directory:str):
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(model:str, deployment_config:dict):
+        relevant = {arg: str(deployment_config[arg]) for arg in SNAPSHOT_RELEVANT_ARGS if arg in deployment_config}
+        return hashlib.sha256(json.dumps({"model": model, **relevant}, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    def path(self, model:str, deployment_config:dict):
+        readable_name = re.sub(r"[^A-Za-z0-9._-]+", "_", model).strip("_")[-64:]
+        return os.path.join(self._directory, f"{readable_name}-{self.make_key(model, deployment_config)}")
+
+    def find(self, model:str, deployment_config:dict):
+        """Returns the path of the complete snapshot of the model or None if there is none."""
+        path = self.path(model, deployment_config)
+        return path if os.path.isfile(os.path.join(path, SNAPSHOT_MARKER)) else None
+
+    def save(self, model:str, deployment_config:dict, pipe):
+        """Stores the model and tokenizer of a loaded pipeline as snapshot.
+
+        Returns:
+            str: the path of the snapshot
+        """
+        path = self.path(model, deployment_config)
+        temporary_path = tempfile.mkdtemp(prefix=".incomplete-", dir=self._directory)
+        try:
+            pipe.model.save_pretrained(temporary_path, safe_serialization=True)
+            if pipe.tokenizer is not None:
+                pipe.tokenizer.save_pretrained(temporary_path)
+            with open(os.path.join(temporary_path, SNAPSHOT_MARKER), "w") as marker:
+                json.dump({"model": model, "created": time.time(),
+                           "deployment": {arg: str(deployment_config[arg]) for arg in SNAPSHOT_RELEVANT_ARGS if arg in deployment_config}}, marker)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            os.replace(temporary_path, path)
+        except OSError:
+            if self.find(model, deployment_config) is None:
+                raise
+            logger.info(f"Snapshot: snapshot of {model} was stored by another deployment meanwhile")
+        finally:
+            shutil.rmtree(temporary_path, ignore_errors=True)
+        logger.info(f"Snapshot: stored {model} at {path}")
+        return path
+
+    def remove(self, model:str, deployment_config:dict):
+        shutil.rmtree(self.path(model, deployment_config), ignore_errors=True)
+
+    @property
+    def directory(self):
+        return self._directory
@@ -0,0 +1,79 @@
+"""Builders which are shared by several test modules."""
+from unittest.mock import MagicMock
+
+import torch
+from tokenizers import Tokenizer
+from tokenizers.models import WordLevel
+from tokenizers.pre_tokenizers import Whitespace
+from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+from src.app.sci.energy_sampler import EnergySampler
+from src.app.wrapper.llm_model import LLMModel
+
+
+class FakeSource:
+    """an energy source whose cumulative energy is set by the test"""
+    name = "fake"
+
+    def __init__(self):
+        self.joules = 0.0
+
+    def available(self):
+        return True
+
+    def read_joules(self):
+        return self.joules
+
+    def close(self):
+        pass
+
+
+def sampler_with_samples(samples, capacity=100):
+    """a sampler of a FakeSource which already read the (timestamp, joules) samples"""
+    source = FakeSource()
+    sampler = EnergySampler(sources=[source], capacity=capacity)
+    sampler._source = source
+    for timestamp, joules in samples:
+        source.joules = joules
+        sampler.sample(timestamp)
+    return sampler
+
+
+def create_sampler(power, seconds=100):
+    """a sampler with one sample per second, power(t) is the power in watts during second t"""
+    samples = []
+    joules = 0.0
+    for second in range(seconds + 1):
+        samples.append((float(second), joules))
+        joules += power(second)
+    return sampler_with_samples(samples, capacity=seconds + 1)
+
+
+def tiny_model(dtype=None, vocab_size=32, num_hidden_layers=1, **config):
+    """a random tiny llama model, the same for every call"""
+    torch.manual_seed(0)
+    config = LlamaConfig(vocab_size=vocab_size, hidden_size=16, intermediate_size=32, num_hidden_layers=num_hidden_layers,
+                         num_attention_heads=2, num_key_value_heads=2, pad_token_id=0, **config)
+    model = LlamaForCausalLM(config).eval()
+    return model.to(dtype) if dtype is not None else model
+
+
+def tiny_pipe(words=20, num_hidden_layers=1):
+    """a pipeline of a random tiny llama model with a fast word level tokenizer of the words w0, w1, ..."""
+    vocab = {"[PAD]": 0, "[UNK]": 1, "[EOS]": 2, **{f"w{index}": index + 3 for index in range(words)}}
+    backend = Tokenizer(WordLevel(vocab, unk_token="[UNK]"))
+    backend.pre_tokenizer = Whitespace()
+    pipe = MagicMock()
+    pipe.tokenizer = PreTrainedTokenizerFast(tokenizer_object=backend, unk_token="[UNK]", pad_token="[PAD]", eos_token="[EOS]")
+    pipe.model = tiny_model(vocab_size=len(vocab), num_hidden_layers=num_hidden_layers, eos_token_id=2)
+    return pipe
+
+
+def create_llm(pipe=None, prompting_config=None, deployment_config=None, **configs):
+    """a LLMModel of the model test/model without chat template and prefix cache, which uses the pipe if it is given"""
+    configs.setdefault("prefix_cache_config", {"enabled": False})
+    llm = LLMModel(modeltyp="text-generation", model="test/model", prompting_config=prompting_config or {},
+                   deployment_config=deployment_config or {}, uses_chat_template=False, **configs)
+    if pipe is not None:
+        llm._pipe = pipe
+    return llm
@@ -25,7 +25,7 @@ print("\nHello im a chatbot\n")
 
 while True:
     question = input("Ask the LLM a question:\n")
-    answer = llm.answer_question(question)
+    answer = llm.answer_question(question).text
     print("\nAnswer:")
     print(answer)
     
@@ -0,0 +1,60 @@
+import time
+import unittest
+
+from src.app.metrics.metrics import REQUESTS_SHED
+from src.app.wrapper.admission_control import (SHED_DEADLINE,
+                                               SHED_QUEUE_FULL,
+                                               AdmissionController,
+                                               OverloadError)
+
+
+class TestAdmissionController(unittest.TestCase):
+
+    def test_admits_everything_before_the_first_observation(self):
+        admission = AdmissionController()
+        self.assertIsNone(admission.admit(time.time() + 0.001, requests_ahead=100))
+        self.assertEqual(admission.stats()["admitted"], 1)
+
+    def test_expected_time_grows_with_the_prompts_ahead(self):
+        admission = AdmissionController()
+        admission.observe(completion_tokens=20, tokens_per_second=10)
+        self.assertAlmostEqual(admission.expected_seconds(0), 2)
+        self.assertAlmostEqual(admission.expected_seconds(3), 8)
+
+    def test_observations_are_smoothed(self):
+        admission = AdmissionController(smoothing=0.5)
+        admission.observe(completion_tokens=20, tokens_per_second=10)
+        admission.observe(completion_tokens=40, tokens_per_second=30)
+        admission.observe(completion_tokens=0, tokens_per_second=None)
+        stats = admission.stats()
+        self.assertEqual(stats["decode_tokens_per_second"], 20)
+        self.assertEqual(stats["completion_tokens_per_prompt"], 30)
+
+    def test_sheds_prompts_which_miss_their_deadline(self):
+        admission = AdmissionController()
+        admission.observe(completion_tokens=20, tokens_per_second=10)
+
+        self.assertAlmostEqual(admission.admit(time.time() + 10.5, requests_ahead=4), 10)
+        with self.assertRaises(OverloadError) as context:
+            admission.admit(time.time() + 10.5, requests_ahead=6)
+        self.assertAlmostEqual(context.exception.expected_s, 14)
+        self.assertEqual(context.exception.retry_after_s, 4)
+        admission.admit(None, requests_ahead=6)
+
+        admission.shed(SHED_QUEUE_FULL)
+        self.assertEqual(admission.shed_counts(), {SHED_QUEUE_FULL: 1, SHED_DEADLINE: 1})
+        self.assertEqual(admission.stats()["admitted"], 2)
+
+    def test_shed_increments_the_counter_of_the_reason(self):
+        before = REQUESTS_SHED.labels(reason=SHED_DEADLINE).value
+        AdmissionController().shed(SHED_DEADLINE)
+        self.assertEqual(REQUESTS_SHED.labels(reason=SHED_DEADLINE).value, before + 1)
+
+    def test_retry_after_is_at_least_one_second(self):
+        self.assertEqual(AdmissionController.retry_after_s(None), 1)
+        self.assertEqual(AdmissionController.retry_after_s(0.2), 1)
+        self.assertEqual(AdmissionController.retry_after_s(2.5), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
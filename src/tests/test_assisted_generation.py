@@ -0,0 +1,76 @@
+import copy
+import unittest
+from unittest.mock import MagicMock, patch
+
+import torch
+from transformers import BatchEncoding
+
+from src.app.wrapper.llm_model import GenerationResult
+from src.tests.helpers import create_llm, tiny_model
+
+
+def assisted_llm():
+    """creates a LLMModel with a tiny random model and an identical copy of it as draft model, so every draft token is accepted"""
+    llm = create_llm(MagicMock(), prompting_config={"max_new_tokens": 8, "min_new_tokens": 8, "do_sample": False},
+                     draft_config={"model": "test/draft"})
+    llm._pipe.model = tiny_model()
+    llm._pipe.tokenizer.eos_token_id = 2
+    llm._pipe.tokenizer.pad_token_id = 0
+    llm._pipe.tokenizer.side_effect = lambda texts, **kwargs: BatchEncoding({
+        "input_ids": torch.tensor([[3 + len(text) % 20] * 4 for text in texts]),
+        "attention_mask": torch.ones((len(texts), 4), dtype=torch.long),
+    })
+    llm._pipe.tokenizer.decode.side_effect = lambda tokens, skip_special_tokens: " ".join(map(str, tokens))
+    llm._pipe.tokenizer.get_vocab.return_value = {"a": 0}
+    return llm
+
+
+class TestAssistedGeneration(unittest.TestCase):
+
+    def setUp(self):
+        self.llm = assisted_llm()
+        draft = copy.deepcopy(self.llm._pipe.model)
+        with patch("src.app.wrapper.llm_model.AutoTokenizer") as mock_tokenizer, \
+             patch("src.app.wrapper.llm_model.AutoModelForCausalLM") as mock_model:
+            mock_tokenizer.from_pretrained.return_value.get_vocab.return_value = {"a": 0}
+            mock_model.from_pretrained.return_value.to.return_value = draft
+            self.llm._load_draft()
+
+    def test_single_prompt_is_assisted(self):
+        self.llm._draft_baseline_ms_per_token = 1.0
+        result, = self.llm._generate_batch(["hello"])
+        unassisted, = self.llm._generate_batch(["hello"], use_draft=False)
+
+        self.assertEqual(result.text, unassisted.text)
+        self.assertIsNone(unassisted.assisted)
+        self.assertGreater(result.assisted["draft_tokens"], 0)
+        self.assertEqual(result.assisted["acceptance_rate"], 1.0)
+        self.assertIsNotNone(result.assisted["speedup"])
+        self.assertEqual(self.llm.draft_stats()["generations"], 1)
+
+    def test_batch_is_not_assisted(self):
+        results = self.llm._generate_batch(["hello", "hi"])
+        self.assertEqual([result.assisted for result in results], [None, None])
+
+    def test_acceptance_from_forward_counts(self):
+        result = GenerationResult("", 4, 10, "length", {"prefill": 5.0, "decode": 15.0})
+        # 3 verifications of 9 proposed tokens yield 10 tokens, so 7 proposed tokens were accepted
+        stats = self.llm._assisted_stats(result, {"model": 3, "draft": 9})
+        self.assertEqual(stats["accepted_tokens"], 7)
+        self.assertAlmostEqual(stats["acceptance_rate"], 7 / 9)
+        self.assertIsNone(stats["speedup"])
+
+    def test_draft_needs_same_tokenizer(self):
+        with patch("src.app.wrapper.llm_model.AutoTokenizer") as mock_tokenizer:
+            mock_tokenizer.from_pretrained.return_value.get_vocab.return_value = {"b": 0}
+            with self.assertRaises(ValueError):
+                self.llm._load_draft()
+
+    def test_shutdown_unloads_draft(self):
+        self.llm.shutdown()
+        self.assertFalse(self.llm.draft_stats()["loaded"])
+        self.assertEqual(self.llm._draft_hooks, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.app.sci.energy_attribution import Measurement
+from src.app.wrapper.batch_scheduler import BatchScheduler
+from src.app.wrapper.llm_model import FINISH_STOP, GenerationResult
+
+
+def mock_llm(delay=0.0):
+    """mocks a LLMModel which answers every question with its reversed text"""
+    llm = MagicMock()
+    llm.batch_sizes = []
+
+    def answer_questions(questions, deadlines=None):
+        llm.batch_sizes.append(len(questions))
+        time.sleep(delay)
+        return [GenerationResult(question[::-1], len(question.split()), len(question.split()), FINISH_STOP, {}) for question in questions]
+
+    llm.answer_questions.side_effect = answer_questions
+    return llm
+
+
+class TestBatchScheduler(unittest.TestCase):
+
+    def test_single_prompt(self):
+        llm = mock_llm()
+        scheduler = BatchScheduler(llm)
+        try:
+            result = scheduler.submit("abc").result(timeout=5)
+        finally:
+            scheduler.stop()
+        self.assertEqual(result["answer"], "cba")
+        self.assertEqual(result["prompt_tokens"], 1)
+        self.assertEqual(result["completion_tokens"], 1)
+        self.assertEqual(result["finish_reason"], FINISH_STOP)
+        self.assertEqual(result["batch_size"], 1)
+        self.assertIsNone(result["sci_score"])
+        self.assertEqual(llm.batch_sizes, [1])
+
+    def test_concurrent_prompts_are_batched(self):
+        llm = mock_llm()
+        scheduler = BatchScheduler(llm, max_batch_size=4, max_wait_ms=500)
+        results = {}
+
+        def ask(question):
+            results[question] = scheduler.submit(question).result(timeout=5)
+
+        threads = [threading.Thread(target=ask, args=(f"question {i}",)) for i in range(4)]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            scheduler.stop()
+
+        self.assertEqual(llm.batch_sizes, [4])
+        for question, result in results.items():
+            self.assertEqual(result["answer"], question[::-1])
+            self.assertEqual(result["batch_size"], 4)
+            self.assertGreater(result["tokens_per_second"], 0)
+
+    def test_batch_is_limited_by_max_batch_size(self):
+        llm = mock_llm()
+        scheduler = BatchScheduler(llm, max_batch_size=2, max_wait_ms=200)
+        try:
+            futures = [scheduler.submit(f"q{i}") for i in range(5)]
+            answers = [future.result(timeout=5)["answer"] for future in futures]
+        finally:
+            scheduler.stop()
+        self.assertEqual(answers, [f"q{i}"[::-1] for i in range(5)])
+        self.assertTrue(all(size <= 2 for size in llm.batch_sizes))
+        self.assertEqual(sum(llm.batch_sizes), 5)
+
+    def test_sci_score_is_measured_per_batch(self):
+        llm = mock_llm()
+        scheduler = BatchScheduler(llm, max_batch_size=2, max_wait_ms=500)
+        with patch("src.app.wrapper.batch_scheduler.start_calc_sci_score", return_value=Measurement(time.time(), source="rapl")) as mock_start, \
+             patch("src.app.wrapper.batch_scheduler.end_calc_sci_score", return_value=0.25) as mock_end:
+            try:
+                measured = scheduler.submit("one two", measure_sci=True)
+                unmeasured = scheduler.submit("three", measure_sci=False)
+                measured_result = measured.result(timeout=5)
+                unmeasured_result = unmeasured.result(timeout=5)
+            finally:
+                scheduler.stop()
+        mock_start.assert_called_once()
+        # result count of the batch is the number of generated tokens of both answers
+        self.assertEqual(mock_end.call_args[0][1], 3)
+        self.assertEqual(measured_result["sci_score"], 0.25)
+        self.assertIsNone(unmeasured_result["sci_score"])
+        self.assertEqual(measured_result["energy_source"], "rapl")
+        self.assertEqual(scheduler.last_batch["batch_size"], 2)
+
+    def test_failed_measurement_answers_without_sci_score(self):
+        scheduler = BatchScheduler(mock_llm())
+        with patch("src.app.wrapper.batch_scheduler.start_calc_sci_score", return_value=Measurement(time.time(), source="rapl")), \
+             patch("src.app.wrapper.batch_scheduler.end_calc_sci_score", side_effect=RuntimeError("The energy samples do not cover the start of the measurement.")):
+            try:
+                result = scheduler.submit("abc", measure_sci=True).result(timeout=5)
+            finally:
+                scheduler.stop()
+        self.assertEqual(result["answer"], "cba")
+        self.assertIsNone(result["sci_score"])
+
+    def test_failed_batch_raises_for_every_prompt(self):
+        llm = MagicMock()
+        llm.answer_questions.side_effect = RuntimeError("broken")
+        scheduler = BatchScheduler(llm)
+        try:
+            with self.assertRaises(RuntimeError):
+                scheduler.submit("abc").result(timeout=5)
+        finally:
+            scheduler.stop()
+
+    def test_backend_processes_batches_concurrently(self):
+        llm = mock_llm()
+        backend = mock_llm(delay=0.3)
+        scheduler = BatchScheduler(llm, backend=backend, max_concurrent_batches=2)
+        try:
+            start = time.time()
+            futures = [scheduler.submit(question) for question in ["abc", "def"]]
+            results = [future.result(timeout=5) for future in futures]
+            duration = time.time() - start
+        finally:
+            scheduler.stop()
+        self.assertEqual([result["answer"] for result in results], ["cba", "fed"])
+        self.assertEqual(backend.batch_sizes, [1, 1])
+        self.assertEqual(llm.batch_sizes, [])
+        self.assertLess(duration, 0.55)
+
+
+if __name__ == "__main__":
+    unittest.main()
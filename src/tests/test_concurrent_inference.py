@@ -0,0 +1,71 @@
+import threading
+import unittest
+
+from src.tests.helpers import create_llm, tiny_pipe
+
+WORDS = [f"w{index}" for index in range(60)]
+THREADS = 8
+ROUNDS = 5
+
+
+def question(index):
+    return " ".join(WORDS[(index * 7 + offset) % len(WORDS)] for offset in range(3 + index % 5))
+
+
+class TestConcurrentInference(unittest.TestCase):
+
+    def setUp(self):
+        self.llm = create_llm(tiny_pipe(words=len(WORDS), num_hidden_layers=2), prompting_config={"max_new_tokens": 6, "do_sample": False})
+
+    def test_concurrent_callers_get_their_own_answers(self):
+        questions = [question(index) for index in range(THREADS)]
+        expected = {q: self.llm.answer_question(q).text for q in questions}
+        # the batch path pads and therefore reconfigures the tokenizer while the single prompts are tokenized
+        expected_batch = [result.text for result in self.llm.answer_questions(questions[:3])]
+        errors = []
+        start = threading.Barrier(THREADS + 1)
+
+        def ask(q):
+            try:
+                start.wait()
+                for _ in range(ROUNDS):
+                    result = self.llm.answer_question(q)
+                    self.assertEqual(result.text, expected[q])
+                    self.assertEqual(self.llm.prompt, q)
+                    self.assertEqual(self.llm.message, q)
+                    self.assertEqual(self.llm.answer, expected[q])
+            except Exception as e:
+                errors.append(e)
+
+        def ask_batch():
+            try:
+                start.wait()
+                for _ in range(ROUNDS):
+                    self.assertEqual([result.text for result in self.llm.answer_questions(questions[:3])], expected_batch)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=ask, args=(q,)) for q in questions[1:]] + [threading.Thread(target=ask_batch)]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        for thread in threads:
+            thread.join(60)
+
+        self.assertEqual(errors, [])
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+        # the main thread still sees its own last request
+        self.assertEqual(self.llm.prompt, questions[-1])
+
+    def test_request_state_is_per_thread(self):
+        self.llm.answer_question(question(0))
+        seen = {}
+        thread = threading.Thread(target=lambda: seen.update(prompt=self.llm.prompt, answer=self.llm.answer))
+        thread.start()
+        thread.join()
+        self.assertEqual(seen, {"prompt": None, "answer": None})
+        self.assertEqual(self.llm.prompt, question(0))
+
+
+if __name__ == '__main__':
+    unittest.main()
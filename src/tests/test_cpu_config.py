@@ -0,0 +1,72 @@
+import os
+import threading
+import unittest
+from unittest.mock import patch
+
+import torch
+
+from src.app.wrapper.llm_model import STATUS_FAILURE
+from src.tests.helpers import create_llm
+
+
+def run_in_thread(target):
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(value=target()))
+    thread.start()
+    thread.join(5)
+    return result["value"]
+
+
+@unittest.skipUnless(hasattr(os, "sched_setaffinity"), "cpu affinity is only supported on Linux")
+class TestCPUConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.cores = sorted(os.sched_getaffinity(0))
+
+    def test_generating_thread_is_pinned(self):
+        llm = create_llm(deployment_config={"num_threads": 1, "cpu_affinity": self.cores[:1]})
+
+        def generate():
+            with llm._generation():
+                return os.sched_getaffinity(0), torch.get_num_threads()
+
+        affinity, num_threads = run_in_thread(generate)
+        self.assertEqual(affinity, set(self.cores[:1]))
+        self.assertEqual(num_threads, 1)
+        # the other threads keep their affinity
+        self.assertEqual(sorted(os.sched_getaffinity(0)), self.cores)
+        self.assertEqual(llm.cpu_settings["configured"]["cpu_affinity"], self.cores[:1])
+        self.assertEqual(llm.cpu_settings["effective"]["cpu_affinity"], self.cores[:1])
+
+    def test_thread_shared_by_two_models(self):
+        pinned = create_llm(deployment_config={"cpu_affinity": self.cores[:1]})
+        unpinned = create_llm()
+
+        def generate():
+            affinities = []
+            for llm in (pinned, unpinned):
+                with llm._generation():
+                    affinities.append(sorted(os.sched_getaffinity(0)))
+            return affinities
+
+        self.assertEqual(run_in_thread(generate), [self.cores[:1], self.cores])
+
+    def test_cpu_args_are_not_passed_to_pipeline(self):
+        llm = create_llm(deployment_config={"num_threads": 1, "cpu_affinity": self.cores[:1], "torch_dtype": "auto"})
+        with patch("src.app.wrapper.llm_model.AutoConfig"), \
+             patch("src.app.wrapper.llm_model.pipeline") as mock_pipeline, \
+             patch.object(llm, "_isresponsive", return_value=True):
+            run_in_thread(llm.download_model)
+        self.assertEqual(mock_pipeline.call_args.kwargs, {"model": "test/model", "torch_dtype": "auto"})
+
+    def test_invalid_affinity_fails_the_deployment(self):
+        llm = create_llm(deployment_config={"cpu_affinity": [self.cores[-1] + 100000]})
+        with patch("src.app.wrapper.llm_model.AutoConfig"), \
+             patch("src.app.wrapper.llm_model.pipeline") as mock_pipeline:
+            run_in_thread(llm.download_model)
+        self.assertEqual(llm.status, STATUS_FAILURE)
+        mock_pipeline.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from src.app.wrapper.llm_model import (FINISH_CANCELLED, FINISH_LENGTH,
+                                       FINISH_STOP, FINISH_TRUNCATED,
+                                       GenerationResult, RequestContext)
+from src.app.wrapper.llm_wrapper import CANCELLED_REQUEST_TIMEOUT_S, LLMWrapper
+from src.tests.helpers import create_llm, tiny_pipe
+
+
+def fixed_length_llm(max_new_tokens):
+    # min_new_tokens keeps the random model from stopping with an end of sequence token
+    return create_llm(tiny_pipe(), prompting_config={"max_new_tokens": max_new_tokens, "min_new_tokens": max_new_tokens, "do_sample": False})
+
+
+class TestDeadlines(unittest.TestCase):
+
+    def test_expired_request_is_truncated_while_the_batch_continues(self):
+        llm = fixed_length_llm(max_new_tokens=8)
+        truncated, finished = llm.answer_questions(["w1 w2", "w3 w4 w5"], deadlines=[time.time() - 1, time.time() + 60])
+
+        self.assertEqual((truncated.finish_reason, truncated.completion_tokens), (FINISH_TRUNCATED, 1))
+        self.assertEqual(len(truncated.text.split()), 1)
+        self.assertEqual((finished.finish_reason, finished.completion_tokens), (FINISH_LENGTH, 8))
+        self.assertEqual(llm.active_requests(), [])
+
+    def test_cancel_single_request(self):
+        llm = fixed_length_llm(max_new_tokens=5000)
+        results = []
+        generation = threading.Thread(target=lambda: results.append(llm.answer_question("w1 w2")))
+        generation.start()
+        deadline = time.time() + 10
+        while not llm.active_requests() and time.time() < deadline:
+            time.sleep(0.01)
+        context, = llm.active_requests()
+
+        self.assertTrue(llm.cancel_request(context))
+        generation.join(10)
+        self.assertFalse(generation.is_alive())
+        self.assertEqual(results[0].finish_reason, FINISH_CANCELLED)
+        self.assertLess(results[0].completion_tokens, 5000)
+        self.assertFalse(llm.cancel_request(context))
+
+
+class TestDeadlineWatchdog(unittest.TestCase):
+
+    def setUp(self):
+        with patch("src.app.wrapper.llm_wrapper.LLMModel") as MockModel:
+            self.llm = MockModel.return_value
+            self.llm.model = "test-model"
+            self.llm.prompting_config = {"do_sample": False}
+            self.llm.render_prompt.side_effect = lambda question: question
+            self.wrapper = LLMWrapper(modeltyp="text-generation", model="test-model", prompting_config={"do_sample": False}, deployment_config={})
+
+    def tearDown(self):
+        self.wrapper.shutdown_llm()
+
+    def test_overdue_requests_are_cancelled_without_restart(self):
+        overdue = RequestContext(deadline=time.time() - 60)
+        running = RequestContext(deadline=time.time() + 60)
+        dreaming = RequestContext(start_time=time.time() - 1000)
+        self.llm.active_requests.return_value = [overdue, running, dreaming]
+
+        with patch.object(self.wrapper, "restart_llm") as mock_restart:
+            self.assertEqual(self.wrapper.check_deadlines(), 2)
+        self.assertEqual([call.args[0] for call in self.llm.cancel_request.call_args_list], [overdue, dreaming])
+        mock_restart.assert_not_called()
+
+    def test_cancelled_request_which_does_not_stop_restarts_the_model(self):
+        hung = RequestContext(deadline=time.time() - 600)
+        hung.cancel()
+        hung.cancelled_at -= CANCELLED_REQUEST_TIMEOUT_S + 1
+        self.llm.active_requests.return_value = [hung]
+
+        with patch.object(self.wrapper, "restart_llm") as mock_restart:
+            self.assertEqual(self.wrapper.check_deadlines(), 0)
+        mock_restart.assert_called_once()
+
+    def test_monitoring_runs_until_shutdown(self):
+        self.wrapper.start_monitoring()
+        self.assertEqual(len(self.wrapper._monitoring.jobs), 2)
+        self.wrapper.shutdown_llm()
+        self.assertEqual(self.wrapper._monitoring.jobs, [])
+        self.assertIsNone(self.wrapper._continous_task)
+
+    def test_truncated_answers_are_not_cached(self):
+        self.llm.answer_questions.side_effect = lambda questions, deadlines=None: [
+            GenerationResult("partial", 1, 1, FINISH_TRUNCATED if deadline is not None else FINISH_STOP, {})
+            for deadline in deadlines]
+
+        first = self.wrapper.process_prompt("hello", deadline=time.time())
+        second = self.wrapper.process_prompt("hello")
+        third = self.wrapper.process_prompt("hello")
+
+        self.assertEqual(first["finish_reason"], FINISH_TRUNCATED)
+        self.assertEqual(second["finish_reason"], FINISH_STOP)
+        self.assertTrue(third["cached"])
+        self.assertEqual(self.llm.answer_questions.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
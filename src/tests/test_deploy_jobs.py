@@ -0,0 +1,68 @@
+import threading
+import time
+import unittest
+
+from src.app.wrapper.deploy_jobs import JOB_FAILED, JOB_QUEUED, JOB_READY, DeployJob, DeployJobManager
+
+
+class TestDeployJobs(unittest.TestCase):
+
+    def test_phases_are_timed(self):
+        job = DeployJob("name", "org/model")
+        self.assertEqual(job.state, JOB_QUEUED)
+        job.enter_phase("resolving")
+        time.sleep(0.02)
+        job.enter_phase("loading weights")
+        job.finish()
+
+        description = job.describe()
+        self.assertEqual(description["state"], JOB_READY)
+        self.assertEqual([phase["phase"] for phase in description["phases"]], ["queued", "resolving", "loading weights"])
+        self.assertGreaterEqual(description["phases"][1]["duration_s"], 0.02)
+        self.assertTrue(job.done)
+
+    def test_running_phase_is_described(self):
+        job = DeployJob("name", "org/model")
+        job.enter_phase("warmup")
+        self.assertEqual(job.describe()["phases"][-1]["phase"], "warmup")
+        self.assertFalse(job.done)
+
+    def test_manager_runs_jobs_in_background(self):
+        manager = DeployJobManager()
+        release = threading.Event()
+
+        def run(job):
+            job.enter_phase("loading weights")
+            release.wait(5)
+
+        job = manager.submit("name", "org/model", run)
+        self.assertIs(manager.get(job.id), job)
+        self.assertFalse(job.done)
+        release.set()
+        deadline = time.time() + 5
+        while not job.done and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(job.state, JOB_READY)
+
+    def test_failed_job(self):
+        manager = DeployJobManager()
+
+        def run(job):
+            raise RuntimeError("out of memory")
+
+        job = manager.submit("name", "org/model", run)
+        deadline = time.time() + 5
+        while not job.done and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(job.state, JOB_FAILED)
+        self.assertEqual(job.describe()["error"], "out of memory")
+
+    def test_old_jobs_are_dropped(self):
+        manager = DeployJobManager(max_jobs=2)
+        jobs = [manager.submit("name", "org/model", lambda job: None) for _ in range(3)]
+        self.assertIsNone(manager.get(jobs[0].id))
+        self.assertIs(manager.get(jobs[2].id), jobs[2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import random
+import unittest
+from unittest.mock import patch
+
+from src.app.sci.energy_attribution import EnergyAttributor
+from src.tests.helpers import create_sampler
+
+
+def union_energy(sampler, windows):
+    """the measured energy of the time covered by at least one window"""
+    energy = 0.0
+    covered_until = None
+    for start, end in sorted(windows):
+        if covered_until is not None and start < covered_until:
+            start = covered_until
+        if end > start:
+            energy += sampler.energy_between(start, end)
+            covered_until = end
+    return energy
+
+
+class TestEnergyAttributor(unittest.TestCase):
+
+    def test_single_window_gets_the_whole_energy(self):
+        attributor = EnergyAttributor(create_sampler(lambda second: 10))
+        measurement = attributor.begin(10.0)
+        self.assertAlmostEqual(attributor.finish(measurement, 50, end_time=20.0), 100)
+
+    def test_overlap_is_split_instead_of_counted_twice(self):
+        attributor = EnergyAttributor(create_sampler(lambda second: 10))
+        first = attributor.begin(10.0)
+        second = attributor.begin(15.0)
+        # 15..20 is shared by both, the running second window is weighted like the finished one
+        self.assertAlmostEqual(attributor.finish(first, 100, end_time=20.0), 50 + 25)
+        self.assertAlmostEqual(attributor.finish(second, 50, end_time=25.0), 25 + 50)
+        self.assertAlmostEqual(attributor.stats()["attributed_joules"], 150)
+
+    def test_split_in_proportion_to_the_token_rate(self):
+        attributor = EnergyAttributor(create_sampler(lambda second: 10), smoothing=1.0)
+        # a finished window sets the expected rate of running windows to 20 tokens per second
+        attributor.finish(attributor.begin(0.0), 100, end_time=5.0)
+
+        slow = attributor.begin(10.0)
+        running = attributor.begin(10.0)
+        self.assertAlmostEqual(attributor.finish(slow, 100, end_time=20.0), 100 * 10 / 30)
+        self.assertAlmostEqual(attributor.finish(running, 400, end_time=30.0), 100 * 20 / 30 + 100)
+
+    def test_out_of_order_finish_is_not_charged_twice(self):
+        attributor = EnergyAttributor(create_sampler(lambda second: 10))
+        first, late, last = attributor.begin(0.0), attributor.begin(0.0), attributor.begin(0.0)
+        attributed = attributor.finish(first, 10, end_time=10.0)
+        # the end was recorded before the first window settled, like a batch whose end_time is passed later
+        attributed += attributor.finish(late, 10, end_time=5.0)
+        attributed += attributor.finish(last, 10, end_time=12.0)
+        self.assertAlmostEqual(attributed, 120)
+        self.assertAlmostEqual(attributor.stats()["attributed_joules"], 120)
+        self.assertEqual(late.end_time, 10.0)
+
+    def test_failed_read_leaves_the_time_unsettled(self):
+        sampler = create_sampler(lambda second: 10)
+        attributor = EnergyAttributor(sampler)
+        failing, other = attributor.begin(0.0), attributor.begin(0.0)
+        with patch.object(sampler, "energy_between", side_effect=OSError("source busy")):
+            with self.assertRaises(OSError):
+                attributor.finish(failing, 10, end_time=5.0)
+        # the failed window is given up, the time up to its end is settled by the next window
+        self.assertAlmostEqual(attributor.finish(other, 10, end_time=10.0), 100)
+        self.assertEqual(attributor.stats()["open_windows"], 0)
+
+    def test_idle_time_is_not_attributed(self):
+        attributor = EnergyAttributor(create_sampler(lambda second: 10))
+        attributor.finish(attributor.begin(0.0), 10, end_time=5.0)
+        attributor.finish(attributor.begin(10.0), 10, end_time=15.0)
+        self.assertAlmostEqual(attributor.stats()["attributed_joules"], 100)
+
+    def test_windows_without_tokens_share_equally(self):
+        attributor = EnergyAttributor(create_sampler(lambda second: 10))
+        first, second = attributor.begin(0.0), attributor.begin(0.0)
+        self.assertAlmostEqual(attributor.finish(first, 0, end_time=10.0), 50)
+        self.assertAlmostEqual(attributor.finish(second, 0, end_time=10.0), 50)
+
+    def test_attributed_energy_adds_up_to_the_measured_energy(self):
+        generator = random.Random(7)
+        sampler = create_sampler(lambda second: 5 + generator.random() * 20)
+        attributor = EnergyAttributor(sampler)
+        windows = []
+        for _ in range(40):
+            start = generator.uniform(0, 90)
+            windows.append((start, start + generator.uniform(0.05, 10), generator.randint(0, 500)))
+
+        # the windows are opened and closed in the order of time like by concurrent requests
+        events = sorted([(start, "begin", index) for index, (start, _, _) in enumerate(windows)] +
+                        [(end, "finish", index) for index, (_, end, _) in enumerate(windows)])
+        measurements = {}
+        attributed = 0.0
+        for time, action, index in events:
+            if action == "begin":
+                measurements[index] = attributor.begin(time)
+            else:
+                attributed += attributor.finish(measurements[index], windows[index][2], end_time=time)
+
+        expected = union_energy(sampler, [(start, end) for start, end, _ in windows])
+        self.assertAlmostEqual(attributed, expected, places=6)
+        self.assertEqual(attributor.stats()["open_windows"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
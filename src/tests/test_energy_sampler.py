@@ -0,0 +1,119 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.app.sci import sci_score
+from src.app.sci.energy_attribution import EnergyAttributor
+from src.app.sci.energy_sampler import EnergySampler
+from src.app.sci.energy_sources import (SOURCE_CPU_MODEL, SOURCE_RAPL,
+                                        CpuModelSource, PowerstatSource,
+                                        RaplSource)
+from src.tests.helpers import sampler_with_samples
+
+
+def write_zone(root, zone, name, energy_uj, max_energy_range_uj=1000000000):
+    """writes a powercap zone like the kernel exposes it in /sys/class/powercap"""
+    path = os.path.join(root, zone)
+    os.makedirs(path, exist_ok=True)
+    for file, value in (("name", name), ("energy_uj", energy_uj), ("max_energy_range_uj", max_energy_range_uj)):
+        with open(os.path.join(path, file), "w") as f:
+            f.write(f"{value}\n")
+
+
+class TestRaplSource(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.root = self._directory.name
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_packages_are_added_without_sub_zones(self):
+        write_zone(self.root, "intel-rapl:0", "package-0", 1000000)
+        write_zone(self.root, "intel-rapl:0:0", "core", 500000)
+        write_zone(self.root, "intel-rapl:1", "package-1", 2000000)
+        source = RaplSource(self.root)
+        self.assertTrue(source.available())
+
+        write_zone(self.root, "intel-rapl:0", "package-0", 3000000)
+        write_zone(self.root, "intel-rapl:0:0", "core", 9000000)
+        write_zone(self.root, "intel-rapl:1", "package-1", 2500000)
+        self.assertAlmostEqual(source.read_joules(), 2.5)
+
+    def test_counter_wrap_around(self):
+        write_zone(self.root, "intel-rapl:0", "package-0", 900, max_energy_range_uj=1000)
+        source = RaplSource(self.root)
+        self.assertTrue(source.available())
+        write_zone(self.root, "intel-rapl:0", "package-0", 100, max_energy_range_uj=1000)
+        self.assertAlmostEqual(source.read_joules(), 200 / 1e6)
+
+    def test_psys_replaces_the_packages(self):
+        write_zone(self.root, "intel-rapl:0", "package-0", 0)
+        write_zone(self.root, "intel-rapl:1", "psys", 0)
+        source = RaplSource(self.root)
+        self.assertTrue(source.available())
+        write_zone(self.root, "intel-rapl:0", "package-0", 1000000)
+        write_zone(self.root, "intel-rapl:1", "psys", 3000000)
+        self.assertAlmostEqual(source.read_joules(), 3)
+
+    def test_unavailable_without_zones(self):
+        self.assertFalse(RaplSource(self.root).available())
+
+    def test_sampler_falls_back_without_counters(self):
+        sampler = EnergySampler(sources=[RaplSource(self.root), PowerstatSource(command=["/nonexistent/powerstat"]), CpuModelSource()])
+        try:
+            sampler.start()
+            self.assertEqual(sampler.source, SOURCE_CPU_MODEL)
+        finally:
+            sampler.stop()
+
+    def test_sampler_reads_the_counters(self):
+        write_zone(self.root, "intel-rapl:0", "package-0", 0)
+        sampler = EnergySampler(sources=[RaplSource(self.root), CpuModelSource()], interval_s=60)
+        try:
+            sampler.start()
+            self.assertEqual(sampler.source, SOURCE_RAPL)
+            start = sampler.latest_time
+            write_zone(self.root, "intel-rapl:0", "package-0", 4000000)
+            self.assertAlmostEqual(sampler.energy_between(start), 4)
+        finally:
+            sampler.stop()
+
+
+class TestEnergySampler(unittest.TestCase):
+
+    def test_energy_is_interpolated_within_the_samples(self):
+        # 10 watts for the first second, 30 watts for the second one
+        sampler = sampler_with_samples([(100.0, 0.0), (101.0, 10.0), (102.0, 40.0)])
+        self.assertAlmostEqual(sampler.energy_between(100.0, 102.0), 40)
+        self.assertAlmostEqual(sampler.energy_between(100.5, 101.5), 5 + 15)
+        # requests shorter than the sample interval get the average power of their interval
+        self.assertAlmostEqual(sampler.energy_between(101.2, 101.3), 3)
+
+    def test_window_before_the_buffer_is_rejected(self):
+        sampler = sampler_with_samples([(float(t), float(t)) for t in range(10)], capacity=4)
+        self.assertAlmostEqual(sampler.energy_between(7.5, 9.0), 1.5)
+        with self.assertRaises(RuntimeError):
+            sampler.energy_between(2.0, 9.0)
+
+    def test_open_window_takes_a_fresh_sample(self):
+        sampler = sampler_with_samples([(100.0, 0.0)])
+        sampler._source.joules = 7.0
+        self.assertAlmostEqual(sampler.energy_between(100.0), 7)
+
+    def test_sci_score_from_the_sampler(self):
+        sampler = sampler_with_samples([(100.0, 0.0), (101.0, 3600.0)])
+        attributor = EnergyAttributor(sampler)
+        energy = []
+        with patch.object(sci_score, "get_energy_attributor", return_value=attributor):
+            measurement = attributor.begin(100.0)
+            score = sci_score.end_calc_sci_score(measurement, 2, "DE", energy_callback=energy.append, end_time=101.0)
+        self.assertEqual(energy, [3600.0])
+        # 0.001 kWh at 300 g/kWh plus the same amount as hardware carbon, shared by 2 results
+        self.assertAlmostEqual(score, 0.3)
+
+
+if __name__ == '__main__':
+    unittest.main()
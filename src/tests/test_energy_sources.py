@@ -0,0 +1,108 @@
+import json
+import os
+import tempfile
+import unittest
+from collections import namedtuple
+from unittest.mock import patch
+
+import psutil
+
+from src.app.sci.energy_sources import (SOURCE_CPU_MODEL, SOURCE_POWERSTAT,
+                                        SOURCE_RAPL, CpuModelSource,
+                                        EnergySource, create_sources,
+                                        register_energy_source)
+
+CpuTimes = namedtuple("CpuTimes", ["user", "system"])
+
+
+class FakeProcess:
+    def __init__(self, pid, seconds=0.0, children=()):
+        self.pid = pid
+        self.seconds = seconds
+        self.exited = False
+        self._children = list(children)
+
+    def cpu_times(self):
+        if self.exited:
+            raise psutil.NoSuchProcess(self.pid)
+        return CpuTimes(user=self.seconds * 0.75, system=self.seconds * 0.25)
+
+    def children(self, recursive=False):
+        return self._children
+
+
+class ConstantSource(EnergySource):
+    name = "constant"
+
+    def available(self):
+        return True
+
+    def read_joules(self):
+        return 0.0
+
+
+class TestCpuModelSource(unittest.TestCase):
+
+    def test_power_follows_the_cpu_time_of_the_process_tree(self):
+        child = FakeProcess(2)
+        process = FakeProcess(1, children=[child])
+        source = CpuModelSource(tdp_w=100, idle_w=20, process=process, cpu_count=2)
+        with patch("src.app.sci.energy_sources.time.time", return_value=0.0):
+            self.assertTrue(source.available())
+
+        # 10 of 20 available cpu seconds are used: 20 W + 80 W * 0.5
+        process.seconds, child.seconds = 5.0, 5.0
+        with patch("src.app.sci.energy_sources.time.time", return_value=10.0):
+            self.assertAlmostEqual(source.read_joules(), 600)
+
+        # an exited child does not reduce the cpu time, the idle power remains
+        child.exited = True
+        with patch("src.app.sci.energy_sources.time.time", return_value=20.0):
+            self.assertAlmostEqual(source.read_joules(), 600 + 200)
+
+    def test_utilization_is_capped(self):
+        process = FakeProcess(1)
+        source = CpuModelSource(tdp_w=50, idle_w=0, process=process, cpu_count=1)
+        with patch("src.app.sci.energy_sources.time.time", return_value=0.0):
+            source.read_joules()
+        process.seconds = 30.0
+        with patch("src.app.sci.energy_sources.time.time", return_value=10.0):
+            self.assertAlmostEqual(source.read_joules(), 500)
+
+    def test_profile_of_the_host(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as file:
+            json.dump({"node-1": {"tdp_w": 125, "idle_w": 25}, "default": {"tdp_w": 45}}, file)
+        try:
+            with patch.dict(os.environ, {}, clear=False):
+                os.environ.pop("CPU_TDP_W", None)
+                os.environ.pop("CPU_IDLE_W", None)
+                node = CpuModelSource.from_profile(file.name, hostname="node-1")
+                other = CpuModelSource.from_profile(file.name, hostname="node-2")
+                os.environ["CPU_TDP_W"] = "80"
+                overridden = CpuModelSource.from_profile(file.name, hostname="node-1")
+        finally:
+            os.unlink(file.name)
+        self.assertEqual((node.tdp_w, node.idle_w), (125, 25))
+        self.assertEqual((other.tdp_w, other.idle_w), (45, 0))
+        self.assertEqual((overridden.tdp_w, overridden.idle_w), (80, 25))
+
+
+class TestCreateSources(unittest.TestCase):
+
+    def test_default_order(self):
+        self.assertEqual([source.name for source in create_sources()], [SOURCE_RAPL, SOURCE_POWERSTAT, SOURCE_CPU_MODEL])
+
+    def test_cpu_model_is_the_last_resort(self):
+        self.assertEqual([source.name for source in create_sources("rapl")], [SOURCE_RAPL, SOURCE_CPU_MODEL])
+
+    def test_registered_source(self):
+        register_energy_source("constant", ConstantSource)
+        self.assertEqual([source.name for source in create_sources("constant, cpu_model")], ["constant", SOURCE_CPU_MODEL])
+
+    def test_unknown_source(self):
+        with self.assertRaises(ValueError):
+            create_sources("rapl,wattmeter")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+from unittest.mock import MagicMock
+
+import torch
+from transformers import BatchEncoding
+
+from src.app.wrapper.llm_model import (FINISH_CANCELLED, FINISH_LENGTH,
+                                       FINISH_STOP, TIMING_DECODE,
+                                       TIMING_DETOKENIZATION, TIMING_PREFILL,
+                                       TIMING_TOKENIZATION, LLMModel)
+from src.tests.helpers import create_llm
+
+EOS = 2
+PAD = 0
+
+
+def mock_pipe(generated):
+    """mocks a decoder-only pipeline whose model appends the given tokens to the left padded prompts"""
+    pipe = MagicMock()
+    pipe.tokenizer.eos_token_id = EOS
+    pipe.tokenizer.pad_token_id = PAD
+
+    def tokenize(texts, **kwargs):
+        rows = [[1] * len(text.split()) for text in texts]
+        width = max(len(row) for row in rows)
+        return BatchEncoding({
+            "input_ids": torch.tensor([[PAD] * (width - len(row)) + row for row in rows]),
+            "attention_mask": torch.tensor([[0] * (width - len(row)) + [1] * len(row) for row in rows]),
+        })
+
+    pipe.tokenizer.side_effect = tokenize
+    pipe.tokenizer.decode.side_effect = lambda tokens, skip_special_tokens: " ".join(str(token) for token in tokens if token != EOS)
+    pipe.model.device = "cpu"
+    pipe.model.config.is_encoder_decoder = False
+    pipe.model.generation_config.eos_token_id = EOS
+    pipe.model.generation_config.max_new_tokens = None
+    pipe.model.generate.side_effect = lambda input_ids, **kwargs: torch.cat([input_ids, torch.tensor(generated)], dim=1)
+    return pipe
+
+
+def generating_llm(generated, max_new_tokens=4):
+    return create_llm(mock_pipe(generated), prompting_config={"max_new_tokens": max_new_tokens})
+
+
+class TestGenerationResult(unittest.TestCase):
+
+    def test_completion_tokens_are_cut_after_eos(self):
+        self.assertEqual(LLMModel._completion_tokens([5, 6, EOS, PAD, PAD], {EOS}), [5, 6, EOS])
+        self.assertEqual(LLMModel._completion_tokens([5, 6, 7], {EOS}), [5, 6, 7])
+
+    def test_batch_counts_tokens_per_prompt(self):
+        llm = generating_llm([[5, EOS, EOS, EOS], [5, 6, 7, 8]])
+        short, long = llm._generate_batch(["one", "one two three"])
+
+        self.assertEqual((short.text, short.prompt_tokens, short.completion_tokens, short.finish_reason), ("5", 1, 2, FINISH_STOP))
+        self.assertEqual((long.text, long.prompt_tokens, long.completion_tokens, long.finish_reason), ("5 6 7 8", 3, 4, FINISH_LENGTH))
+        self.assertEqual(set(short.timings_ms), {TIMING_TOKENIZATION, TIMING_PREFILL, TIMING_DECODE, TIMING_DETOKENIZATION})
+
+    def test_cancelled_generation(self):
+        llm = generating_llm([[5]])
+        llm._cancel_event.set()
+        result, = llm._generate_batch(["one"])
+        self.assertEqual(result.finish_reason, FINISH_CANCELLED)
+        self.assertEqual(result.completion_tokens, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
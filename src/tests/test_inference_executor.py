@@ -0,0 +1,72 @@
+import asyncio
+import threading
+import unittest
+
+from src.app.wrapper.inference_executor import InferenceExecutor, QueueFullError
+
+
+class TestInferenceExecutor(unittest.TestCase):
+
+    def test_run_returns_result_and_wait_time(self):
+        executor = InferenceExecutor(max_queue_size=2)
+        try:
+            result, wait_time_ms = asyncio.run(executor.run(lambda x: x * 2, 21))
+            self.assertEqual(result, 42)
+            self.assertGreaterEqual(wait_time_ms, 0)
+            self.assertEqual(executor.stats()["queue_depth"], 0)
+            self.assertEqual(executor.stats()["in_flight"], 0)
+        finally:
+            executor.shutdown()
+
+    def test_queue_full(self):
+        executor = InferenceExecutor(max_queue_size=1)
+        release = threading.Event()
+        started = threading.Event()
+
+        def blocking():
+            started.set()
+            release.wait(5)
+            return "done"
+
+        async def scenario():
+            running = asyncio.ensure_future(executor.run(blocking))
+            await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+            waiting = asyncio.ensure_future(executor.run(lambda: "second"))
+            await asyncio.sleep(0)
+            self.assertEqual(executor.queue_depth, 1)
+            self.assertEqual(executor.in_flight, 1)
+            with self.assertRaises(QueueFullError):
+                await executor.run(lambda: "rejected")
+            release.set()
+            return await running, await waiting
+
+        try:
+            (first, _), (second, second_wait) = asyncio.run(scenario())
+            self.assertEqual(first, "done")
+            self.assertEqual(second, "second")
+            self.assertGreater(second_wait, 0)
+        finally:
+            release.set()
+            executor.shutdown()
+
+    def test_event_loop_stays_responsive(self):
+        executor = InferenceExecutor(max_queue_size=1)
+        release = threading.Event()
+
+        async def scenario():
+            running = asyncio.ensure_future(executor.run(release.wait, 5))
+            # the loop can still serve other coroutines while the inference thread blocks
+            await asyncio.sleep(0.05)
+            self.assertFalse(running.done())
+            release.set()
+            await running
+
+        try:
+            asyncio.run(scenario())
+        finally:
+            release.set()
+            executor.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
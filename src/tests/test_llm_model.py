@@ -1,5 +1,6 @@
 import unittest
 import time
+import tempfile
 from src.app.wrapper.llm_model import LLMModel, STATUS_FAILURE, STATUS_IDLE, STATUS_NOT_READY, STATUS_READY
 import torch
 
@@ -37,13 +38,11 @@ class TestLLMModel(unittest.TestCase):
         self.assertIsNone(llm._pipe)
         self.assertIsNone(llm.message)
         self.assertIsNone(llm.answer)
-        self.assertIsNone(llm._prompt)
+        self.assertIsNone(llm.prompt)
         self.assertEqual(llm.status, STATUS_NOT_READY)
         self.assertIsNotNone(llm._process)
-        self.assertGreater(llm._init_memory_usage, 0)
         self.assertEqual(llm._restart_attempt, 0)
         self.assertIsNotNone(llm._process)
-        self.assertGreater(llm._init_memory_usage, 0)
         self.assertEqual(llm._restart_attempt, 0)
 
     def test_download_model(self):
@@ -51,9 +50,12 @@ class TestLLMModel(unittest.TestCase):
         self.assertIsNone(llm._pipe)
         self.assertEqual(llm.status, STATUS_NOT_READY)
 
-        llm.download_model()
+        phases = []
+        llm.download_model(progress_callback=phases.append)
         self.assertIsNotNone(llm._pipe)
         self.assertEqual(llm.status, STATUS_READY)
+        self.assertEqual(phases, ["resolving", "loading weights", "warmup"])
+        self.assertEqual(set(llm.load_timings), set(phases))
         
     def test_answer_question(self):
         llm = LLMModel(modeltyp=modeltyp, model = model, prompting_config=prompting, deployment_config=deployment, **uses_chat_template)
@@ -61,11 +63,11 @@ class TestLLMModel(unittest.TestCase):
 
         math_question = "Whats 17 + 25?"
         expected_math_answer = "42"
-        math_answer = llm.answer_question(math_question)
+        math_answer = llm.answer_question(math_question).text
         
         question = "Whats the capitol of germany?"
         expected_answer = "Berlin"
-        answer = llm.answer_question(question)
+        answer = llm.answer_question(question).text
 
         self.assertIn(expected_math_answer, math_answer)
         self.assertIn(expected_answer, answer)  
@@ -77,10 +79,40 @@ class TestLLMModel(unittest.TestCase):
         llm.download_model()
         self.assertTrue(llm._isresponsive())
         
+    def test_prefix_cache(self):
+        greedy = {"max_new_tokens": 32, "do_sample": False}
+        llm = LLMModel(modeltyp=modeltyp, model = model, prompting_config=greedy, deployment_config=deployment, system_prompt="You are a helpful geography teacher.", **uses_chat_template)
+        uncached = LLMModel(modeltyp=modeltyp, model = model, prompting_config=greedy, deployment_config=deployment, prefix_cache_config={"enabled": False}, system_prompt="You are a helpful geography teacher.", **uses_chat_template)
+        llm.download_model()
+        uncached.download_model()
+
+        question = "Whats the capitol of germany?"
+        self.assertEqual(llm.answer_question(question).text.strip(), uncached.answer_question(question).text.strip())
+        stats = llm.prefix_cache_stats()
+        self.assertEqual(stats["entries"], 1)
+        self.assertGreater(stats["hits"], 0)
+        self.assertIsNotNone(stats["avg_prefill_ms_cached"])
+        self.assertIsNone(uncached.prefix_cache_stats())
+
+    def test_stream_answer(self):
+        llm = LLMModel(modeltyp=modeltyp, model = model, prompting_config=prompting, deployment_config=deployment, **uses_chat_template)
+        self.assertEqual(list(llm.stream_answer("Whats the capitol of germany?")), [])
+
+        llm.download_model()
+        events = list(llm.stream_answer("Whats the capitol of germany?"))
+        done = events[-1]
+
+        self.assertEqual(done["type"], "done")
+        self.assertTrue(all(event["type"] == "token" for event in events[:-1]))
+        self.assertEqual(done["answer"], "".join(event["text"] for event in events[:-1]))
+        self.assertIn("Berlin", done["answer"])
+        self.assertGreater(done["completion_tokens"], 0)
+        self.assertLessEqual(done["time_to_first_token_ms"], done["total_time_ms"])
+
     def test_isresponsive_unresponsive(self):
         llm = LLMModel(modeltyp=modeltyp, model = model, prompting_config=prompting, deployment_config=deployment, **uses_chat_template)
         llm.download_model()
-        llm.answer_question = lambda x: None 
+        llm.answer_question = lambda *args, **kwargs: None
         self.assertFalse(llm._isresponsive())
 
     def test_shutdown(self):
@@ -120,6 +152,23 @@ class TestLLMModel(unittest.TestCase):
         llm._restart_attempt = 3
         llm.restart()
         self.assertEqual(llm.status, STATUS_FAILURE)
+
+    def test_restart_from_snapshot(self):
+        with tempfile.TemporaryDirectory() as snapshot_directory:
+            llm = LLMModel(modeltyp=modeltyp, model = model, prompting_config=prompting, deployment_config=deployment,
+                           snapshot_config={"directory": snapshot_directory}, **uses_chat_template)
+            phases = []
+            llm.download_model(progress_callback=phases.append)
+            self.assertEqual(llm.status, STATUS_READY)
+            self.assertFalse(llm.loaded_from_snapshot)
+            self.assertEqual(phases[-1], "saving snapshot")
+
+            llm.restart()
+            self.assertEqual(llm.status, STATUS_READY)
+            self.assertTrue(llm.loaded_from_snapshot)
+            self.assertNotIn("saving snapshot", llm.load_timings)
+            self.assertEqual(llm._pipe.model.dtype, torch.bfloat16)
+            llm.shutdown()
              
 
 if __name__ == '__main__':
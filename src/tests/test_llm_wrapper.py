@@ -40,7 +40,7 @@ class TestLLMWrapper(unittest.TestCase):
         self.assertIsNotNone(wrapper.llm)
         self.assertEqual(wrapper._max_timeout, 240, "Wrong max_timeout")
         self.assertIsNone(wrapper._continous_task)
-        self.assertIsNone(wrapper._prompting_starting_time)
+        self.assertEqual(wrapper.llm.active_requests(), [])
     
     def test_shutdown_llm(self):
         wrapper = LLMWrapper(modeltyp=modeltyp, model = model, prompting_config=prompting, deployment_config=deployment, **uses_chat_template)
@@ -77,16 +77,25 @@ class TestLLMWrapper(unittest.TestCase):
         self.assertIn(expected_math_answer, math_answer)
         self.assertIn(expected_answer, answer) 
         
+    def test_process_prompts(self):
+        wrapper = LLMWrapper(modeltyp=modeltyp, model = model, prompting_config=prompting, deployment_config=deployment, batching_config={"max_batch_size": 2, "max_wait_ms": 50}, **uses_chat_template)
+
+        results = wrapper.process_prompts(["Whats 17 + 25?", "Whats the capitol of germany?"])
+
+        self.assertEqual(len(results), 2)
+        self.assertIn("42", results[0]["answer"])
+        self.assertIn("Berlin", results[1]["answer"])
+        self.assertEqual(results[0]["batch_size"], 2)
+        wrapper.shutdown_llm()
+
     def test_start_monitoring(self):
         try: 
             wrapper = LLMWrapper(modeltyp=modeltyp, model = model, prompting_config=prompting, deployment_config=deployment, **uses_chat_template)
             wrapper.start_monitoring()
 
-            wrapper._prompting_starting_time = 0
             time.sleep(70)
             self.assertTrue(wrapper._is_llm_healthy)
 
-            wrapper._prompting_starting_time = None
             wrapper.llm._status = STATUS_FAILURE
             time.sleep(70)
             self.assertTrue(wrapper._is_llm_healthy, msg= f"failed at {datetime.datetime.now()}")
@@ -0,0 +1,101 @@
+import glob
+import io
+import json
+import logging
+import os
+import queue
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.app.logs.logging_setup import (DroppingQueueHandler, configure_logging,
+                                        parse_levels, shutdown_logging)
+
+
+def read_records(path):
+    with open(path) as file:
+        return [json.loads(line) for line in file]
+
+
+class TestLoggingSetup(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.log_file = os.path.join(self.directory.name, "app.log")
+        self.logger = logging.getLogger("test.logging_setup")
+
+    def tearDown(self):
+        shutdown_logging()
+        logging.getLogger("test.logging_setup.quiet").setLevel(logging.NOTSET)
+        self.directory.cleanup()
+
+    def test_records_are_json_with_extra_fields(self):
+        configure_logging(log_file=self.log_file, level="INFO", levels={})
+        self.logger.info("answered %s", "question", extra={"batch_size": 2})
+        try:
+            raise ValueError("broken")
+        except ValueError:
+            self.logger.exception("failed")
+        shutdown_logging()
+
+        answered, failed = read_records(self.log_file)
+        self.assertEqual((answered["level"], answered["logger"], answered["message"]), ("INFO", "test.logging_setup", "answered question"))
+        self.assertEqual(answered["batch_size"], 2)
+        self.assertIn("ValueError: broken", failed["exception"])
+
+    def test_levels_per_logger(self):
+        self.assertEqual(parse_levels("a.b=debug, c=WARNING,invalid"), {"a.b": "DEBUG", "c": "WARNING"})
+        configure_logging(log_file=self.log_file, level="DEBUG", levels={"test.logging_setup.quiet": "WARNING"})
+        logging.getLogger("test.logging_setup.quiet").info("hidden")
+        logging.getLogger("test.logging_setup.quiet").warning("shown")
+        self.logger.debug("shown")
+        shutdown_logging()
+
+        self.assertEqual([record["message"] for record in read_records(self.log_file)], ["shown", "shown"])
+
+    def test_payload_records_are_sampled(self):
+        configure_logging(log_file=self.log_file, level="INFO", levels={}, payload_sample_rate=0)
+        self.logger.info("answer", extra={"payload": True, "answer": "Berlin"})
+        self.logger.info("event")
+        configure_logging(log_file=self.log_file, level="INFO", levels={}, payload_sample_rate=1)
+        self.logger.info("answer", extra={"payload": True, "answer": "Berlin"})
+        shutdown_logging()
+
+        records = read_records(self.log_file)
+        self.assertEqual([record["message"] for record in records], ["event", "answer"])
+        self.assertEqual(records[1]["answer"], "Berlin")
+        self.assertNotIn("payload", records[1])
+
+    def test_rotation_by_size(self):
+        configure_logging(log_file=self.log_file, level="INFO", levels={}, max_bytes=500, backup_count=2)
+        for index in range(50):
+            self.logger.info("record %d", index)
+        shutdown_logging()
+
+        self.assertEqual(len(glob.glob(self.log_file + "*")), 3)
+        self.assertTrue(all(os.path.getsize(path) <= 500 for path in glob.glob(self.log_file + "*")))
+
+    def test_without_log_file_records_go_to_stderr(self):
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.directory.name)
+        environment = {key: value for key, value in os.environ.items() if key != "LOG_FILE"}
+        with patch.dict(os.environ, environment, clear=True), patch("sys.stderr", new_callable=io.StringIO) as stderr:
+            configure_logging(level="INFO", levels={})
+            self.logger.info("answered")
+            shutdown_logging()
+
+        self.assertEqual(json.loads(stderr.getvalue())["message"], "answered")
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+        record = logging.LogRecord("test", logging.INFO, __file__, 1, "message %s", ("argument",), None)
+        handler.handle(record)
+        handler.handle(record)
+
+        self.assertEqual(handler.dropped, 1)
+        self.assertEqual(handler.queue.get_nowait().msg, "message argument")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,17 +1,44 @@
+import json
+import time
+from contextlib import contextmanager
+
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import MagicMock, patch
-from src.app.main import app, wrapper
+from unittest.mock import ANY, MagicMock, patch
+from src.app import main
+from src.app.main import app, registry
+from src.app.sci.energy_attribution import Measurement
+from src.app.wrapper.admission_control import AdmissionController
 from src.app.models.request import ModelConfig, PromptingArgs, DeploymentArgs, ModelArgs
 
 client = TestClient(app)
 
 @pytest.fixture(autouse=True)
 def run_around_tests():
-    global wrapper
-    wrapper = None
-    yield
-    wrapper = None
+    registry.clear()
+    # the memory of the test models can not be estimated without the hugging face hub
+    # every test starts without observed decode rates
+    with patch('src.app.main.memory_estimator.estimate', side_effect=OSError("offline")), \
+         patch('src.app.main.admission', AdmissionController()):
+        yield
+    registry.clear()
+
+def wait_for_job(job_id, timeout=5):
+    """polls the deploy job until it is ready or failed"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f"/deploy/{job_id}").json()["job"]
+        if job["state"] in ("ready", "failed"):
+            return job
+        time.sleep(0.01)
+    raise TimeoutError(f"deploy job {job_id} did not finish")
+
+@contextmanager
+def deployed(mock_wrapper, name="test-model"):
+    """registers the mocked wrapper in the model registry of the api"""
+    if mock_wrapper is not None:
+        registry.add(name, mock_wrapper)
+    yield mock_wrapper
 
 def test_get_status_idle():
     """Tests whether the status `idle` is returned if no wrapper is provided."""
@@ -51,20 +78,98 @@ def test_deploy():
         mock_wrapper_manager = MockWrapperManager.return_value
         mock_wrapper = MagicMock()
         mock_wrapper.llm.status = "ready"
+        mock_wrapper.llm.memory_footprint.return_value = 0
         mock_wrapper_manager.create_wrapper.return_value = mock_wrapper
         
         response = client.post("/deploy", json=config_data)
         assert response.status_code == 200
-        assert response.json() == {
-            "status": "success",
-            "message": "The Wrapper succesfully deployed the model test-model"
-        }
+        body = response.json()
+        assert body["status"] == "success"
+        assert body["message"] == "The deployment of the model test-model has been started"
+
+        job = wait_for_job(body["job_id"])
+        assert job["state"] == "ready"
+        assert registry.get("test-model").wrapper is mock_wrapper
+        mock_wrapper.start_monitoring.assert_called_once()
+
+def test_deploy_failure():
+    """Tests whether a failed deployment is reported by the deploy job and releases the name."""
+    config_data = {"model": "broken-model", "modeltyp": "test-type",
+                   "args": {"prompting": {}, "deployment": {}}, "uses_chat_template": False}
+
+    def create_wrapper(config, progress_callback=None):
+        progress_callback("resolving")
+        progress_callback("loading weights")
+        raise OSError("model not found")
+
+    with patch('src.app.main.WrapperManager') as MockWrapperManager:
+        MockWrapperManager.return_value.create_wrapper.side_effect = create_wrapper
+        job = wait_for_job(client.post("/deploy", json=config_data).json()["job_id"])
+
+    assert job["state"] == "failed"
+    assert job["error"] == "model not found"
+    assert [phase["phase"] for phase in job["phases"]] == ["queued", "resolving", "loading weights"]
+    assert len(registry) == 0
+
+def test_deploy_exceeding_system_memory():
+    """Tests whether a deployment whose projected memory exceeds the system memory is refused before loading."""
+    config_data = {"model": "huge-model", "modeltyp": "test-type",
+                   "args": {"prompting": {}, "deployment": {}}, "uses_chat_template": False}
+    with patch('src.app.main.memory_estimator.estimate', return_value={"total_bytes": 10**15}), \
+         patch('src.app.main.WrapperManager') as MockWrapperManager:
+        body = client.post("/deploy", json=config_data).json()
+
+    assert body["status"] == "failure"
+    assert "exceeds the system memory" in body["message"]
+    MockWrapperManager.return_value.create_wrapper.assert_not_called()
+    assert len(registry) == 0
+
+def test_deploy_waits_for_memory():
+    """Tests whether a deployment waits for available memory and fails if it is not freed in time."""
+    config_data = {"model": "large-model", "modeltyp": "test-type",
+                   "args": {"prompting": {}, "deployment": {}}, "uses_chat_template": False}
+    memory = MagicMock(total=10**12, available=10**6)
+    with patch('src.app.main.memory_estimator.estimate', return_value={"total_bytes": 10**9}), \
+         patch('src.app.main.psutil.virtual_memory', return_value=memory), \
+         patch('src.app.main.DEPLOY_MEMORY_WAIT_S', 0), \
+         patch('src.app.main.WrapperManager') as MockWrapperManager:
+        body = client.post("/deploy", json=config_data).json()
+        assert body["projected_memory_mb"] == 1000.0
+        job = wait_for_job(body["job_id"])
+
+    assert job["state"] == "failed"
+    assert "needs 1000 MB but only 1 MB are available" in job["error"]
+    assert [phase["phase"] for phase in job["phases"]] == ["queued", "waiting for memory"]
+    MockWrapperManager.return_value.create_wrapper.assert_not_called()
+    assert len(registry) == 0
+
+def test_get_status_reports_projected_memory():
+    """Tests whether the status of a deployment compares the projected with the measured memory."""
+    config_data = {"model": "test-model", "modeltyp": "test-type",
+                   "args": {"prompting": {}, "deployment": {}}, "uses_chat_template": False}
+    estimate = {"total_bytes": 3 * 10**6, "weights_bytes": 2 * 10**6, "kv_cache_bytes": 10**6, "source": "safetensors"}
+    with patch('src.app.main.memory_estimator.estimate', return_value=estimate), \
+         patch('src.app.main.WrapperManager') as MockWrapperManager:
+        mock_wrapper = MockWrapperManager.return_value.create_wrapper.return_value
+        mock_wrapper.llm.status = "ready"
+        mock_wrapper.llm.memory_footprint.return_value = 2 * 10**6
+        mock_wrapper.llm.load_rss_bytes = 4 * 10**6
+        assert wait_for_job(client.post("/deploy", json=config_data).json()["job_id"])["state"] == "ready"
+
+    deployment = registry.get("test-model").describe()
+    assert deployment["projected_memory"] == {"total_mb": 3.0, "weights_mb": 2.0, "kv_cache_mb": 1.0, "source": "safetensors"}
+    assert deployment["memory_mb"] == 2.0
+    assert deployment["load_rss_mb"] == 4.0
+
+def test_get_unknown_deploy_job():
+    """Tests whether polling an unknown deploy job fails."""
+    assert client.get("/deploy/unknown").json()["status"] == "failure"
 
 def test_deploy_with_existing_wrapper():
-    """Tests whether `deploy` responds correctly if a wrapper is already deployed."""
-    global wrapper
+    """Tests whether `deploy` responds correctly if a wrapper with the same name is already deployed."""
     wrapper = MagicMock()
     wrapper.llm.model = "existing-model"
+    registry.add("new-model", wrapper)
     
     config_data = {
         "model": "new-model",
@@ -82,11 +187,221 @@ def test_deploy_with_existing_wrapper():
         
         response = client.post("/deploy", json=config_data)
         
-        expected_message = "Unable to deploy the model new-model, because there is already a model deployed."
+        expected_message = "Unable to deploy the model new-model: The model new-model is already deployed."
         
         assert response.status_code == 200
         assert response.json() == {
             "status": "failure",
             "message": expected_message
         }
+        mock_wrapper_manager.create_wrapper.assert_not_called()
+
+def test_deploy_second_model():
+    """Tests whether a second model can be deployed under another name and prompts are routed by name."""
+    first = MagicMock()
+    first.process_prompt.return_value = {"answer": "first", "sci_score": 0.1, "batch_size": 1, "tokens_per_second": 1.0}
+    registry.add("first", first)
+
+    second = MagicMock()
+    second.llm.status = "ready"
+    second.llm.memory_footprint.return_value = 0
+    second.process_prompt.return_value = {"answer": "second", "sci_score": 0.2, "batch_size": 1, "tokens_per_second": 1.0}
+
+    config_data = {"model": "org/second-model", "name": "second", "modeltyp": "test-type",
+                   "args": {"prompting": {}, "deployment": {}}, "uses_chat_template": False}
+    with patch('src.app.main.WrapperManager') as MockWrapperManager:
+        MockWrapperManager.return_value.create_wrapper.return_value = second
+        response = client.post("/deploy", json=config_data)
+        assert wait_for_job(response.json()["job_id"])["state"] == "ready"
+
+    assert client.post("/process_prompt", json={"question": "?", "model": "second"}).json()["answer"] == "second"
+    assert client.post("/process_prompt", json={"question": "?", "model": "first"}).json()["answer"] == "first"
+    # without a model name the prompt can't be routed if several models are deployed
+    assert "Several models are deployed" in client.post("/process_prompt", json={"question": "?"}).json()["answer"]
+
+    status = client.get("/get_status", params={"model": "second"}).json()
+    assert set(status["models"]) == {"first", "second"}
+
+    response = client.post("/shutdown", params={"model": "first"})
+    assert response.json()["status"] == "success"
+    first.shutdown_llm.assert_called_once()
+    assert registry.names() == ["second"]
+
+def test_process_prompt_with_wrapper():
+    """Tests whether `process_prompt` answers through the inference queue and reports the queue wait time."""
+    mock_wrapper = MagicMock()
+    mock_wrapper.process_prompt.return_value = {
+        "answer": "Berlin is the capital",
+        "sci_score": 0.5,
+        "completion_tokens": 5,
+        "batch_size": 2,
+        "tokens_per_second": 10.0,
+        "energy_source": "cpu_model",
+    }
+
+    with deployed(mock_wrapper):
+        response = client.post("/process_prompt", json={"question": "Whats the capital of germany?"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["answer"] == "Berlin is the capital"
+    assert body["sci_score"] == 0.5
+    assert body["queue_wait_ms"] >= 0
+    assert body["queue_depth"] == 0
+    assert body["batch_size"] == 2
+    assert body["tokens_per_second"] == 10.0
+    assert body["energy_source"] == "cpu_model"
+    mock_wrapper.process_prompt.assert_called_once_with("Whats the capital of germany?", measure_sci=True, deadline=ANY)
+
+def test_process_prompt_deadline():
+    """Tests whether the deadline of a prompt is passed to the wrapper and a truncated answer is reported."""
+    mock_wrapper = MagicMock()
+    mock_wrapper.process_prompt.return_value = {"answer": "Berlin is", "sci_score": 0.5, "completion_tokens": 2,
+                                                "finish_reason": "truncated", "batch_size": 1, "tokens_per_second": 10.0}
+
+    with deployed(mock_wrapper):
+        start_time = time.time()
+        body = client.post("/process_prompt", json={"question": "Whats the capital of germany?", "deadline_ms": 500}).json()
+        with patch('src.app.main.PROMPT_DEADLINE_S', 0):
+            client.post("/process_prompt", json={"question": "Whats the capital of germany?"})
+
+    assert body["finish_reason"] == "truncated"
+    deadline = mock_wrapper.process_prompt.call_args_list[0].kwargs["deadline"]
+    assert start_time + 0.5 <= deadline <= time.time() + 0.5
+    assert mock_wrapper.process_prompt.call_args_list[1].kwargs["deadline"] is None
+
+def test_metrics():
+    """Tests whether `metrics` exposes the request latencies and the state of the deployed models in the Prometheus format."""
+    mock_wrapper = MagicMock()
+    mock_wrapper.process_prompt.return_value = {"answer": "Berlin", "sci_score": 0.5, "batch_size": 1, "tokens_per_second": 10.0}
+    mock_wrapper.llm.restart_count = 2
+    mock_wrapper.llm.restart_attempt = 0
+    mock_wrapper.llm.rss_bytes.return_value = 1000
+
+    with deployed(mock_wrapper):
+        before = client.get("/metrics").text
+        client.post("/process_prompt", json={"question": "Whats the capital of germany?"})
+        response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    count = lambda text: int(next(line for line in text.splitlines() if line.startswith("greenprompt_request_duration_seconds_count")).split()[1])
+    assert count(response.text) == count(before) + 1
+    assert "# TYPE greenprompt_queue_wait_seconds histogram" in response.text
+    assert 'greenprompt_model_restarts{model="test-model"} 2' in response.text
+    assert 'greenprompt_model_rss_bytes{model="test-model"} 1000' in response.text
+    assert "greenprompt_requests_in_flight 0" in response.text
+
+def test_process_prompt_busy():
+    """Tests whether `process_prompt` answers with 503 if the inference queue is full."""
+    from src.app.wrapper.inference_executor import QueueFullError
+
+    with deployed(MagicMock()), \
+         patch('src.app.main.inference_executor.run', side_effect=QueueFullError("full", 8)):
+        response = client.post("/process_prompt", json={"question": "Hello?"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert response.json() == {"status": "busy", "message": "The llm is busy, please retry later.", "retry_after_s": 1, "queue_depth": 8}
+    assert main.admission.shed_counts()["queue_full"] == 1
+
+def test_process_prompt_shed_before_deadline():
+    """Tests whether `process_prompt` rejects a prompt with 503 and Retry-After if it is expected to miss its deadline."""
+    mock_wrapper = MagicMock()
+    # 50 tokens at 10 tokens per second take 5 seconds, the prompt has 1.5 seconds
+    main.admission.observe(50, 10)
+
+    with deployed(mock_wrapper), \
+         patch('src.app.main.inference_executor.run') as mock_run:
+        response = client.post("/process_prompt", json={"question": "Hello?", "deadline_ms": 1500})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "4"
+    assert response.json()["expected_ms"] == 5000.0
+    mock_run.assert_not_called()
+    assert main.admission.shed_counts()["deadline"] == 1
+    assert registry.get("test-model").in_flight == 0
+    assert 'greenprompt_requests_shed_total{reason="deadline"}' in client.get("/metrics").text
+
+def test_process_prompt_stream():
+    """Tests whether `process_prompt_stream` streams the token events and ends with the sci score and timing."""
+    mock_wrapper = MagicMock()
+    mock_wrapper.stream_answer.return_value = (event for event in [
+        {"type": "token", "text": "Berlin "},
+        {"type": "token", "text": "is"},
+        {"type": "done", "answer": "Berlin is", "completion_tokens": 2, "time_to_first_token_ms": 12.0,
+         "decode_tokens_per_second": 20.0, "total_time_ms": 62.0},
+    ])
+
+    with deployed(mock_wrapper), \
+         patch('src.app.main.start_calc_sci_score', return_value=Measurement(0.0, source="cpu_model")), \
+         patch('src.app.main.end_calc_sci_score', return_value=0.3) as mock_end:
+        response = client.post("/process_prompt_stream", json={"question": "Whats the capital of germany?"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert [event["type"] for event in events] == ["token", "token", "done"]
+    assert events[-1]["sci_score"] == 0.3
+    assert events[-1]["energy_source"] == "cpu_model"
+    assert events[-1]["time_to_first_token_ms"] == 12.0
+    assert mock_end.call_args[0][1] == 2
+
+def test_process_prompt_stream_without_wrapper():
+    """Tests whether `process_prompt_stream` responds correctly if no wrapper is provided."""
+    with deployed(None):
+        response = client.post("/process_prompt_stream", json={"question": "Hello?"})
+    assert response.json() == {"status": "failure", "message": "The wrapper is not available"}
+
+def mock_bulk_wrapper():
+    """mocks a wrapper whose answers contain the question twice"""
+    mock_wrapper = MagicMock()
+    mock_wrapper.process_prompts.side_effect = lambda questions, deadlines=None: [
+        {"answer": f"{question} {question}", "completion_tokens": 2 * len(question.split()), "sci_score": None}
+        for question in questions
+    ]
+    mock_wrapper.llm.count_tokens.side_effect = lambda text: len(text.split())
+    return mock_wrapper
+
+def test_process_prompts_with_list():
+    """Tests whether `process_prompts` streams one result line per prompt and shares the measured carbon."""
+    prompts = {"prompts": [{"question": "one"}, {"question": "two three"}]}
+
+    with deployed(mock_bulk_wrapper()), \
+         patch('src.app.main.start_calc_sci_score', return_value=Measurement(0.0, source="cpu_model")), \
+         patch('src.app.main.end_calc_sci_score', return_value=0.6) as mock_end:
+        response = client.post("/process_prompts", json=prompts)
+
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["index"] for line in lines] == [0, 1]
+    assert lines[0]["answer"] == "one one"
+    assert lines[1]["prompt_tokens"] == 2
+    assert lines[1]["completion_tokens"] == 4
+    assert lines[0]["sci_share"] + lines[1]["sci_share"] == pytest.approx(0.6)
+    assert lines[1]["sci_share"] == pytest.approx(0.4)
+    assert lines[1]["energy_source"] == "cpu_model"
+    mock_end.assert_called_once()
+
+def test_process_prompts_with_jsonl_file():
+    """Tests whether `process_prompts` reads an uploaded jsonl file and reports invalid lines."""
+    content = b'{"question": "one"}\n\n"two"\n{"no_question": 1}\n'
+
+    with deployed(mock_bulk_wrapper()), \
+         patch('src.app.main.BULK_CHUNK_SIZE', 2), \
+         patch('src.app.main.start_calc_sci_score', return_value=Measurement(0.0, source="cpu_model")), \
+         patch('src.app.main.end_calc_sci_score', side_effect=RuntimeError("samples overwritten")):
+        response = client.post("/process_prompts", files={"file": ("prompts.jsonl", content, "application/jsonl")})
+
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["status"] for line in lines] == ["success", "success", "error"]
+    assert lines[1]["answer"] == "two two"
+    assert lines[1]["sci_share"] is None
 
+def test_process_prompts_invalid_body():
+    """Tests whether `process_prompts` rejects a body which is no PromptList."""
+    with deployed(mock_bulk_wrapper()):
+        response = client.post("/process_prompts", json={"questions": ["one"]})
+    assert response.status_code == 422
+    assert response.json()["status"] == "failure"
@@ -0,0 +1,114 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import torch
+from safetensors.torch import save_file
+from transformers import LlamaConfig
+
+from src.app.wrapper.memory_estimator import (DEFAULT_PROMPT_TOKENS,
+                                              RUNTIME_OVERHEAD, SOURCE_CONFIG,
+                                              SOURCE_SAFETENSORS,
+                                              MemoryEstimator,
+                                              read_safetensors_header)
+
+HIDDEN_SIZE = 16
+VOCAB_SIZE = 32
+
+
+def write_model(directory, with_weights=True):
+    """writes the config of a tiny llama model and optionally its weights in float32 as safetensors"""
+    LlamaConfig(vocab_size=VOCAB_SIZE, hidden_size=HIDDEN_SIZE, intermediate_size=32, num_hidden_layers=2, num_attention_heads=4,
+                num_key_value_heads=2, max_position_embeddings=1024).save_pretrained(directory)
+    if with_weights:
+        save_file({
+            "model.embed_tokens.weight": torch.zeros(VOCAB_SIZE, HIDDEN_SIZE),
+            "model.layers.0.mlp.up_proj.weight": torch.zeros(32, HIDDEN_SIZE),
+            "model.norm.weight": torch.zeros(HIDDEN_SIZE),
+        }, os.path.join(directory, "model.safetensors"))
+
+
+def model_config(directory, deployment=None, max_new_tokens=64, **args):
+    return {"model": directory, "uses_chat_template": False,
+            "args": {"prompting": {"max_new_tokens": max_new_tokens}, "deployment": deployment or {}, **args}}
+
+
+class TestMemoryEstimator(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        write_model(self.directory.name)
+        self.estimator = MemoryEstimator()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_read_safetensors_header(self):
+        header = read_safetensors_header(os.path.join(self.directory.name, "model.safetensors"))
+        self.assertEqual(header["model.norm.weight"], ("F32", [HIDDEN_SIZE]))
+
+    def test_weights_in_converted_dtype(self):
+        elements = VOCAB_SIZE * HIDDEN_SIZE + 32 * HIDDEN_SIZE + HIDDEN_SIZE
+        default = self.estimator.estimate(model_config(self.directory.name))
+        bfloat16 = self.estimator.estimate(model_config(self.directory.name, {"torch_dtype": "torch.bfloat16"}))
+        quantized = self.estimator.estimate(model_config(self.directory.name, {"quantization": "dynamic_int8"}))
+
+        self.assertEqual(default["source"], SOURCE_SAFETENSORS)
+        self.assertEqual(default["weights_bytes"], elements * 4)
+        self.assertEqual(bfloat16["weights_bytes"], elements * 2)
+        # only the linear layers are stored as int8
+        self.assertEqual(quantized["weights_bytes"], (VOCAB_SIZE * HIDDEN_SIZE + HIDDEN_SIZE) * 4 + 32 * HIDDEN_SIZE)
+        self.assertEqual(default["overhead_bytes"], int(elements * 4 * RUNTIME_OVERHEAD))
+        # the model is loaded in float32 before it is quantized
+        self.assertEqual(quantized["peak_weights_bytes"], elements * 4)
+        self.assertGreaterEqual(quantized["total_bytes"], elements * 4 + quantized["overhead_bytes"])
+        self.assertEqual(default["peak_weights_bytes"], default["weights_bytes"])
+
+    def test_kv_cache_grows_with_tokens_and_concurrent_prompts(self):
+        estimate = self.estimator.estimate(model_config(self.directory.name, max_new_tokens=64))
+        tokens = 64 + DEFAULT_PROMPT_TOKENS
+        # keys and values of 2 layers with 2 key/value heads of 4 dimensions in float32
+        self.assertEqual(estimate["kv_cache_bytes"], 2 * 2 * 2 * 4 * tokens * 4)
+        self.assertEqual(estimate["kv_cache_tokens"], tokens)
+
+        batched = self.estimator.estimate(model_config(self.directory.name, batching={"max_batch_size": 4}, replicas={"count": 2}))
+        self.assertEqual(batched["concurrent_prompts"], 8)
+        self.assertEqual(batched["kv_cache_bytes"], 8 * estimate["kv_cache_bytes"])
+
+        # the cache is bounded by the context of the model
+        long = self.estimator.estimate(model_config(self.directory.name, max_new_tokens=4096))
+        self.assertEqual(long["kv_cache_tokens"], 1024)
+
+    def test_parameters_from_config_without_safetensors(self):
+        with tempfile.TemporaryDirectory() as directory:
+            write_model(directory, with_weights=False)
+            estimate = self.estimator.estimate(model_config(directory))
+        parameters = MemoryEstimator.parameters_from_config(LlamaConfig.from_pretrained(self.directory.name))
+        self.assertEqual(estimate["source"], SOURCE_CONFIG)
+        self.assertEqual(estimate["weights_bytes"], parameters * 4)
+
+    def test_prefix_cache_and_draft(self):
+        config = model_config(self.directory.name, prefix_caching={"max_memory_mb": 1}, draft={"model": self.directory.name})
+        config["uses_chat_template"] = True
+        estimate = self.estimator.estimate(config)
+        single = self.estimator.estimate(model_config(self.directory.name))
+        self.assertEqual(estimate["prefix_cache_bytes"], 1000000)
+        self.assertEqual(estimate["weights_bytes"], 2 * single["weights_bytes"])
+
+    def test_revision_per_model(self):
+        config = model_config("org/model", {"revision": "v2"}, draft={"model": "org/draft"})
+        with patch("src.app.wrapper.memory_estimator.AutoConfig") as mock_config, \
+             patch("src.app.wrapper.memory_estimator.get_safetensors_metadata", side_effect=OSError("offline")) as mock_metadata:
+            mock_config.from_pretrained.return_value = LlamaConfig.from_pretrained(self.directory.name)
+            self.estimator.estimate(config)
+
+        # the revision of the deployment belongs to the model, the draft model uses its own
+        self.assertEqual([(call.args[0], call.kwargs["revision"]) for call in mock_config.from_pretrained.call_args_list],
+                         [("org/model", "v2"), ("org/draft", None)])
+        self.assertEqual([(call.args[0], call.kwargs["revision"]) for call in mock_metadata.call_args_list],
+                         [("org/model", "v2"), ("org/draft", None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
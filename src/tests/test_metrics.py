@@ -0,0 +1,59 @@
+import threading
+import unittest
+
+from src.app.metrics.metrics import MetricsRegistry
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter_is_summed_over_threads(self):
+        counter = self.registry.counter("test_total", "test counter")
+        threads = [threading.Thread(target=lambda: [counter.inc() for _ in range(1000)]) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.inc(0.5)
+        # the shards of the finished threads are kept
+        self.assertEqual(counter.value, 8000.5)
+
+    def test_counter_read_from_callback(self):
+        dropped = [3]
+        self.registry.counter("test_dropped_total", "test counter", lambda: dropped[0])
+        dropped[0] += 1
+        self.assertIn("# TYPE test_dropped_total counter\ntest_dropped_total 4\n", self.registry.render())
+
+    def test_gauge_inc_and_dec_from_different_threads(self):
+        gauge = self.registry.gauge("test_gauge", "test gauge")
+        gauge.inc(3)
+        thread = threading.Thread(target=gauge.dec)
+        thread.start()
+        thread.join()
+        self.assertEqual(gauge.value, 2)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.registry.histogram("test_seconds", "test histogram", buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value)
+        cumulative, count, total = histogram.snapshot()
+        self.assertEqual(cumulative, [2, 3, 4])
+        self.assertEqual(count, 4)
+        self.assertAlmostEqual(total, 5.65)
+
+    def test_render_prometheus_text_format(self):
+        self.registry.counter("test_total", "test counter").inc(2)
+        self.registry.gauge("test_memory_bytes", "test gauge", lambda: [({"model": 'a"b'}, 10)])
+        self.registry.histogram("test_seconds", "test histogram", buckets=(1,)).observe(0.25)
+        text = self.registry.render()
+        self.assertIn("# TYPE test_total counter\ntest_total 2\n", text)
+        self.assertIn('test_memory_bytes{model="a\\"b"} 10\n', text)
+        self.assertIn('test_seconds_bucket{le="1"} 1\n', text)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 1\n', text)
+        self.assertIn("test_seconds_sum 0.25\n", text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from src.app.wrapper.model_registry import ModelRegistry, RegistryError
+
+MB = 1_000_000
+
+
+def mock_wrapper(memory_mb):
+    wrapper = MagicMock()
+    wrapper.llm.memory_footprint.return_value = memory_mb * MB
+    return wrapper
+
+
+def deploy(registry, name, wrapper, model=None, expected_memory_bytes=None):
+    """deploys like the deploy job of the api: reserved before the model is loaded, registered afterwards"""
+    registry.reserve(name, model=model, expected_memory_bytes=expected_memory_bytes)
+    registry.complete(name, wrapper, model=model)
+    return wrapper
+
+
+class TestModelRegistry(unittest.TestCase):
+
+    def test_deploy_and_get(self):
+        registry = ModelRegistry(memory_budget_bytes=1000 * MB)
+        wrapper = mock_wrapper(100)
+        deploy(registry, "a", wrapper, model="org/a")
+        self.assertIs(registry.get().wrapper, wrapper)
+        self.assertIs(registry.get("a").wrapper, wrapper)
+        self.assertEqual(registry.used_memory_bytes, 100 * MB)
+        with self.assertRaises(RegistryError):
+            registry.get("b")
+        with self.assertRaises(RegistryError):
+            registry.reserve("a")
+
+    def test_get_without_name_needs_single_deployment(self):
+        registry = ModelRegistry(memory_budget_bytes=1000 * MB)
+        with self.assertRaises(RegistryError):
+            registry.get()
+        registry.add("a", mock_wrapper(1), 1)
+        registry.add("b", mock_wrapper(1), 1)
+        with self.assertRaises(RegistryError):
+            registry.get()
+
+    def test_least_recently_used_idle_model_is_evicted(self):
+        registry = ModelRegistry(memory_budget_bytes=250 * MB)
+        first, second, third = mock_wrapper(100), mock_wrapper(100), mock_wrapper(100)
+        deploy(registry, "first", first)
+        deploy(registry, "second", second)
+        with registry.use("first"):
+            pass  # first is now more recently used than second
+
+        deploy(registry, "third", third)
+
+        self.assertEqual(sorted(registry.names()), ["first", "third"])
+        second.shutdown_llm.assert_called_once()
+        first.shutdown_llm.assert_not_called()
+
+    def test_busy_model_is_not_evicted(self):
+        registry = ModelRegistry(memory_budget_bytes=250 * MB)
+        first, second, third = mock_wrapper(100), mock_wrapper(100), mock_wrapper(100)
+        deploy(registry, "first", first)
+        deploy(registry, "second", second)
+
+        with registry.use("first"):
+            with registry.use("second"):
+                pass
+            deploy(registry, "third", third)
+
+        first.shutdown_llm.assert_not_called()
+        second.shutdown_llm.assert_called_once()
+
+    def test_known_footprint_is_freed_before_loading(self):
+        registry = ModelRegistry(memory_budget_bytes=250 * MB)
+        deploy(registry, "a", mock_wrapper(200), model="org/model")
+        registry.remove("a")
+        deploy(registry, "b", mock_wrapper(100), model="org/other")
+
+        registry.reserve("c", model="org/model")
+        # the 200 MB of org/model are known, so b is evicted before c is loaded
+        self.assertEqual(registry.names(), [])
+        registry.complete("c", mock_wrapper(200), model="org/model")
+        self.assertEqual(registry.names(), ["c"])
+
+    def test_evicted_model_is_shut_down_outside_the_lock(self):
+        registry = ModelRegistry(memory_budget_bytes=150 * MB)
+        evicted = mock_wrapper(100)
+        deploy(registry, "evicted", evicted)
+        acquired_during_shutdown = []
+
+        def shutdown():
+            # another thread can use the registry while the evicted model shuts down
+            thread = threading.Thread(target=lambda: acquired_during_shutdown.append(registry.names()))
+            thread.start()
+            thread.join(timeout=1)
+        evicted.shutdown_llm.side_effect = shutdown
+
+        registry.reserve("next", expected_memory_bytes=100 * MB)
+        self.assertEqual(acquired_during_shutdown, [[]])
+
+    def test_reservations_count_against_the_budget(self):
+        registry = ModelRegistry(memory_budget_bytes=250 * MB)
+        idle = mock_wrapper(100)
+        registry.add("idle", idle, 100 * MB)
+        registry.reserve("loading", expected_memory_bytes=100 * MB)
+        self.assertEqual(registry.used_memory_bytes, 200 * MB)
+
+        # the second reservation only fits without the idle model, the first one is still loading
+        registry.reserve("next", expected_memory_bytes=100 * MB)
+        idle.shutdown_llm.assert_called_once()
+        self.assertEqual(registry.used_memory_bytes, 200 * MB)
+
+        registry.complete("loading", mock_wrapper(120))
+        registry.cancel("next")
+        self.assertEqual(registry.used_memory_bytes, 120 * MB)
+
+    def test_deployment_larger_than_budget(self):
+        registry = ModelRegistry(memory_budget_bytes=100 * MB)
+        with self.assertRaises(RegistryError):
+            registry.reserve("a", expected_memory_bytes=200 * MB)
+        self.assertEqual(registry.used_memory_bytes, 0)
+
+    def test_remove(self):
+        registry = ModelRegistry(memory_budget_bytes=100 * MB)
+        wrapper = mock_wrapper(10)
+        deploy(registry, "a", wrapper)
+        registry.remove("a")
+        wrapper.shutdown_llm.assert_called_once()
+        self.assertEqual(len(registry), 0)
+        with self.assertRaises(RegistryError):
+            registry.remove("a")
+
+    def test_remove_waits_for_the_prompts_in_flight(self):
+        registry = ModelRegistry(memory_budget_bytes=100 * MB)
+        wrapper = mock_wrapper(10)
+        deploy(registry, "a", wrapper)
+        deployment = registry.acquire("a")
+        releaser = threading.Timer(0.1, registry.release, args=(deployment,))
+        releaser.start()
+
+        started = time.time()
+        registry.remove("a")
+        releaser.join()
+        self.assertGreaterEqual(time.time() - started, 0.05)
+        wrapper.shutdown_llm.assert_called_once()
+        self.assertEqual(len(registry), 0)
+
+    def test_remove_refuses_a_busy_model_after_the_timeout(self):
+        registry = ModelRegistry(memory_budget_bytes=100 * MB)
+        wrapper = mock_wrapper(10)
+        deploy(registry, "a", wrapper)
+        deployment = registry.acquire("a")
+
+        with self.assertRaises(RegistryError):
+            registry.remove("a", drain_timeout_s=0.05)
+        wrapper.shutdown_llm.assert_not_called()
+        self.assertEqual(registry.names(), ["a"])
+        registry.release(deployment)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+import torch
+from transformers import DynamicCache
+
+from src.app.wrapper.llm_model import LLMModel
+from src.app.wrapper.prefix_cache import PrefixCache, cache_memory_bytes
+
+
+def key_values(tokens, layers=2):
+    """creates a cache with float32 keys and values of shape (1, 1, tokens, 4) per layer"""
+    cache = DynamicCache()
+    for layer in range(layers):
+        cache.update(torch.zeros(1, 1, tokens, 4), torch.zeros(1, 1, tokens, 4), layer)
+    return cache
+
+
+class TestPrefixCache(unittest.TestCase):
+
+    def test_memory_bytes(self):
+        # 2 layers * (key + value) * 10 tokens * 4 values * 4 bytes
+        self.assertEqual(cache_memory_bytes(key_values(10)), 640)
+
+    def test_get_and_put(self):
+        cache = PrefixCache(max_memory_bytes=10_000)
+        self.assertIsNone(cache.get("prefix"))
+        ids = torch.tensor([[1, 2, 3]])
+        cache.put("prefix", ids, key_values(3))
+        cached_ids, cached_key_values = cache.get("prefix")
+        self.assertTrue(torch.equal(cached_ids, ids))
+        self.assertEqual(cached_key_values.get_seq_length(), 3)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_least_recently_used_prefix_is_dropped(self):
+        cache = PrefixCache(max_memory_bytes=1300)
+        cache.put("a", torch.tensor([[1]]), key_values(10))
+        cache.put("b", torch.tensor([[1]]), key_values(10))
+        cache.get("a")
+        cache.put("c", torch.tensor([[1]]), key_values(10))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats()["entries"], 2)
+
+    def test_prefix_larger_than_cap_is_not_cached(self):
+        cache = PrefixCache(max_memory_bytes=100)
+        cache.put("a", torch.tensor([[1]]), key_values(10))
+        self.assertIsNone(cache.get("a"))
+
+    def test_prefill_statistics(self):
+        cache = PrefixCache(max_memory_bytes=100)
+        cache.record_prefill(10.0, cached=False)
+        cache.record_prefill(2.0, cached=True)
+        cache.record_prefill(4.0, cached=True)
+        stats = cache.stats()
+        self.assertEqual(stats["avg_prefill_ms_uncached"], 10.0)
+        self.assertEqual(stats["avg_prefill_ms_cached"], 3.0)
+
+    def test_shared_length(self):
+        prefix = torch.tensor([[1, 2, 3, 4]])
+        self.assertEqual(LLMModel._shared_length(prefix, torch.tensor([[1, 2, 3, 4, 5, 6]])), 4)
+        self.assertEqual(LLMModel._shared_length(prefix, torch.tensor([[1, 2, 9, 4, 5, 6]])), 2)
+        # the last token of the prompt is always prefilled
+        self.assertEqual(LLMModel._shared_length(prefix, torch.tensor([[1, 2, 3, 4]])), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+from src.app.wrapper.llm_model import FINISH_STOP, GenerationResult, LLMModel
+
+prompting = {"max_new_tokens": 256, "min_new_tokens": 64, "do_sample": True, "temperature": 0.7, "top_k": 50}
+
+
+def create_llm(generate_batch, **probe_config):
+    llm = LLMModel(modeltyp="text-generation", model="test/model", prompting_config=prompting, deployment_config={},
+                   probe_config=probe_config, uses_chat_template=False)
+    llm._pipe = MagicMock()
+    llm._generate_batch = generate_batch
+    return llm
+
+
+def answering_generate_batch():
+    """mocks the generation of a loaded model, every prompt is answered with 'Berlin'"""
+    generate_batch = MagicMock()
+    generate_batch.side_effect = lambda prompts, **kwargs: [GenerationResult("Berlin", len(prompt.split()), 1, FINISH_STOP, {}) for prompt in prompts]
+    return generate_batch
+
+
+class TestProbe(unittest.TestCase):
+
+    def test_probe_is_greedy_and_short(self):
+        generate_batch = answering_generate_batch()
+        llm = create_llm(generate_batch, max_new_tokens=2, timeout_s=5)
+        self.assertTrue(llm._isresponsive())
+
+        args = generate_batch.call_args.kwargs["prompting_config"]
+        self.assertEqual(args["max_new_tokens"], 2)
+        self.assertFalse(args["do_sample"])
+        self.assertEqual(args["max_time"], 5)
+        self.assertNotIn("temperature", args)
+        self.assertNotIn("min_new_tokens", args)
+        # the prompting config of the model is not changed by the probe
+        self.assertEqual(llm.prompting_config["max_new_tokens"], 256)
+
+    def test_probe_latency_baseline(self):
+        llm = create_llm(answering_generate_batch())
+        self.assertIsNone(llm.probe_baseline_ms)
+        llm._isresponsive()
+        baseline = llm.probe_baseline_ms
+        self.assertIsNotNone(baseline)
+        llm._isresponsive()
+        self.assertEqual(llm.probe_baseline_ms, baseline)
+        self.assertIsNotNone(llm.last_probe_ms)
+
+    def test_probe_times_out(self):
+        release = threading.Event()
+        generate_batch = MagicMock()
+        generate_batch.side_effect = lambda prompts, **kwargs: release.wait(5) and [GenerationResult("late", 1, 1, FINISH_STOP, {})]
+        llm = create_llm(generate_batch, timeout_s=0.1)
+        try:
+            self.assertFalse(llm._isresponsive())
+            self.assertIsNone(llm.probe_baseline_ms)
+        finally:
+            release.set()
+
+    def test_warmup_runs_all_shapes(self):
+        generate_batch = answering_generate_batch()
+        llm = create_llm(generate_batch, warmup=True, warmup_prompt_tokens=[4, 16], warmup_batch_sizes=[1, 2])
+        llm._warmup()
+        shapes = [(len(call.args[0]), len(call.args[0][0].split())) for call in generate_batch.call_args_list]
+        self.assertEqual(shapes, [(1, 4), (1, 16), (2, 4), (2, 16)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import torch
+
+from src.app.wrapper.llm_model import (PHASE_LOADING_WEIGHTS,
+                                       PHASE_QUANTIZING, PHASE_RESOLVING,
+                                       PHASE_SNAPSHOT, PHASE_WARMUP,
+                                       QUANTIZATION_DYNAMIC_INT8,
+                                       STATUS_FAILURE, STATUS_READY, LLMModel)
+from src.tests.helpers import tiny_model
+
+
+def create_llm(quantization=QUANTIZATION_DYNAMIC_INT8, **configs):
+    return LLMModel(modeltyp="text-generation", model="test/model", prompting_config={}, deployment_config={"quantization": quantization},
+                    uses_chat_template=False, **configs)
+
+
+class TestQuantization(unittest.TestCase):
+
+    def test_linear_layers_are_quantized(self):
+        llm = create_llm()
+        llm._pipe = MagicMock()
+        llm._pipe.model = tiny_model(torch.bfloat16)
+        llm._quantize()
+
+        model = llm._pipe.model
+        self.assertFalse(any(type(module) is torch.nn.Linear for module in model.modules()))
+        self.assertEqual(model.dtype, torch.float32)
+        logits = model(input_ids=torch.tensor([[1, 2, 3]])).logits
+        self.assertEqual(logits.shape, (1, 3, 32))
+
+    def test_memory_footprint_counts_the_packed_weights(self):
+        llm = create_llm()
+        llm._pipe = MagicMock()
+        llm._pipe.model = tiny_model(torch.float32)
+        original = llm.memory_footprint()
+        self.assertEqual(original, llm._pipe.model.get_memory_footprint())
+        llm._quantize()
+
+        linear_weights = sum(module.weight().nelement() for module in llm._pipe.model.modules()
+                             if isinstance(module, torch.ao.nn.quantized.dynamic.Linear))
+        self.assertGreater(linear_weights, 0)
+        # the int8 linear weights are counted besides the float32 embeddings and norms
+        self.assertGreaterEqual(llm.memory_footprint(), linear_weights + llm._pipe.model.get_memory_footprint())
+        self.assertLess(llm.memory_footprint(), original)
+
+    def test_unsupported_quantization(self):
+        llm = create_llm("int4")
+        llm._pipe = MagicMock()
+        llm._pipe.model = tiny_model(torch.bfloat16)
+        with self.assertRaises(ValueError):
+            llm._quantize()
+
+    def test_download_quantizes_after_snapshot(self):
+        llm = create_llm(snapshot_config={"directory": "/tmp/snapshots"})
+        phases = []
+        with patch("src.app.wrapper.llm_model.AutoConfig"), \
+             patch("src.app.wrapper.llm_model.pipeline") as mock_pipeline, \
+             patch.object(llm._snapshot_store, "find", return_value=None), \
+             patch.object(llm, "_save_snapshot") as mock_save, \
+             patch.object(llm, "_quantize") as mock_quantize, \
+             patch.object(llm, "_isresponsive", return_value=True):
+            llm.download_model(progress_callback=phases.append)
+
+        self.assertNotIn("quantization", mock_pipeline.call_args.kwargs)
+        self.assertEqual(phases, [PHASE_RESOLVING, PHASE_LOADING_WEIGHTS, PHASE_SNAPSHOT, PHASE_QUANTIZING, PHASE_WARMUP])
+        mock_save.assert_called_once()
+        mock_quantize.assert_called_once()
+        self.assertEqual(llm.status, STATUS_READY)
+
+    def test_failed_quantization_fails_the_deployment(self):
+        llm = create_llm()
+        with patch("src.app.wrapper.llm_model.AutoConfig"), \
+             patch("src.app.wrapper.llm_model.pipeline"), \
+             patch.object(llm, "_quantize", side_effect=ValueError("not on the cpu")):
+            llm.download_model()
+        self.assertEqual(llm.status, STATUS_FAILURE)
+        self.assertEqual(llm.last_error, "not on the cpu")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+import unittest
+from contextlib import contextmanager
+from unittest.mock import MagicMock, patch
+
+from src.app.wrapper.llm_model import (CANCELLED_REQUEST_TIMEOUT_S,
+                                       DEADLINE_GRACE_S, RESTART_FULL,
+                                       RESTART_SOFT, STATUS_READY,
+                                       RequestContext)
+from src.app.wrapper.llm_wrapper import LLMWrapper
+from src.app.wrapper.replica_pool import (REPLICA_DEAD, REPLICA_HEALTHY,
+                                          Replica, ReplicaError, ReplicaPool)
+
+
+class FakeLLM:
+    """answers every question with its reversed text and the pid of the answering process"""
+
+    def __init__(self, quiesce_error=None):
+        self._active_requests = []
+        self.quiesced_forks = 0
+        self.quiesce_error = quiesce_error
+
+    @contextmanager
+    def quiesced(self):
+        if self.quiesce_error is not None:
+            raise self.quiesce_error
+        self.quiesced_forks += 1
+        yield
+
+    def answer_questions(self, questions, deadlines=None):
+        if "crash" in questions:
+            os._exit(1)
+        if "sleep" in questions:
+            time.sleep(0.5)
+        if "dream" in questions:
+            # generates until the request is cancelled
+            context = RequestContext(question="dream", deadline=deadlines[0])
+            self._active_requests.append(context)
+            stopped = context.cancel_event.wait(10)
+            self._active_requests.remove(context)
+            return ["cancelled" if stopped else "dreamed"]
+        return [f"{question[::-1]}:{os.getpid()}" for question in questions]
+
+    def active_requests(self):
+        return list(self._active_requests)
+
+    def cancel_request(self, context):
+        context.cancel()
+
+
+class TestReplicaPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ReplicaPool(FakeLLM(), 2)
+
+    def tearDown(self):
+        self.pool.stop()
+
+    def test_answers_in_replica_process(self):
+        answer = self.pool.answer_questions(["abc"])[0]
+        text, pid = answer.split(":")
+        self.assertEqual(text, "cba")
+        self.assertNotEqual(int(pid), os.getpid())
+        self.assertIn(int(pid), [replica["pid"] for replica in self.pool.describe(60)])
+
+    def test_routes_to_least_loaded_replica(self):
+        pids = []
+        threads = [threading.Thread(target=lambda: pids.append(self.pool.answer_questions(["sleep"])[0].split(":")[1])) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # both replicas answered one of the concurrent batches
+        self.assertEqual(len(set(pids)), 2)
+        self.assertEqual([replica["served"] for replica in self.pool.describe(60)], [1, 1])
+
+    def test_dead_replica_is_detected_and_restarted(self):
+        with self.assertRaises(ReplicaError):
+            self.pool.answer_questions(["crash"])
+        self.assertIn(REPLICA_DEAD, [replica["health"] for replica in self.pool.describe(60)])
+        self.assertEqual(sum(replica["failures"] for replica in self.pool.describe(60)), 1)
+
+        states = self.pool.check_health(60)
+        self.assertIn(REPLICA_DEAD, states)
+        self.assertEqual([replica["health"] for replica in self.pool.describe(60)], [REPLICA_HEALTHY, REPLICA_HEALTHY])
+        self.assertEqual(sum(replica["restarts"] for replica in self.pool.describe(60)), 1)
+        self.assertTrue(self.pool.answer_questions(["abc"])[0].startswith("cba"))
+
+    def test_replica_cancels_overdue_requests(self):
+        # the deadline passed longer than the grace time ago, the watchdog of the replica cancels the request
+        self.assertEqual(self.pool.answer_questions(["dream"], deadlines=[time.time() - 60]), ["cancelled"])
+
+    def test_replicas_are_forked_from_the_quiesced_llm(self):
+        llm = FakeLLM()
+        pool = ReplicaPool(llm, 2)
+        try:
+            pool.restart_all()
+        finally:
+            pool.stop()
+        self.assertEqual(llm.quiesced_forks, 4)
+
+    def test_no_replica_is_forked_while_the_llm_generates(self):
+        with self.assertRaises(ReplicaError):
+            ReplicaPool(FakeLLM(quiesce_error=TimeoutError("1 generations did not finish")), 2)
+
+    def test_batch_deadline_bounds_the_wait_for_the_answer(self):
+        margin = DEADLINE_GRACE_S + CANCELLED_REQUEST_TIMEOUT_S
+        now = time.time()
+        self.assertAlmostEqual(self.pool._timeout([now + 10, now + 20], 2), 20 + margin, delta=1)
+        # without a deadline or a maximum runtime the replica is only checked by the health check
+        self.assertIsNone(self.pool._timeout(None, 1))
+
+        pool = ReplicaPool(FakeLLM(), 1, max_runtime_s=60)
+        try:
+            self.assertAlmostEqual(pool._timeout([now + 10, None], 2), 60 + margin, delta=1)
+        finally:
+            pool.stop()
+
+class TestReplica(unittest.TestCase):
+
+    def test_replica_which_does_not_answer_in_time_is_restarted(self):
+        replica = Replica(0, FakeLLM())
+        try:
+            pid = replica.pid
+            with self.assertRaises(ReplicaError):
+                replica.call("answer_questions", (["sleep"], None), timeout_s=0.1)
+            self.assertEqual((replica.failures, replica.restarts), (1, 1))
+            self.assertNotEqual(replica.pid, pid)
+            self.assertTrue(replica.call("answer_questions", (["abc"], None), timeout_s=5)[0].startswith("cba"))
+        finally:
+            replica.stop()
+
+
+class TestRestartWithReplicas(unittest.TestCase):
+
+    def setUp(self):
+        with patch("src.app.wrapper.llm_wrapper.LLMModel") as MockModel:
+            self.llm = MockModel.return_value
+            self.llm.status = STATUS_READY
+            self.llm.restart_count = 0
+            self.llm.restart_timings = {}
+            self.wrapper = LLMWrapper(modeltyp="text-generation", model="test-model", prompting_config={"do_sample": False}, deployment_config={})
+        self.wrapper.replicas = MagicMock()
+
+    def tearDown(self):
+        self.wrapper.shutdown_llm()
+
+    def restart(self, *tiers):
+        def restart():
+            self.llm.restart_count += 1
+            self.llm.restart_timings = {tier: 0.1 for tier in tiers}
+        self.llm.restart.side_effect = restart
+
+    def test_soft_restart_keeps_the_replicas(self):
+        self.restart(RESTART_SOFT)
+        self.wrapper.restart_llm()
+        self.llm.restart.assert_called_once()
+        self.wrapper.replicas.restart_all.assert_not_called()
+
+    def test_replicas_are_forked_again_after_a_reload(self):
+        self.restart(RESTART_SOFT, RESTART_FULL)
+        self.wrapper.restart_llm()
+        self.wrapper.replicas.restart_all.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from src.app.wrapper.llm_model import FINISH_STOP, GenerationResult
+from src.app.wrapper.llm_wrapper import LLMWrapper
+from src.app.wrapper.response_cache import (CACHE_HITS, CACHE_MISSES,
+                                            ResponseCache)
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_is_deterministic(self):
+        self.assertTrue(ResponseCache.is_deterministic({"do_sample": False, "max_new_tokens": 10}))
+        self.assertTrue(ResponseCache.is_deterministic({"temperature": 0}))
+        self.assertFalse(ResponseCache.is_deterministic({"do_sample": True, "temperature": 0.7}))
+        self.assertFalse(ResponseCache.is_deterministic({}))
+
+    def test_key_normalizes_config(self):
+        key = ResponseCache.make_key("model", {"do_sample": False, "max_new_tokens": 10}, "prompt")
+        self.assertEqual(key, ResponseCache.make_key("model", {"max_new_tokens": 10, "do_sample": False}, "prompt"))
+        self.assertNotEqual(key, ResponseCache.make_key("other", {"max_new_tokens": 10, "do_sample": False}, "prompt"))
+        self.assertNotEqual(key, ResponseCache.make_key("model", {"max_new_tokens": 11, "do_sample": False}, "prompt"))
+
+    def test_key_includes_the_deployment_args_which_change_the_answers(self):
+        prompting_config = {"do_sample": False}
+        key = ResponseCache.make_key("model", prompting_config, "prompt", {"torch_dtype": "float32"})
+        self.assertNotEqual(key, ResponseCache.make_key("model", prompting_config, "prompt", {"torch_dtype": "bfloat16"}))
+        self.assertNotEqual(key, ResponseCache.make_key("model", prompting_config, "prompt", {"torch_dtype": "float32", "revision": "v2"}))
+        self.assertNotEqual(key, ResponseCache.make_key("model", prompting_config, "prompt", {"torch_dtype": "float32", "quantization": "dynamic_int8"}))
+        # the threads or the device map do not change the answers
+        self.assertEqual(key, ResponseCache.make_key("model", prompting_config, "prompt", {"torch_dtype": "float32", "num_threads": 4}))
+
+    def test_lru(self):
+        cache = ResponseCache(max_entries=2)
+        cache.put("a", {"answer": "a"})
+        cache.put("b", {"answer": "b"})
+        self.assertEqual(cache.get("a"), {"answer": "a"})
+        cache.put("c", {"answer": "c"})
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertEqual(cache.stats(), {"entries": 2, "hits": 2, "misses": 1})
+
+    def test_hits_and_misses_are_exported(self):
+        cache = ResponseCache()
+        hits, misses = CACHE_HITS.value, CACHE_MISSES.value
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", {"answer": "a"})
+        cache.get("a")
+        cache.get("a")
+        self.assertEqual(CACHE_HITS.value, hits + 2)
+        self.assertEqual(CACHE_MISSES.value, misses + 1)
+
+    def test_ttl(self):
+        cache = ResponseCache(ttl_s=0.05)
+        cache.put("a", {"answer": "a"})
+        self.assertIsNotNone(cache.get("a"))
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("a"))
+
+    def test_disk_tier_survives_restart(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cache.sqlite")
+            cache = ResponseCache(disk_path=path)
+            cache.put("a", {"answer": "a", "completion_tokens": 1})
+            cache.close()
+
+            restarted = ResponseCache(disk_path=path)
+            self.assertEqual(restarted.get("a"), {"answer": "a", "completion_tokens": 1})
+            restarted.close()
+
+
+class TestWrapperResponseCache(unittest.TestCase):
+
+    def create_wrapper(self, prompting_config, caching_config=None):
+        with patch("src.app.wrapper.llm_wrapper.LLMModel") as MockModel:
+            llm = MockModel.return_value
+            llm.model = "test-model"
+            llm.prompting_config = prompting_config
+            llm.deployment_config = {}
+            llm.render_prompt.side_effect = lambda question: f"<|user|>{question}"
+            llm.answer_questions.side_effect = lambda questions, deadlines=None: [
+                GenerationResult(question.upper(), len(question.split()), len(question.split()), FINISH_STOP, {}) for question in questions]
+            wrapper = LLMWrapper(modeltyp="text-generation", model="test-model", prompting_config=prompting_config,
+                                 deployment_config={}, caching_config=caching_config)
+        return wrapper, llm
+
+    def test_repeated_question_is_cached(self):
+        wrapper, llm = self.create_wrapper({"do_sample": False})
+        try:
+            first = wrapper.process_prompt("hello world", measure_sci=False)
+            second = wrapper.process_prompt("hello world", measure_sci=True)
+        finally:
+            wrapper.shutdown_llm()
+
+        self.assertEqual(first["answer"], "HELLO WORLD")
+        self.assertNotIn("cached", first)
+        self.assertEqual(second["answer"], "HELLO WORLD")
+        self.assertTrue(second["cached"])
+        self.assertEqual(second["sci_score"], 0.0)
+        self.assertEqual(second["completion_tokens"], 2)
+        llm.answer_questions.assert_called_once()
+
+    def test_bulk_uses_cache(self):
+        wrapper, llm = self.create_wrapper({"do_sample": False})
+        try:
+            wrapper.process_prompt("one")
+            results = wrapper.process_prompts(["one", "two"])
+        finally:
+            wrapper.shutdown_llm()
+        self.assertTrue(results[0]["cached"])
+        self.assertEqual(results[1]["answer"], "TWO")
+        self.assertEqual(wrapper.cache.stats()["hits"], 1)
+
+    def test_sampling_config_is_not_cached(self):
+        wrapper, llm = self.create_wrapper({"do_sample": True})
+        self.assertIsNone(wrapper.cache)
+        wrapper.process_prompt("hello")
+        wrapper.process_prompt("hello")
+        wrapper.shutdown_llm()
+        self.assertEqual(llm.answer_questions.call_count, 2)
+
+    def test_cache_can_be_disabled(self):
+        wrapper, _ = self.create_wrapper({"do_sample": False}, {"enabled": False})
+        self.assertIsNone(wrapper.cache)
+        wrapper.shutdown_llm()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+import torch
+
+from src.app.wrapper.snapshot_store import SNAPSHOT_MARKER, SnapshotStore
+
+
+def mock_pipe(fail=False):
+    """mocks a pipeline whose model and tokenizer write a file when they are saved"""
+    pipe = MagicMock()
+
+    def save_model(path, safe_serialization):
+        if fail:
+            raise OSError("disk full")
+        open(os.path.join(path, "model.safetensors"), "w").close()
+
+    pipe.model.save_pretrained.side_effect = save_model
+    pipe.tokenizer.save_pretrained.side_effect = lambda path: open(os.path.join(path, "tokenizer.json"), "w").close()
+    return pipe
+
+
+class TestSnapshotStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = SnapshotStore(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_save_and_find(self):
+        deployment = {"torch_dtype": torch.bfloat16, "device_map": "auto"}
+        self.assertIsNone(self.store.find("org/model", deployment))
+
+        path = self.store.save("org/model", deployment, mock_pipe())
+        self.assertEqual(self.store.find("org/model", deployment), path)
+        self.assertEqual(set(os.listdir(path)), {"model.safetensors", "tokenizer.json", SNAPSHOT_MARKER})
+        # only the snapshot is left in the store, no temporary directories
+        self.assertEqual(os.listdir(self.directory.name), [os.path.basename(path)])
+
+    def test_key_depends_on_dtype_but_not_on_placement(self):
+        self.store.save("org/model", {"torch_dtype": torch.bfloat16}, mock_pipe())
+        self.assertIsNotNone(self.store.find("org/model", {"torch_dtype": "torch.bfloat16", "device_map": "auto"}))
+        self.assertIsNone(self.store.find("org/model", {"torch_dtype": torch.float32}))
+        self.assertIsNone(self.store.find("org/other-model", {"torch_dtype": torch.bfloat16}))
+
+    def test_failed_save_leaves_no_snapshot(self):
+        with self.assertRaises(OSError):
+            self.store.save("org/model", {}, mock_pipe(fail=True))
+        self.assertIsNone(self.store.find("org/model", {}))
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_remove(self):
+        self.store.save("org/model", {}, mock_pipe())
+        self.store.remove("org/model", {})
+        self.assertIsNone(self.store.find("org/model", {}))
+
+
+if __name__ == '__main__':
+    unittest.main()
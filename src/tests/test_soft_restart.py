@@ -0,0 +1,105 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import torch
+
+from src.app.wrapper.llm_model import (FINISH_CANCELLED, RESTART_FULL,
+                                       RESTART_SOFT, STATUS_FAILURE,
+                                       STATUS_IDLE, STATUS_READY,
+                                       GenerationResult, LLMModel)
+
+MB = 1_000_000
+
+
+def hanging_generate_batch(llm:LLMModel, started:threading.Event):
+    """mocks a generation which only ends when it is stopped by the stopping criteria"""
+
+    def generate_batch(prompts, **kwargs):
+        with llm._generation():
+            started.set()
+            input_ids = torch.zeros((1, 1), dtype=torch.long)
+            while not llm._stopping_criteria(input_ids, None).all():
+                time.sleep(0.01)
+        return [GenerationResult("", 1, 0, FINISH_CANCELLED, {})]
+
+    return generate_batch
+
+
+class TestSoftRestart(unittest.TestCase):
+
+    def setUp(self):
+        self.llm = LLMModel(modeltyp="text-generation", model="test/model", prompting_config={}, deployment_config={}, uses_chat_template=False)
+        self.started = threading.Event()
+        self.llm._pipe = MagicMock()
+        self.llm._generate_batch = hanging_generate_batch(self.llm, self.started)
+        self.llm._status = STATUS_READY
+
+    def test_soft_restart_cancels_generation_and_keeps_weights(self):
+        pipe = self.llm._pipe
+        answers = []
+        generation = threading.Thread(target=lambda: answers.append(self.llm.answer_question("hello")))
+        generation.start()
+        self.assertTrue(self.started.wait(5))
+
+        with patch.object(self.llm, "_isresponsive", return_value=True), \
+             patch.object(self.llm, "download_model") as mock_download:
+            self.llm.restart()
+        generation.join(5)
+
+        self.assertFalse(generation.is_alive())
+        self.assertEqual([answer.finish_reason for answer in answers], [FINISH_CANCELLED])
+        self.assertEqual(self.llm.status, STATUS_READY)
+        self.assertIs(self.llm._pipe, pipe)
+        mock_download.assert_not_called()
+        self.assertEqual(set(self.llm.restart_timings), {RESTART_SOFT})
+        self.assertEqual(self.llm.restart_attempt, 0)
+        self.assertEqual(self.llm.restart_count, 1)
+
+    def test_quiesced_waits_for_the_running_generations(self):
+        generation = threading.Thread(target=self.llm.answer_question, args=("hello",))
+        generation.start()
+        self.assertTrue(self.started.wait(5))
+
+        with self.assertRaises(TimeoutError):
+            with self.llm.quiesced(timeout_s=0.1):
+                pass
+        self.llm._cancel_event.set()
+        generation.join(5)
+        self.llm._cancel_event.clear()
+        with self.llm.quiesced(timeout_s=1):
+            # no new generation can start while the replicas are forked
+            self.assertFalse(self.llm._active_requests_lock.acquire(blocking=False))
+
+    def test_shutdown_compares_the_memory_of_the_model_only(self):
+        # other deployments keep 10 GB of the process, only the 200 MB of this model have to be released
+        for rss_after, status in ((10_000 * MB, STATUS_IDLE), (10_180 * MB, STATUS_FAILURE)):
+            self.llm._pipe = MagicMock()
+            rss = iter([10_200 * MB, rss_after])
+            with patch.object(self.llm, "memory_footprint", return_value=200 * MB), \
+                 patch.object(self.llm._process, "memory_info", side_effect=lambda: MagicMock(rss=next(rss))):
+                self.llm.shutdown()
+            self.assertEqual(self.llm.status, status)
+
+    def test_unresponsive_model_is_reloaded(self):
+        def download_model():
+            self.llm._status = STATUS_READY
+
+        with patch.object(self.llm, "_isresponsive", return_value=False), \
+             patch.object(self.llm, "shutdown") as mock_shutdown, \
+             patch.object(self.llm, "download_model", side_effect=download_model):
+            self.llm.restart()
+
+        mock_shutdown.assert_called_once()
+        self.assertEqual(self.llm.status, STATUS_READY)
+        self.assertEqual(set(self.llm.restart_timings), {RESTART_SOFT, RESTART_FULL})
+
+    def test_generation_which_does_not_stop_escalates(self):
+        with self.llm._generations_finished:
+            self.llm._active_generations = 1  # a generation which never checks the stopping criteria
+        self.assertFalse(self.llm._soft_restart(timeout_s=0.1))
+
+
+if __name__ == '__main__':
+    unittest.main()